@@ -1,7 +1,18 @@
 from celery import Celery
+from celery.signals import worker_process_init
+
+# records the queue wait, runtime, retries and failures of every task
+from proma.common import task_metrics  # noqa: F401
 
 app = Celery("Proma")
 
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
 app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warmup_worker_process(**kwargs):
+    from proma.common.warmup import warmup
+
+    warmup()
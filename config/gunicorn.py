@@ -0,0 +1,15 @@
+"""
+Gunicorn configuration, used with `gunicorn -c python:config.gunicorn`
+"""
+
+
+def post_fork(server, worker):
+    # the application is loaded after this hook, so django is set up here to
+    # compile the templates before the worker accepts requests
+    import django
+
+    django.setup()
+
+    from proma.common.warmup import warmup
+
+    warmup()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 import os
 
 import dj_database_url
+from celery.schedules import crontab
 from django.contrib.messages import constants as messages
 
 
@@ -148,6 +149,14 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL")
 EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "0") == "1"
 
+# messages sent over the same connection by Email.send_mass_mail and
+# attempts for each message when the connection is lost
+EMAIL_BULK_BATCH_SIZE = int(os.environ.get("EMAIL_BULK_BATCH_SIZE", 100))
+EMAIL_BULK_RETRIES = 2
+# messages per minute sent to the SMTP host by all the workers, 0 disables
+# the limit
+EMAIL_RATE_LIMIT = int(os.environ.get("EMAIL_RATE_LIMIT", 0))
+
 CRISPY_TEMPLATE_PACK = "bootstrap4"
 
 LOGIN_URL = "/login"
@@ -159,3 +168,100 @@ MESSAGE_TAGS = {messages.ERROR: "danger"}  # used to play nice with bootstrap4 s
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 
 CELERY_RESULT_BACKEND = "django-db"
+# the task name is stored with the results to apply TASK_RESULT_TTLS
+CELERY_RESULT_EXTENDED = True
+# the built-in cleanup deletes all the expired results in one statement,
+# they're purged in batches by common.purge_task_results instead
+CELERY_RESULT_EXPIRES = None
+
+# PDF renders and emails go to their own queues, a worker must consume them
+# besides the default one (make worker) or they can run in their own workers
+# so a slow SMTP server doesn't take the slots of the renders, see README.md
+CELERY_TASK_ROUTES = {
+    "invoices.render_invoice_pdf": {"queue": "pdf"},
+    "invoices.notify_open_invoice": {"queue": "email"},
+    "invoices.notify_open_invoices": {"queue": "email"},
+    "invoices.send_invoice_reminders": {"queue": "email"},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    "mark-overdue-invoices": {
+        "task": "invoices.mark_overdue_invoices",
+        "schedule": crontab(hour=0, minute=5),
+    },
+    "send-overdue-reminders": {
+        "task": "invoices.send_overdue_reminders",
+        "schedule": crontab(hour=9, minute=0),
+    },
+    "rollup-revenue": {
+        "task": "invoices.rollup_revenue",
+        "schedule": crontab(day_of_month=1, hour=0, minute=30),
+    },
+    "relay-outbox": {"task": "common.relay_outbox", "schedule": 30},
+    "purge-task-results": {
+        "task": "common.purge_task_results",
+        "schedule": crontab(minute=15),
+    },
+}
+
+# the notification tasks don't store their results, the rest are kept
+# the seconds in TASK_RESULT_TTLS or TASK_RESULT_DEFAULT_TTL
+TASK_RESULT_TTLS = {
+    "invoices.render_invoice_pdf": 24 * 60 * 60,
+    "common.purge_task_results": 24 * 60 * 60,
+}
+TASK_RESULT_DEFAULT_TTL = int(
+    os.environ.get("TASK_RESULT_DEFAULT_TTL", 7 * 24 * 60 * 60)
+)
+TASK_RESULT_PURGE_BATCH_SIZE = 1000
+
+# the views write their tasks in the outbox table, a thread of the web
+# process publishes them after the commit in batches of OUTBOX_BATCH_SIZE
+OUTBOX_RELAY_IN_THREAD = True
+OUTBOX_BATCH_SIZE = 100
+
+# counters and flags shared by all the workers (e.g. rate limits)
+SHARED_STORE = os.environ.get("SHARED_STORE", "proma.common.stores.RedisStore")
+SHARED_STORE_URL = os.environ.get("SHARED_STORE_URL", CELERY_BROKER_URL)
+
+# duplicated notifications of an invoice are dropped while one is pending
+# (up to TASK_COALESCE_TIMEOUT) and TASK_COALESCE_WINDOW seconds after it's sent
+TASK_COALESCE_WINDOW = int(os.environ.get("TASK_COALESCE_WINDOW", 60))
+TASK_COALESCE_TIMEOUT = 15 * 60
+
+# overdue invoices are reminded every INVOICE_REMINDER_INTERVAL days, each
+# reminder task sends INVOICE_REMINDER_CHUNK_SIZE invoices
+INVOICE_REMINDER_INTERVAL = int(os.environ.get("INVOICE_REMINDER_INTERVAL", 7))
+INVOICE_REMINDER_CHUNK_SIZE = 100
+
+# seconds the receivables aging report is kept in the cache
+INVOICE_AGING_CACHE_TIMEOUT = int(os.environ.get("INVOICE_AGING_CACHE_TIMEOUT", 60))
+
+PDF_CACHE_ENABLED = os.environ.get("PDF_CACHE_ENABLED", "1") == "1"
+PDF_CACHE_LOCATION = "cache/pdf"
+PDF_CACHE_MAX_SIZE = int(os.environ.get("PDF_CACHE_MAX_SIZE", 100 * 1024 * 1024))
+PDF_CACHE_EVICTION_INTERVAL = 60  # seconds
+
+# proma.common.backends.ReportLabBackend draws the documents with reportlab
+# instead of converting their html templates
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "proma.common.backends.HTMLBackend")
+
+# proma.common.renderers.PooledRenderer keeps a pool of wkhtmltopdf processes
+# alive instead of starting one for each document
+PDF_RENDERER = os.environ.get("PDF_RENDERER", "proma.common.renderers.PDFKitRenderer")
+PDF_RENDERER_POOL_SIZE = int(os.environ.get("PDF_RENDERER_POOL_SIZE", 2))
+PDF_RENDERER_POOL_TIMEOUT = 30  # seconds
+PDF_RENDERER_POOL_MAX_RENDERS = 100
+
+# processes used to render the invoices of a zip export, 0 renders them in
+# the web worker
+PDF_EXPORT_WORKERS = int(os.environ.get("PDF_EXPORT_WORKERS", 2))
+
+# render the invoice PDF downloads in celery when they are not cached, the
+# browser waits in a page that polls until the file is ready
+PDF_ASYNC_DOWNLOADS = os.environ.get("PDF_ASYNC_DOWNLOADS", "0") == "1"
+PDF_ASYNC_POLL_INTERVAL = 2  # seconds
+
+# receives the timings and sizes measured by proma.common.metrics.StageTimer,
+# they're written in the proma.common.metrics log as well
+METRICS_BACKEND = os.environ.get("METRICS_BACKEND", "proma.common.metrics.NullMetrics")
@@ -3,3 +3,6 @@ from .base import *  # NOQA
 DEBUG = True
 
 CELERY_TASK_ALWAYS_EAGER = True
+
+SHARED_STORE = "proma.common.stores.CacheStore"
+OUTBOX_RELAY_IN_THREAD = False
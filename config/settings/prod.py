@@ -6,6 +6,19 @@ INSTALLED_APPS += ["raven.contrib.django.raven_compat"]  # NOQA
 
 RAVEN_CONFIG = {"dsn": os.environ.get("DSN_URL")}  # NOQA
 
+# templates are compiled once per process, proma.common.warmup fills the
+# cache when the workers start
+TEMPLATES[0]["APP_DIRS"] = False  # NOQA
+TEMPLATES[0]["OPTIONS"]["loaders"] = [  # NOQA
+    (
+        "django.template.loaders.cached.Loader",
+        [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ],
+    )
+]
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": True,
@@ -40,6 +53,11 @@ LOGGING = {
             "handlers": ["console"],
             "propagate": False,
         },
+        "proma.common.metrics": {
+            "level": "INFO",
+            "handlers": ["console"],
+            "propagate": False,
+        },
         "proma.invoices.tasks": {
             "level": "WARNING",
             "handlers": ["console", "sentry"],
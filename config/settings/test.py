@@ -1,3 +1,6 @@
 from .base import *  # NOQA
 
 CELERY_TASK_ALWAYS_EAGER = True
+
+SHARED_STORE = "proma.common.stores.CacheStore"
+OUTBOX_RELAY_IN_THREAD = False
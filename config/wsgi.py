@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/2.0/howto/deployment/wsgi/
 """
 
 import os
+import sys
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "proma.settings")
 
 application = get_wsgi_application()
+
+# gunicorn warms up every worker in its post_fork hook (config/gunicorn.py),
+# other servers do it when they load the application
+if "gunicorn" not in sys.modules:
+    from proma.common.warmup import warmup
+
+    warmup()
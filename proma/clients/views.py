@@ -44,3 +44,10 @@ class ClientDetailView(LoginRequiredMixin, DetailView):
     model = Client
     context_object_name = "client"
     pk_url_kwarg = "id"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            {"invoices": self.object.invoices.non_draft().order_by("number")}
+        )
+        return context
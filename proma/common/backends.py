@@ -0,0 +1,60 @@
+import io
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .renderers import get_renderer
+
+
+class HTMLBackend:
+    """
+    Render the report template into html and convert it using the renderer
+    defined in PDF_RENDERER
+    """
+
+    def render(self, report):
+        html = report.render_html()
+        with report.stage("convert"):
+            return get_renderer().render(html, report.options)
+
+
+class ReportLabBackend:
+    """
+    Draw the report directly with reportlab, the reports must implement
+    get_flowables(styles, width) returning the platypus flowables of the
+    document, width is the space available between the margins
+    """
+
+    margin = 0.75
+
+    def render(self, report):
+        # reportlab is an optional dependency only needed by this backend
+        from reportlab.lib.pagesizes import LETTER
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate
+
+        buffer = io.BytesIO()
+        document = SimpleDocTemplate(
+            buffer,
+            pagesize=LETTER,
+            topMargin=self.margin * inch,
+            rightMargin=self.margin * inch,
+            bottomMargin=self.margin * inch,
+            leftMargin=self.margin * inch,
+        )
+        with report.stage("context"):
+            flowables = report.get_flowables(getSampleStyleSheet(), document.width)
+        with report.stage("convert"):
+            document.build(flowables)
+        return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return load_backend(settings.PDF_BACKEND)
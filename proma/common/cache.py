@@ -0,0 +1,121 @@
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+class PDFCache:
+    """
+    Store rendered PDF files in the media storage.
+
+    Files are grouped by a namespace (e.g. the invoice they belong to) and
+    named after a hash of the state used to render them, so a changed
+    document never matches a stale file. When the cache grows over
+    PDF_CACHE_MAX_SIZE the least recently used files are removed.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or default_storage
+        self._last_eviction = None
+
+    @property
+    def enabled(self):
+        return settings.PDF_CACHE_ENABLED
+
+    @property
+    def location(self):
+        return settings.PDF_CACHE_LOCATION
+
+    def get(self, namespace, key):
+        if not self.enabled:
+            return None
+        name = self._get_name(namespace, key)
+        if not self.storage.exists(name):
+            return None
+        with self.storage.open(name, "rb") as f:
+            content = f.read()
+        self._touch(name)
+        return content
+
+    def set(self, namespace, key, content):
+        if not self.enabled:
+            return
+        name = self._get_name(namespace, key)
+        if self.storage.exists(name):
+            self.storage.delete(name)
+        self.storage.save(name, ContentFile(content))
+        self._maybe_evict()
+
+    def invalidate(self, namespace):
+        """
+        Remove all the files stored for the given namespace
+        """
+        path = posixpath.join(self.location, namespace)
+        if not self.storage.exists(path):
+            return
+        _, files = self.storage.listdir(path)
+        for filename in files:
+            self.storage.delete(posixpath.join(path, filename))
+
+    def evict(self, max_size=None):
+        """
+        Remove the least recently used files until the cache size is under
+        max_size bytes, return the number of removed files
+        """
+        if max_size is None:
+            max_size = settings.PDF_CACHE_MAX_SIZE
+        entries = list(self._get_entries())
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for name, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total_size <= max_size:
+                break
+            self.storage.delete(name)
+            total_size -= size
+            removed += 1
+        return removed
+
+    def _maybe_evict(self):
+        # listing the whole cache on every write is expensive, so eviction
+        # only runs once per interval in each process
+        now = time.monotonic()
+        interval = settings.PDF_CACHE_EVICTION_INTERVAL
+        if self._last_eviction is not None and now - self._last_eviction < interval:
+            return
+        self._last_eviction = now
+        self.evict()
+
+    def _get_entries(self):
+        if not self.storage.exists(self.location):
+            return
+        namespaces, _ = self.storage.listdir(self.location)
+        for namespace in namespaces:
+            path = posixpath.join(self.location, namespace)
+            _, files = self.storage.listdir(path)
+            for filename in files:
+                name = posixpath.join(path, filename)
+                yield name, self.storage.size(name), self._get_last_access(name)
+
+    def _get_name(self, namespace, key):
+        return posixpath.join(self.location, namespace, f"{key}.pdf")
+
+    def _get_last_access(self, name):
+        try:
+            return self.storage.get_accessed_time(name)
+        except NotImplementedError:
+            return self.storage.get_modified_time(name)
+
+    def _touch(self, name):
+        # only local storages allow to update the access time, remote ones
+        # will fall back to the creation time
+        try:
+            path = self.storage.path(name)
+        except NotImplementedError:
+            return
+        os.utime(path)
+
+
+pdf_cache = PDFCache()
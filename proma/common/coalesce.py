@@ -0,0 +1,37 @@
+from django.conf import settings
+
+from .stores import get_store
+
+
+def _get_key(name, key):
+    return f"coalesce:{name}:{key}"
+
+
+def acquire(name, key):
+    """
+    Mark the task `name` for `key` as pending, return False when the same
+    task is already pending or it finished less than TASK_COALESCE_WINDOW
+    seconds ago, so the duplicate must not be enqueued
+    """
+    return get_store().add(
+        _get_key(name, key), "pending", settings.TASK_COALESCE_TIMEOUT
+    )
+
+
+def is_pending(name, key):
+    """
+    Return whether the task `name` for `key` is pending or finished less
+    than TASK_COALESCE_WINDOW seconds ago, without marking it
+    """
+    return get_store().get(_get_key(name, key)) is not None
+
+
+def release(name, key, done=True):
+    """
+    Keep the task as done during the coalescing window, a failed task is
+    released right away so it can be enqueued again
+    """
+    if done:
+        get_store().set(_get_key(name, key), "done", settings.TASK_COALESCE_WINDOW)
+    else:
+        get_store().delete(_get_key(name, key))
@@ -0,0 +1,114 @@
+import re
+from functools import lru_cache
+
+from django.template import loader
+
+
+CLASS_ATTRIBUTE_RE = re.compile(r"""class=["']([^"']*)["']""")
+TAG_RE = re.compile(r"<([a-zA-Z][a-zA-Z0-9]*)")
+TEMPLATE_CODE_RE = re.compile(r"{%.*?%}|{{.*?}}", re.DOTALL)
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+PARENTHESES_RE = re.compile(r"\([^)]*\)")
+COMBINATOR_RE = re.compile(r"\s*[>+~]\s*|\s+")
+SELECTOR_TAG_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9-]*")
+SELECTOR_CLASS_RE = re.compile(r"\.([a-zA-Z0-9_-]+)")
+
+# these rules apply to every document
+ALWAYS_USED_TAGS = {"html", "body"}
+# at-rules with nested rules that are filtered as well
+NESTED_AT_RULES = ("@media", "@supports")
+# at-rules without selectors that are kept as they are
+KEPT_AT_RULES = ("@page", "@font-face")
+
+
+def get_used_selectors(template_names):
+    """
+    Return the class names and html tags used by the given templates
+    """
+    classes, tags = set(), set(ALWAYS_USED_TAGS)
+    for template_name in template_names:
+        source = loader.get_template(template_name).template.source
+        for value in CLASS_ATTRIBUTE_RE.findall(source):
+            classes.update(TEMPLATE_CODE_RE.sub(" ", value).split())
+        tags.update(tag.lower() for tag in TAG_RE.findall(source))
+    return classes, tags
+
+
+def _split_blocks(css):
+    """
+    Yield (prelude, body) for every top level block of the stylesheet,
+    at-rules without a block like @charset are ignored
+    """
+    depth = 0
+    start = 0
+    prelude = None
+    quote = None
+    for index, char in enumerate(css):
+        if quote:
+            if char == quote and css[index - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                prelude = css[start:index].strip()
+                start = index + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                yield prelude, css[start:index]
+                start = index + 1
+        elif char == ";" and depth == 0:
+            start = index + 1
+
+
+def _selector_is_used(selector, classes, tags):
+    selector = PARENTHESES_RE.sub("", selector)
+    for compound in COMBINATOR_RE.split(selector.strip()):
+        if not compound or compound.startswith(("*", ":", "[")):
+            continue
+        if "#" in compound:
+            return False
+        tag = SELECTOR_TAG_RE.match(compound)
+        if tag and tag.group(0).lower() not in tags:
+            return False
+        if not set(SELECTOR_CLASS_RE.findall(compound)) <= classes:
+            return False
+    return True
+
+
+def minify_stylesheet(css, classes, tags):
+    """
+    Remove the rules that don't match any of the given class names and html
+    tags, a rule is kept when all the classes and tags of one of its
+    selectors are used
+    """
+    rules = []
+    for prelude, body in _split_blocks(COMMENT_RE.sub("", css)):
+        if prelude.startswith(NESTED_AT_RULES):
+            nested = minify_stylesheet(body, classes, tags)
+            if nested:
+                rules.append(f"{prelude}{{{nested}}}")
+        elif prelude.startswith(KEPT_AT_RULES):
+            rules.append(f"{prelude}{{{body}}}")
+        elif not prelude.startswith("@"):
+            selectors = [
+                selector
+                for selector in prelude.split(",")
+                if _selector_is_used(selector, classes, tags)
+            ]
+            if selectors:
+                rules.append(f"{','.join(selectors)}{{{body}}}")
+    return "".join(rules)
+
+
+@lru_cache(maxsize=None)
+def get_minified_stylesheet(path, template_names):
+    """
+    Return the rules of the stylesheet used by the templates, the result is
+    computed once per process
+    """
+    classes, tags = get_used_selectors(template_names)
+    with open(path) as f:
+        return minify_stylesheet(f.read(), classes, tags)
@@ -0,0 +1,6 @@
+class PDFRenderError(Exception):
+    pass
+
+
+class PDFRenderTimeout(PDFRenderError):
+    pass
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from proma.common.utils import Email
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Compare the messages/sec of a connection per email against Email.send_mass_mail, "
+        "the messages are really sent with the EMAIL_* settings, use a local SMTP server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("to", help="Recipient of the messages")
+        parser.add_argument("--messages", type=int, default=100)
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.EMAIL_BULK_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        messages = [
+            {
+                "subject": f"Proma benchmark {index}",
+                "body": "Benchmark message",
+                "to": [options["to"]],
+                "plain": True,
+            }
+            for index in range(options["messages"])
+        ]
+
+        start = time.perf_counter()
+        for kwargs in messages:
+            Email.send_mail(**kwargs)
+        self.report("send_mail", len(messages), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        sent, failed = Email.send_mass_mail(messages, batch_size=options["batch_size"])
+        self.report("send_mass_mail", sent, time.perf_counter() - start)
+        if failed:
+            self.stderr.write(f"{len(failed)} messages failed")
+
+    def report(self, name, sent, elapsed):
+        self.stdout.write(
+            f"{name}: {sent} messages in {elapsed:.2f}s, {sent / elapsed:.1f} messages/sec"
+        )
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from kombu.exceptions import ChannelError
+
+from config.celery import app
+
+
+class Command(BaseCommand):
+
+    help = "Print the number of messages waiting in every Celery queue of the broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queues",
+            nargs="*",
+            help="Queues to check, all the routed queues by default",
+        )
+
+    def get_queues(self):
+        queues = {app.conf.task_default_queue}
+        queues.update(route["queue"] for route in settings.CELERY_TASK_ROUTES.values())
+        return sorted(queues)
+
+    def handle(self, *args, **options):
+        queues = options["queues"] or self.get_queues()
+        with app.connection_for_read() as connection:
+            if connection.transport.driver_type == "redis":
+                self.write_redis_depths(connection, queues)
+                return
+            for queue in queues:
+                channel = connection.channel()
+                try:
+                    _, depth, consumers = channel.queue_declare(
+                        queue=queue, passive=True
+                    )
+                except ChannelError:
+                    self.stdout.write(f"{queue}: not declared")
+                    continue
+                finally:
+                    channel.close()
+                self.stdout.write(f"{queue}: {depth} messages, {consumers} consumers")
+
+    def write_redis_depths(self, connection, queues):
+        # a redis queue is a list that only exists while it has messages, and
+        # the consumers aren't known
+        channel = connection.channel()
+        try:
+            for queue in queues:
+                self.stdout.write(f"{queue}: {channel.client.llen(queue)} messages")
+        finally:
+            channel.close()
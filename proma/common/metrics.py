@@ -0,0 +1,85 @@
+import logging
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class NullMetrics:
+    """
+    Discard the metrics, the backend defined in METRICS_BACKEND must
+    implement the same methods to send them to a monitoring service
+    """
+
+    def timing(self, name, seconds, tags):
+        pass
+
+    def gauge(self, name, value, tags):
+        pass
+
+    def increment(self, name, value, tags):
+        pass
+
+
+@lru_cache(maxsize=None)
+def load_metrics(path):
+    return import_string(path)()
+
+
+def get_metrics():
+    return load_metrics(settings.METRICS_BACKEND)
+
+
+class StageTimer:
+    """
+    Measure the time spent in each stage of an operation and the size of
+    what it produced. finish() sends every stage to the metrics backend as
+    `{name}.{stage}` and writes a single log record with all of them.
+    """
+
+    def __init__(self, name, **tags):
+        self.name = name
+        self.tags = tags
+        self.stages = {}
+        self.sizes = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0) + elapsed
+
+    def add_size(self, name, size):
+        self.sizes[name] = self.sizes.get(name, 0) + size
+
+    def finish(self):
+        metrics = get_metrics()
+        for stage, seconds in self.stages.items():
+            metrics.timing(f"{self.name}.{stage}", seconds, self.tags)
+        for name, size in self.sizes.items():
+            metrics.gauge(f"{self.name}.{name}_bytes", size, self.tags)
+        # key=value pairs, the same values go in `extra` for json formatters
+        fields = [f"{key}={value}" for key, value in self.tags.items()]
+        fields += [
+            f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.stages.items()
+        ]
+        fields += [f"{name}_bytes={size}" for name, size in self.sizes.items()]
+        logger.info(
+            "%s %s",
+            self.name,
+            " ".join(fields),
+            extra={
+                "metric": self.name,
+                "tags": self.tags,
+                "stages": self.stages,
+                "sizes": self.sizes,
+            },
+        )
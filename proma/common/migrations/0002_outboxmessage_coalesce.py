@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='coalesce',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class OutboxMessage(models.Model):
+    """
+    Celery task stored in the same transaction of the changes it depends
+    on, proma.common.outbox publishes it once the transaction is committed
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    signature = models.JSONField()
+    # [name, key] of proma.common.coalesce, the message is dropped when the
+    # same task is already pending
+    coalesce = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.signature.get('task')} ({self.created})"
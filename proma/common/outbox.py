@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+
+from celery import signature
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from config.celery import app
+
+from . import coalesce
+from .metrics import get_metrics
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+_relay_thread = None
+_relay_lock = threading.Lock()
+
+
+def enqueue(task_signature, coalesce_key=None):
+    """
+    Write the task in the outbox, it's published after the current
+    transaction is committed and never if it's rolled back, so the views
+    don't wait for the broker and the tasks never see uncommitted data.
+    With coalesce_key, a (name, key) pair, the task is marked as pending
+    when it's published and dropped if it already was
+    """
+    OutboxMessage.objects.create(
+        signature=dict(task_signature),
+        coalesce=list(coalesce_key) if coalesce_key else None,
+    )
+    transaction.on_commit(_wake_relay)
+
+
+def relay(batch_size=None):
+    """
+    Publish the pending messages in batches, oldest first, and return the
+    number of published messages. A batch is deleted in the same
+    transaction it's read with, so a failed publish leaves the whole batch
+    pending to be published again.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    published = 0
+    while True:
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True).order_by(
+                    "id"
+                )[:batch_size]
+            )
+            if not messages:
+                break
+            _publish(messages)
+            OutboxMessage.objects.filter(
+                id__in=[message.id for message in messages]
+            ).delete()
+        lag = (timezone.now() - messages[0].created).total_seconds()
+        get_metrics().timing("outbox.lag", lag, {})
+        published += len(messages)
+    if published:
+        logger.info("%d outbox messages published", published)
+    return published
+
+
+def _publish(messages):
+    acquired = []
+    try:
+        for message in messages:
+            if message.coalesce:
+                if not coalesce.acquire(*message.coalesce):
+                    logger.info("Duplicated task %s dropped", message)
+                    continue
+                acquired.append(message.coalesce)
+            signature(message.signature, app=app).apply_async()
+    except Exception:
+        # the batch is published again, the tasks mustn't be seen as pending
+        for name, key in acquired:
+            coalesce.release(name, key, done=False)
+        raise
+
+
+class RelayThread(threading.Thread):
+    """
+    Publish the outbox in background every time a transaction with new
+    messages is committed
+    """
+
+    daemon = True
+
+    def __init__(self):
+        super().__init__(name="outbox-relay")
+        self.pid = os.getpid()
+        self.pending = threading.Event()
+
+    def run(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            close_old_connections()
+            try:
+                relay()
+            except Exception:
+                # the messages are published by the next relay
+                logger.exception("Error publishing the outbox")
+            finally:
+                close_old_connections()
+
+
+def _get_relay_thread():
+    global _relay_thread
+    with _relay_lock:
+        # threads don't survive a fork, e.g. a new gunicorn worker
+        if _relay_thread is None or _relay_thread.pid != os.getpid():
+            _relay_thread = RelayThread()
+            _relay_thread.start()
+        return _relay_thread
+
+
+def _wake_relay():
+    if settings.OUTBOX_RELAY_IN_THREAD:
+        _get_relay_thread().pending.set()
+    else:
+        relay()
@@ -0,0 +1,21 @@
+import time
+
+from .stores import get_store
+
+
+def wait_for_slot(key, limit, period=60):
+    """
+    Block until there is room for one more operation in the current window
+    of `period` seconds, at most `limit` operations per window are allowed
+    for the key. The counters are kept in the shared store, so the limit
+    applies to all the workers. A falsy limit disables the check.
+    """
+    if not limit:
+        return
+    store = get_store()
+    while True:
+        now = time.time()
+        window = int(now // period)
+        if store.incr(f"ratelimit:{key}:{window}", timeout=period) <= limit:
+            return
+        time.sleep(period - now % period)
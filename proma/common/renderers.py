@@ -0,0 +1,245 @@
+import atexit
+import os
+import queue
+import select
+import subprocess
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+import pdfkit
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .exceptions import PDFRenderError, PDFRenderTimeout
+
+
+class PDFKitRenderer:
+    """
+    Fork a new wkhtmltopdf process for every document
+    """
+
+    def render(self, content, options):
+        return pdfkit.from_string(content, False, options=options)
+
+
+def quote_arg(arg):
+    """
+    Quote an argument of a --read-args-from-stdin line, wkhtmltopdf splits
+    the line on the spaces out of double quotes and drops the backslash
+    before an escaped character
+    """
+    if "\n" in arg or "\r" in arg:
+        raise PDFRenderError("The renderer arguments can't contain line breaks")
+    return '"%s"' % arg.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class RendererWorker:
+    """
+    A long-lived wkhtmltopdf process started with --read-args-from-stdin.
+
+    Every line written to its stdin is a full conversion (options, input
+    and output files), the process keeps the Qt application alive between
+    conversions and prints "Done" in stderr after each one.
+    """
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(
+            [*command, "--read-args-from-stdin"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self.pid = os.getpid()
+        self.renders = 0
+        self._stderr = b""
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def render(self, content, options, timeout):
+        with tempfile.TemporaryDirectory(prefix="proma-pdf-") as path:
+            source = os.path.join(path, "source.html")
+            output = os.path.join(path, "output.pdf")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(content)
+            args = [*self._get_option_args(options), source, output]
+            try:
+                line = " ".join(quote_arg(arg) for arg in args)
+                self.process.stdin.write(line.encode() + b"\n")
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                raise PDFRenderError("The renderer process is not running")
+            self._wait_until_done(timeout)
+            self.renders += 1
+            with open(output, "rb") as f:
+                return f.read()
+
+    def detach(self):
+        """
+        Drop the pipes of a worker inherited from the parent process, it
+        keeps running for the parent
+        """
+        self.process.stdin.close()
+        self.process.stderr.close()
+
+    def close(self):
+        if not self.alive:
+            return
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def _wait_until_done(self, timeout):
+        deadline = time.monotonic() + timeout
+        stderr = self.process.stderr
+        while True:
+            # wkhtmltopdf uses \r to redraw its progress bar
+            output = b"\n" + self._stderr.replace(b"\r", b"\n")
+            _, done, rest = output.partition(b"\nDone\n")
+            if done:
+                self._stderr = rest
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.process.kill()
+                raise PDFRenderTimeout(f"The document took more than {timeout}s")
+            ready, _, _ = select.select([stderr], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(stderr.fileno(), 4096)
+            if not chunk:
+                raise PDFRenderError(
+                    "The renderer process exited: %s"
+                    % self._stderr.decode(errors="replace")
+                )
+            self._stderr += chunk
+
+    def _get_option_args(self, options):
+        args = []
+        for key, value in options.items():
+            # the worker relies on the progress output to know when a
+            # document is ready
+            if key == "quiet":
+                continue
+            args.append(f"--{key}")
+            if value:
+                args.append(str(value))
+        return args
+
+
+class RendererPool:
+    """
+    Bounded set of RendererWorker processes, workers are started on demand,
+    reused between renders and recycled after max_renders documents
+    """
+
+    def __init__(self, command, size, timeout, max_renders):
+        self.command = command
+        self.size = size
+        self.timeout = timeout
+        self.max_renders = max_renders
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        # a forked process (e.g. a new gunicorn worker or an export process)
+        # can't drive the workers of its parent, they aren't its children
+        # and their pipes are shared with the parent
+        if self.pid == os.getpid():
+            return
+        while True:
+            try:
+                self._idle.get_nowait().detach()
+            except queue.Empty:
+                break
+        self._reset()
+
+    def render(self, content, options):
+        worker = self.acquire()
+        try:
+            return worker.render(content, options, self.timeout)
+        finally:
+            self.release(worker)
+
+    def acquire(self):
+        self._check_pid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._workers < self.size:
+                self._workers += 1
+                try:
+                    return RendererWorker(self.command)
+                except Exception:
+                    self._workers -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PDFRenderTimeout(f"No renderer was available after {self.timeout}s")
+
+    def release(self, worker):
+        if worker.pid != os.getpid():
+            worker.detach()
+            return
+        self._check_pid()
+        if worker.alive and worker.renders < self.max_renders:
+            self._idle.put(worker)
+            return
+        worker.close()
+        with self._lock:
+            self._workers -= 1
+
+    def close(self):
+        self._check_pid()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+            with self._lock:
+                self._workers -= 1
+
+
+class PooledRenderer:
+    """
+    Render documents using a pool of long-lived wkhtmltopdf processes, it's
+    configured with the PDF_RENDERER_POOL_* settings
+    """
+
+    def __init__(self, command=None):
+        if command is None:
+            command = [os.fsdecode(pdfkit.configuration().wkhtmltopdf)]
+        self.pool = RendererPool(
+            command,
+            size=settings.PDF_RENDERER_POOL_SIZE,
+            timeout=settings.PDF_RENDERER_POOL_TIMEOUT,
+            max_renders=settings.PDF_RENDERER_POOL_MAX_RENDERS,
+        )
+        atexit.register(self.pool.close)
+
+    def render(self, content, options):
+        return self.pool.render(content, options)
+
+
+@lru_cache(maxsize=None)
+def load_renderer(path):
+    return import_string(path)()
+
+
+def get_renderer():
+    return load_renderer(settings.PDF_RENDERER)
@@ -0,0 +1,71 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from .metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += TaskResult.objects.filter(id__in=ids).delete()[0]
+
+
+def purge_task_results(batch_size=None, now=None):
+    """
+    Delete the task results older than the TTL of their task in
+    TASK_RESULT_TTLS, or TASK_RESULT_DEFAULT_TTL, and return the number of
+    deleted rows. The rows are deleted in batches of batch_size so the
+    table is never locked for long.
+    """
+    batch_size = batch_size or settings.TASK_RESULT_PURGE_BATCH_SIZE
+    now = now or timezone.now()
+    ttls = settings.TASK_RESULT_TTLS
+    deleted = 0
+    for task_name, ttl in ttls.items():
+        deleted += _delete_in_batches(
+            TaskResult.objects.filter(
+                task_name=task_name, date_done__lt=now - timedelta(seconds=ttl)
+            ),
+            batch_size,
+        )
+    # the results stored before CELERY_RESULT_EXTENDED have no task name
+    deleted += _delete_in_batches(
+        TaskResult.objects.exclude(task_name__in=ttls).filter(
+            date_done__lt=now - timedelta(seconds=settings.TASK_RESULT_DEFAULT_TTL)
+        ),
+        batch_size,
+    )
+    if deleted:
+        logger.info("%d task results deleted", deleted)
+    return deleted
+
+
+def get_table_size():
+    """
+    Return the space used by the task results table and its indexes in
+    bytes, None when the database can't tell it
+    """
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_total_relation_size(%s)", [TaskResult._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def send_table_metrics():
+    metrics = get_metrics()
+    metrics.gauge("task_results.rows", TaskResult.objects.count(), {})
+    size = get_table_size()
+    if size is not None:
+        metrics.gauge("task_results.table_bytes", size, {})
@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+
+class RedisStore:
+    """
+    Keep short-lived counters and flags in redis, shared by all the web and
+    celery workers, the url defaults to the celery broker
+    """
+
+    def __init__(self, url=None):
+        self.client = redis.Redis.from_url(url or settings.SHARED_STORE_URL)
+
+    def add(self, key, value, timeout):
+        """
+        Set the key only if it doesn't exist, return True when it was set
+        """
+        return bool(self.client.set(key, value, nx=True, ex=timeout))
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, timeout):
+        self.client.set(key, value, ex=timeout)
+
+    def incr(self, key, timeout):
+        """
+        Increment the counter and return its value, the counter expires
+        `timeout` seconds after the last increment
+        """
+        pipeline = self.client.pipeline()
+        pipeline.incr(key)
+        pipeline.expire(key, timeout)
+        value, _ = pipeline.execute()
+        return value
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class CacheStore:
+    """
+    Same interface of RedisStore using the django cache, only shared between
+    processes when the cache backend is
+    """
+
+    def add(self, key, value, timeout):
+        return cache.add(key, value, timeout)
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout)
+
+    def incr(self, key, timeout):
+        if cache.add(key, 1, timeout):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # expired between both calls
+            cache.add(key, 1, timeout)
+            return 1
+
+    def delete(self, key):
+        cache.delete(key)
+
+
+@lru_cache(maxsize=None)
+def load_store(path):
+    return import_string(path)()
+
+
+def get_store():
+    return load_store(settings.SHARED_STORE)
@@ -0,0 +1,61 @@
+import logging
+import time
+
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+)
+
+from .metrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+# perf_counter() of the tasks running in this process by task id
+_started = {}
+
+
+def get_tags(task, request=None):
+    request = request or task.request
+    delivery_info = request.delivery_info or {}
+    return {"task": task.name, "queue": delivery_info.get("routing_key") or "eager"}
+
+
+@before_task_publish.connect
+def record_enqueue_time(headers=None, **kwargs):
+    # wall clock, the task may start in another host
+    headers["enqueued_at"] = time.time()
+
+
+@task_prerun.connect
+def record_start_time(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    # the headers that aren't celery's own are kept apart in the request
+    enqueued_at = (task.request.headers or {}).get("enqueued_at")
+    if enqueued_at is not None:
+        wait = max(time.time() - enqueued_at, 0)
+        get_metrics().timing("celery.task.queue_wait", wait, get_tags(task))
+
+
+@task_postrun.connect
+def record_runtime(task_id=None, task=None, state=None, **kwargs):
+    start = _started.pop(task_id, None)
+    if start is None:
+        return
+    tags = dict(get_tags(task), state=state)
+    get_metrics().timing("celery.task.runtime", time.perf_counter() - start, tags)
+
+
+@task_retry.connect
+def record_retry(sender=None, request=None, reason=None, **kwargs):
+    tags = dict(get_tags(sender, request), reason=type(reason).__name__)
+    get_metrics().increment("celery.task.retries", 1, tags)
+
+
+@task_failure.connect
+def record_failure(sender=None, exception=None, **kwargs):
+    tags = dict(get_tags(sender), reason=type(exception).__name__)
+    get_metrics().increment("celery.task.failures", 1, tags)
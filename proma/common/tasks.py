@@ -0,0 +1,31 @@
+from config.celery import app
+
+from . import coalesce, outbox, results
+
+
+@app.task(name="common.release_coalesced", ignore_result=True)
+def release_coalesced(name, key):
+    """
+    Error callback of the coalesced tasks, or the last stage of the ones
+    that are not kept as done, so they can be enqueued again
+    """
+    coalesce.release(name, key, done=False)
+
+
+@app.task(name="common.relay_outbox", ignore_result=True)
+def relay_outbox():
+    """
+    Publish the messages left in the outbox when a web process stopped
+    before relaying them
+    """
+    return outbox.relay()
+
+
+@app.task(name="common.purge_task_results")
+def purge_task_results():
+    """
+    Delete the expired task results and report the size of their table
+    """
+    deleted = results.purge_task_results()
+    results.send_table_metrics()
+    return deleted
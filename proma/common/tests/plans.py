@@ -0,0 +1,41 @@
+import re
+import unittest
+
+from django.db import connection
+
+
+def get_plan(queryset):
+    """
+    Return the EXPLAIN output of the queryset, PostgreSQL is told to avoid
+    the sequential scans so a small test table doesn't hide a missing index
+    """
+    if connection.vendor == "sqlite":
+        return queryset.explain()
+    if connection.vendor != "postgresql":
+        raise unittest.SkipTest(f"Query plans aren't checked on {connection.vendor}")
+    with connection.cursor() as cursor:
+        cursor.execute("SET enable_seqscan = off")
+        try:
+            return queryset.explain()
+        finally:
+            cursor.execute("RESET enable_seqscan")
+
+
+def get_sequential_scans(plan, table):
+    """
+    Return the lines of the plan that read the whole table without an index
+    """
+    if connection.vendor == "postgresql":
+        pattern = rf"\bSeq Scan on {table}\b"
+    else:
+        # "SCAN <table>" without "USING [COVERING] INDEX"
+        pattern = rf"\bSCAN (TABLE )?{table}\b(?!.*\bUSING\b)"
+    return [line for line in plan.splitlines() if re.search(pattern, line)]
+
+
+class QueryPlanMixin:
+    def assertUsesIndex(self, queryset, table=None):
+        table = table or queryset.model._meta.db_table
+        plan = get_plan(queryset)
+        scans = get_sequential_scans(plan, table)
+        self.assertFalse(scans, f"Sequential scan on {table}:\n{plan}")
@@ -0,0 +1,78 @@
+import socketserver
+import threading
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 localhost")
+        messages = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("MAIL"):
+                self.reply("250 OK")
+            elif command.startswith("RCPT"):
+                if any(recipient in command for recipient in server.refused):
+                    self.reply("550 Mailbox unavailable")
+                else:
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data in iter(self.rfile.readline, b".\r\n"):
+                    lines.append(data)
+                server.messages.append(b"".join(lines))
+                self.reply("250 OK")
+                messages += 1
+                if messages == server.drop_after:
+                    # close the socket without answering the next command
+                    return
+            elif command == "RSET" or command == "NOOP":
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal SMTP server that keeps the received messages in memory.
+
+    Connections are dropped after `drop_after` messages and the recipients
+    listed in `refused` are rejected.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after=None, refused=()):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.drop_after = drop_after
+        self.refused = [recipient.upper() for recipient in refused]
+        self.connections = 0
+        self.messages = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,57 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from ..cache import PDFCache
+
+
+class PDFCacheTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.cache = PDFCache()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_get_missing_key(self):
+        self.assertIsNone(self.cache.get("invoice-1", "abc"))
+
+    def test_set_and_get(self):
+        self.cache.set("invoice-1", "abc", b"content")
+        self.assertEqual(self.cache.get("invoice-1", "abc"), b"content")
+
+    def test_set_overwrites_existing_key(self):
+        self.cache.set("invoice-1", "abc", b"content")
+        self.cache.set("invoice-1", "abc", b"new content")
+        self.assertEqual(self.cache.get("invoice-1", "abc"), b"new content")
+
+    @override_settings(PDF_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.cache.set("invoice-1", "abc", b"content")
+        self.assertIsNone(self.cache.get("invoice-1", "abc"))
+
+    def test_invalidate(self):
+        self.cache.set("invoice-1", "abc", b"content")
+        self.cache.set("invoice-2", "abc", b"content")
+        self.cache.invalidate("invoice-1")
+        self.assertIsNone(self.cache.get("invoice-1", "abc"))
+        self.assertEqual(self.cache.get("invoice-2", "abc"), b"content")
+
+    def test_invalidate_missing_namespace(self):
+        self.cache.invalidate("invoice-1")
+
+    def test_evict_least_recently_used(self):
+        self.cache.set("invoice-1", "abc", b"1" * 10)
+        self.cache.set("invoice-2", "abc", b"2" * 10)
+        self.cache.set("invoice-3", "abc", b"3" * 10)
+        # read the oldest entry so it becomes the most recently used
+        self.cache.get("invoice-1", "abc")
+        removed = self.cache.evict(max_size=20)
+        self.assertEqual(removed, 1)
+        self.assertIsNotNone(self.cache.get("invoice-1", "abc"))
+        self.assertIsNone(self.cache.get("invoice-2", "abc"))
+        self.assertIsNotNone(self.cache.get("invoice-3", "abc"))
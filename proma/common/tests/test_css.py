@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+
+from ..css import get_used_selectors, minify_stylesheet
+
+
+class MinifyStylesheetTestCase(SimpleTestCase):
+    def test_keep_used_rules(self):
+        css = ".card{color:red}.btn{color:blue}td{padding:0}a{color:red}"
+        result = minify_stylesheet(css, {"card"}, {"td"})
+        self.assertEqual(result, ".card{color:red}td{padding:0}")
+
+    def test_keep_only_used_selectors_of_a_rule(self):
+        css = ".table td,.table .btn,.table th{padding:0}"
+        result = minify_stylesheet(css, {"table"}, {"td"})
+        self.assertEqual(result, ".table td{padding:0}")
+
+    def test_universal_and_pseudo_selectors(self):
+        css = "*,::after{box-sizing:border-box}:root{--blue:#00f}"
+        self.assertEqual(minify_stylesheet(css, set(), set()), css)
+
+    def test_filter_media_queries(self):
+        css = "@media print{.card{color:red}.btn{color:blue}}@media print{.btn{x:y}}"
+        result = minify_stylesheet(css, {"card"}, set())
+        self.assertEqual(result, "@media print{.card{color:red}}")
+
+    def test_remove_comments_and_ignore_braces_in_strings(self):
+        css = '/* .card{} */.card::after{content:"}"}.btn{color:blue}'
+        result = minify_stylesheet(css, {"card"}, set())
+        self.assertEqual(result, '.card::after{content:"}"}')
+
+    def test_drop_id_selectors(self):
+        self.assertEqual(minify_stylesheet("#main{color:red}", set(), set()), "")
+
+
+class GetUsedSelectorsTestCase(SimpleTestCase):
+    def test_pdf_invoice_template(self):
+        classes, tags = get_used_selectors(("pdf/invoice.html",))
+        self.assertIn("card-body", classes)
+        self.assertIn("table-bordered", classes)
+        self.assertNotIn("btn", classes)
+        self.assertIn("td", tags)
+        self.assertIn("body", tags)
@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase, override_settings
+
+from ..utils import Email
+from .smtp import LocalSMTPServer
+
+
+def get_messages(count, to="client@example.com"):
+    return [
+        {"subject": f"Message {index}", "to": [to], "body": "body", "plain": True}
+        for index in range(count)
+    ]
+
+
+class SendMassMailTestCase(SimpleTestCase):
+    def send(self, server, messages, **kwargs):
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER=None,
+            DEFAULT_FROM_EMAIL="proma@example.com",
+        ):
+            return Email.send_mass_mail(messages, **kwargs)
+
+    def test_single_connection(self):
+        with LocalSMTPServer() as server:
+            sent, failed = self.send(server, get_messages(5))
+        self.assertEqual((sent, failed), (5, []))
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 1)
+
+    def test_reconnect_every_batch(self):
+        with LocalSMTPServer() as server:
+            sent, _ = self.send(server, get_messages(5), batch_size=2)
+        self.assertEqual(sent, 5)
+        self.assertEqual(server.connections, 3)
+
+    def test_reconnect_when_the_connection_is_lost(self):
+        with LocalSMTPServer(drop_after=2) as server:
+            sent, failed = self.send(server, get_messages(5))
+        self.assertEqual((sent, failed), (5, []))
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 3)
+
+    def test_refused_message_keeps_the_connection(self):
+        messages = get_messages(2) + get_messages(1, to="refused@example.com")
+        with LocalSMTPServer(refused=["refused@example.com"]) as server:
+            sent, failed = self.send(server, messages + get_messages(2))
+        self.assertEqual(sent, 4)
+        self.assertEqual(failed, messages[2:])
+        self.assertEqual(server.connections, 1)
+
+    def test_server_not_available(self):
+        with LocalSMTPServer() as server:
+            pass
+        sent, failed = self.send(server, get_messages(2), retries=1)
+        self.assertEqual(sent, 0)
+        self.assertEqual(len(failed), 2)
@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase, override_settings
+
+from ..metrics import StageTimer
+
+
+class RecordingMetrics:
+    records = []
+
+    def timing(self, name, seconds, tags):
+        self.records.append(("timing", name, seconds, tags))
+
+    def gauge(self, name, value, tags):
+        self.records.append(("gauge", name, value, tags))
+
+    def increment(self, name, value, tags):
+        self.records.append(("increment", name, value, tags))
+
+
+@override_settings(METRICS_BACKEND="proma.common.tests.test_metrics.RecordingMetrics")
+class StageTimerTestCase(SimpleTestCase):
+    def setUp(self):
+        RecordingMetrics.records = []
+
+    def test_stages_are_added_up(self):
+        timer = StageTimer("pdf.render")
+        with timer.stage("template"):
+            pass
+        first = timer.stages["template"]
+        with timer.stage("template"):
+            pass
+        self.assertGreater(timer.stages["template"], first)
+
+    def test_stage_is_measured_on_errors(self):
+        timer = StageTimer("pdf.render")
+        with self.assertRaises(ValueError):
+            with timer.stage("convert"):
+                raise ValueError
+        self.assertIn("convert", timer.stages)
+
+    def test_finish_sends_metrics(self):
+        timer = StageTimer("pdf.render", report="InvoicePDF")
+        with timer.stage("template"):
+            pass
+        timer.add_size("html", 10)
+        with self.assertLogs("proma.common.metrics") as logs:
+            timer.finish()
+        self.assertEqual(
+            [record[:2] for record in RecordingMetrics.records],
+            [("timing", "pdf.render.template"), ("gauge", "pdf.render.html_bytes")],
+        )
+        self.assertEqual(
+            RecordingMetrics.records[1][2:], (10, {"report": "InvoicePDF"})
+        )
+        self.assertIn("report=InvoicePDF", logs.output[0])
+        self.assertIn("html_bytes=10", logs.output[0])
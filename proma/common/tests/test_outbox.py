@@ -0,0 +1,84 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+
+from config.celery import app
+
+from .. import coalesce, outbox
+from ..models import OutboxMessage
+
+
+calls = []
+
+
+@app.task(name="tests.record_call")
+def record_call(value):
+    calls.append(value)
+
+
+class UnreachableBrokerTask(app.Task):
+    def apply_async(self, *args, **kwargs):
+        raise OSError("Connection refused")
+
+
+@app.task(name="tests.unreachable_broker", base=UnreachableBrokerTask)
+def unreachable_broker():
+    pass
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        cache.clear()
+
+    def test_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            outbox.enqueue(record_call.si(1))
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_not_published_after_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                outbox.enqueue(record_call.si(1))
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(calls, [])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_in_batches_in_order(self):
+        for value in range(5):
+            outbox.enqueue(record_call.si(value))
+        self.assertEqual(outbox.relay(batch_size=2), 5)
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        self.assertEqual(outbox.relay(), 0)
+
+    def test_chain_is_published(self):
+        outbox.enqueue(record_call.si(1) | record_call.si(2))
+        outbox.relay()
+        self.assertEqual(calls, [1, 2])
+
+    def test_failed_publish_keeps_the_batch(self):
+        outbox.enqueue(record_call.si(1))
+        outbox.enqueue(unreachable_broker.si())
+        with self.assertRaises(OSError):
+            outbox.relay()
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_coalesced_duplicate_is_dropped(self):
+        outbox.enqueue(record_call.si(1), coalesce_key=("tests.record_call", 1))
+        outbox.enqueue(record_call.si(1), coalesce_key=("tests.record_call", 1))
+        outbox.enqueue(record_call.si(2), coalesce_key=("tests.record_call", 2))
+        self.assertEqual(outbox.relay(), 3)
+        self.assertEqual(calls, [1, 2])
+        self.assertTrue(coalesce.is_pending("tests.record_call", 1))
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed_publish_releases_the_coalesced_tasks(self):
+        outbox.enqueue(record_call.si(1), coalesce_key=("tests.record_call", 1))
+        outbox.enqueue(unreachable_broker.si())
+        with self.assertRaises(OSError):
+            outbox.relay()
+        self.assertFalse(coalesce.is_pending("tests.record_call", 1))
+        self.assertEqual(OutboxMessage.objects.count(), 2)
@@ -0,0 +1,21 @@
+from django.test import TestCase
+
+from ..models import OutboxMessage
+from .plans import QueryPlanMixin
+
+
+class QueryPlanTestCase(QueryPlanMixin, TestCase):
+    def setUp(self):
+        OutboxMessage.objects.bulk_create(
+            OutboxMessage(signature={"task": "tests.task"}) for _ in range(20)
+        )
+
+    def test_index_scan(self):
+        self.assertUsesIndex(OutboxMessage.objects.filter(id__in=[1, 2]))
+
+    def test_sequential_scan(self):
+        # the outbox is only read in creation order by the relay
+        with self.assertRaisesMessage(
+            AssertionError, "Sequential scan on common_outboxmessage"
+        ):
+            self.assertUsesIndex(OutboxMessage.objects.order_by("created"))
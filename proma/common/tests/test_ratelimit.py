@@ -0,0 +1,26 @@
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from ..ratelimit import wait_for_slot
+
+
+class WaitForSlotTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_wait_for_next_window(self):
+        # start at the beginning of a window
+        time.sleep(1 - time.time() % 1)
+        wait_for_slot("smtp:test", limit=2, period=1)
+        wait_for_slot("smtp:test", limit=2, period=1)
+        window = int(time.time())
+        wait_for_slot("smtp:test", limit=2, period=1)
+        self.assertGreater(int(time.time()), window)
+
+    def test_disabled(self):
+        start = time.monotonic()
+        for _ in range(10):
+            wait_for_slot("smtp:test", limit=0, period=60)
+        self.assertLess(time.monotonic() - start, 1)
@@ -0,0 +1,140 @@
+import os
+import sys
+import tempfile
+
+from django.test import SimpleTestCase
+
+from ..exceptions import PDFRenderError, PDFRenderTimeout
+from ..renderers import RendererPool
+
+# Behaves like `wkhtmltopdf --read-args-from-stdin`: one conversion per line
+FAKE_WKHTMLTOPDF = r"""
+import os
+import sys
+import time
+
+
+def split(line):
+    # the same parsing of wkhtmltopdf: spaces out of double quotes split the
+    # arguments and a backslash escapes the next character
+    args, arg, inside, quoted, escaped = [], "", False, False, False
+    for char in line.rstrip("\n"):
+        if escaped:
+            arg, escaped = arg + char, False
+        elif char == "\\":
+            inside, escaped = True, True
+        elif char == '"':
+            inside, quoted = True, not quoted
+        elif char == " " and not quoted:
+            if inside:
+                args.append(arg)
+            arg, inside = "", False
+        else:
+            arg, inside = arg + char, True
+    if inside:
+        args.append(arg)
+    return args
+
+
+for line in sys.stdin:
+    args = split(line)
+    if "--sleep" in args:
+        time.sleep(float(args[args.index("--sleep") + 1]))
+    if "--crash" in args:
+        sys.exit(1)
+    with open(args[-2]) as source, open(args[-1], "w") as output:
+        if "--title" in args:
+            output.write(args[args.index("--title") + 1])
+        else:
+            output.write(f"{os.getpid()}:{source.read()}")
+    sys.stderr.write("Loading pages (1/6)\r[====] 100%\nDone\n")
+    sys.stderr.flush()
+"""
+
+
+class RendererPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        fd, self.script = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, "w") as f:
+            f.write(FAKE_WKHTMLTOPDF)
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+        os.remove(self.script)
+
+    def get_pool(self, size=1, timeout=5, max_renders=10):
+        pool = RendererPool(
+            [sys.executable, self.script],
+            size=size,
+            timeout=timeout,
+            max_renders=max_renders,
+        )
+        self.pools.append(pool)
+        return pool
+
+    def test_render(self):
+        pool = self.get_pool()
+        content = pool.render("<html></html>", {"quiet": ""})
+        self.assertTrue(content.endswith(b":<html></html>"))
+
+    def test_reuse_worker(self):
+        pool = self.get_pool()
+        first = pool.render("a", {}).split(b":")[0]
+        second = pool.render("b", {}).split(b":")[0]
+        self.assertEqual(first, second)
+
+    def test_recycle_worker_after_max_renders(self):
+        pool = self.get_pool(max_renders=1)
+        first = pool.render("a", {}).split(b":")[0]
+        second = pool.render("b", {}).split(b":")[0]
+        self.assertNotEqual(first, second)
+
+    def test_render_timeout(self):
+        # long enough for the fake process to start on a busy machine
+        pool = self.get_pool(timeout=1.5)
+        with self.assertRaises(PDFRenderTimeout):
+            pool.render("a", {"sleep": "10"})
+        # the killed worker is replaced by a new one
+        self.assertTrue(pool.render("b", {}).endswith(b":b"))
+
+    def test_worker_crash(self):
+        pool = self.get_pool()
+        with self.assertRaises(PDFRenderError):
+            pool.render("a", {"crash": ""})
+        self.assertTrue(pool.render("b", {}).endswith(b":b"))
+
+    def test_acquire_timeout_when_pool_is_busy(self):
+        pool = self.get_pool(size=1, timeout=0.2)
+        worker = pool.acquire()
+        with self.assertRaises(PDFRenderTimeout):
+            pool.acquire()
+        pool.release(worker)
+        self.assertIs(pool.acquire(), worker)
+
+    def test_option_values_with_spaces(self):
+        pool = self.get_pool()
+        title = 'Invoice "#1" of C:\\Clients\\ACME'
+        self.assertEqual(pool.render("a", {"title": title}).decode(), title)
+
+    def test_forked_process_starts_its_own_workers(self):
+        pool = self.get_pool()
+        parent = pool.render("a", {}).split(b":")[0]
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read)
+                os.write(write, pool.render("b", {}))
+                pool.close()
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read, "rb") as f:
+            child = f.read()
+        os.waitpid(pid, 0)
+        self.assertTrue(child.endswith(b":b"))
+        self.assertNotEqual(child.split(b":")[0], parent)
+        # the worker of the parent is still usable
+        self.assertEqual(pool.render("c", {}).split(b":")[0], parent)
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from ..results import purge_task_results, send_table_metrics
+from .test_metrics import RecordingMetrics
+
+
+@override_settings(
+    TASK_RESULT_TTLS={"invoices.render_invoice_pdf": 60 * 60},
+    TASK_RESULT_DEFAULT_TTL=24 * 60 * 60,
+)
+class PurgeTaskResultsTestCase(TestCase):
+    def create_result(self, task_name, age):
+        result = TaskResult.objects.create(
+            task_id=f"{task_name}-{age}", task_name=task_name
+        )
+        # date_done is set on every save
+        TaskResult.objects.filter(id=result.id).update(
+            date_done=timezone.now() - timedelta(hours=age)
+        )
+        return result
+
+    def test_purge_by_task_ttl(self):
+        self.create_result("invoices.render_invoice_pdf", 2)
+        kept = self.create_result("invoices.refresh_invoice_pdfs", 2)
+        self.assertEqual(purge_task_results(), 1)
+        self.assertEqual(list(TaskResult.objects.all()), [kept])
+
+    def test_purge_with_default_ttl(self):
+        self.create_result("invoices.refresh_invoice_pdfs", 48)
+        self.create_result(None, 48)
+        kept = self.create_result(None, 2)
+        self.assertEqual(purge_task_results(), 2)
+        self.assertEqual(list(TaskResult.objects.all()), [kept])
+
+    def test_purge_in_batches(self):
+        for age in range(2, 7):
+            self.create_result("invoices.render_invoice_pdf", age)
+        self.assertEqual(purge_task_results(batch_size=2), 5)
+        self.assertFalse(TaskResult.objects.exists())
+
+    @override_settings(
+        METRICS_BACKEND="proma.common.tests.test_metrics.RecordingMetrics"
+    )
+    def test_table_metrics(self):
+        RecordingMetrics.records = []
+        self.create_result("invoices.render_invoice_pdf", 0)
+        send_table_metrics()
+        self.assertIn(("gauge", "task_results.rows", 1, {}), RecordingMetrics.records)
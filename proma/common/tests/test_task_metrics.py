@@ -0,0 +1,55 @@
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from config.celery import app
+
+from .. import task_metrics
+from .test_metrics import RecordingMetrics
+
+
+@app.task(name="tests.succeed")
+def succeed():
+    pass
+
+
+@app.task(name="tests.fail")
+def fail():
+    raise ValueError
+
+
+@override_settings(METRICS_BACKEND="proma.common.tests.test_metrics.RecordingMetrics")
+class TaskMetricsTestCase(SimpleTestCase):
+    def setUp(self):
+        RecordingMetrics.records = []
+
+    def get_records(self, name):
+        return [record for record in RecordingMetrics.records if record[1] == name]
+
+    def test_runtime(self):
+        succeed.delay()
+        [(_, _, seconds, tags)] = self.get_records("celery.task.runtime")
+        self.assertGreaterEqual(seconds, 0)
+        self.assertEqual(
+            tags, {"task": "tests.succeed", "queue": "eager", "state": "SUCCESS"}
+        )
+        self.assertEqual(task_metrics._started, {})
+
+    def test_failure(self):
+        fail.delay()
+        [(_, _, count, tags)] = self.get_records("celery.task.failures")
+        self.assertEqual(count, 1)
+        self.assertEqual(
+            tags, {"task": "tests.fail", "queue": "eager", "reason": "ValueError"}
+        )
+        [(_, _, _, tags)] = self.get_records("celery.task.runtime")
+        self.assertEqual(tags["state"], "FAILURE")
+
+    def test_queue_wait(self):
+        headers = {}
+        task_metrics.record_enqueue_time(headers=headers)
+        self.assertAlmostEqual(headers["enqueued_at"], time.time(), delta=1)
+        succeed.apply(headers={"enqueued_at": time.time() - 5})
+        [(_, _, seconds, tags)] = self.get_records("celery.task.queue_wait")
+        self.assertGreaterEqual(seconds, 5)
+        self.assertEqual(tags, {"task": "tests.succeed", "queue": "eager"})
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.template import engines
+from django.test import SimpleTestCase, override_settings
+
+from .. import warmup
+
+
+CACHED_TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "DIRS": settings.TEMPLATES[0]["DIRS"],
+        "OPTIONS": {
+            "context_processors": settings.TEMPLATES[0]["OPTIONS"][
+                "context_processors"
+            ],
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                )
+            ],
+        },
+    }
+]
+
+
+class CompileTemplatesTestCase(SimpleTestCase):
+    @override_settings(TEMPLATES=CACHED_TEMPLATES)
+    def test_templates_are_cached(self):
+        compiled = warmup.compile_templates()
+        cache = engines["django"].engine.template_loaders[0].get_template_cache
+        self.assertGreater(compiled, 0)
+        self.assertEqual(len(cache), compiled)
+        self.assertIn("pdf/invoice.html", cache)
+        self.assertIn("email/invoice_opened.html", cache)
+
+    @override_settings(TEMPLATES=[{**CACHED_TEMPLATES[0], "OPTIONS": {"debug": True}}])
+    def test_nothing_is_compiled_without_cached_loader(self):
+        self.assertEqual(warmup.compile_templates(), 0)
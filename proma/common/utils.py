@@ -1,12 +1,34 @@
+import csv
+import logging
 import os
+import smtplib
+import zipfile
+from contextlib import nullcontext
 
-import pdfkit
 from django.conf import settings
-from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
 from django.http import HttpResponse
 from django.template import loader
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
 from django.views.generic import View
 
+from .backends import get_backend
+from .cache import pdf_cache
+from .css import get_minified_stylesheet
+from .metrics import StageTimer
+from .ratelimit import wait_for_slot
+
+
+logger = logging.getLogger(__name__)
+
+
+def _is_connection_error(ex):
+    # SMTPException is an OSError, only a lost connection is worth a retry
+    return isinstance(ex, smtplib.SMTPServerDisconnected) or not isinstance(
+        ex, smtplib.SMTPException
+    )
+
 
 class Email(object):
     @staticmethod
@@ -23,6 +45,73 @@ class Email(object):
         Raise:
             TemplateDoesNotExist
         """
+        message = Email.build_message(**kwargs)
+        return message.send(fail_silently=not settings.DEBUG)
+
+    @staticmethod
+    def send_mass_mail(messages, batch_size=None, retries=None):
+        """
+        Send many messages over a single SMTP connection, the connection is
+        opened again every `batch_size` messages and when it's lost. At most
+        EMAIL_RATE_LIMIT messages per minute are sent to the SMTP host
+        Args:
+            messages: required, iterable of dicts with the send_mail arguments
+            batch_size: optional, default is EMAIL_BULK_BATCH_SIZE
+            retries: optional, attempts after a connection error for each
+                message, default is EMAIL_BULK_RETRIES
+        Return:
+            the number of sent messages and the list of the failed ones
+        Raise:
+            TemplateDoesNotExist
+        """
+        batch_size = batch_size or settings.EMAIL_BULK_BATCH_SIZE
+        retries = settings.EMAIL_BULK_RETRIES if retries is None else retries
+        connection = get_connection()
+        # the rate limit is shared by all the workers sending to the host
+        host = f"smtp:{getattr(connection, 'host', 'local')}"
+        sent, failed, batch = 0, [], 0
+        try:
+            for kwargs in messages:
+                message = Email.build_message(**kwargs)
+                for attempt in range(retries + 1):
+                    if batch >= batch_size:
+                        connection.close()
+                        batch = 0
+                    wait_for_slot(host, settings.EMAIL_RATE_LIMIT)
+                    try:
+                        connection.open()
+                        connection.send_messages([message])
+                    except OSError as ex:
+                        if not _is_connection_error(ex):
+                            # the server refused this message, the
+                            # connection is still usable
+                            logger.exception("Error sending email to %s", message.to)
+                            failed.append(kwargs)
+                            batch += 1
+                            break
+                        logger.warning(
+                            "SMTP connection lost sending email to %s",
+                            message.to,
+                            exc_info=True,
+                        )
+                        connection.close()
+                        batch = 0
+                    else:
+                        sent += 1
+                        batch += 1
+                        break
+                else:
+                    failed.append(kwargs)
+        finally:
+            connection.close()
+        logger.info("%d emails sent, %d failed", sent, len(failed))
+        return sent, failed
+
+    @staticmethod
+    def build_message(**kwargs):
+        """
+        Build the message sent by send_mail, it receives the same arguments
+        """
         subject = kwargs.get("subject")
         from_email = kwargs.get("from_email", settings.DEFAULT_FROM_EMAIL)
         to = kwargs.get("to")
@@ -41,58 +130,144 @@ class Email(object):
                 subject, html_content, from_email, to, attachments=attachments
             )
             message.content_subtype = "html"
-        return message.send(fail_silently=not settings.DEBUG)
+        return message
 
 
 class PDFReport:
     """
-    Abstract Report class, usde pdfkit to render html into pdf files
+    Abstract Report class, the document is rendered by the backend defined
+    in PDF_BACKEND, either from the html template or drawn directly with
+    the flowables returned by get_flowables
+
+    Reports that define a cache key are stored in the PDF cache, so they are
+    only rendered again when the key changes.
+
+    Every render is measured by stage (cache lookup, context, css, template,
+    conversion and cache store) with a StageTimer available in `timer`.
     """
 
     template_name = None
     bootstrap_styles = False
+    options = {
+        "page-size": "Letter",
+        "margin-top": "0.75in",
+        "margin-right": "0.75in",
+        "margin-bottom": "0.75in",
+        "margin-left": "0.75in",
+        "encoding": "UTF-8",
+        "quiet": "",
+    }
+    timer = None
 
     def render(self):
-        context = self.get_context()
+        self.timer = StageTimer("pdf.render", report=self.__class__.__name__)
+        with self.stage("cache"):
+            key = self.get_cache_key()
+            content = self._get_cached(key)
+        self.timer.tags["cached"] = content is not None
+        if content is None:
+            content = self._render()
+            if key is not None:
+                with self.stage("cache_store"):
+                    pdf_cache.set(self.get_cache_namespace(), key, content)
+        self.timer.add_size("pdf", len(content))
+        self.timer.finish()
+        return content
+
+    def stage(self, name):
+        """
+        Measure a stage of the current render, nothing is measured outside
+        of render()
+        """
+        if self.timer is None:
+            return nullcontext()
+        return self.timer.stage(name)
+
+    def get_cached(self):
+        """
+        Return the stored document when it's still valid, None otherwise
+        """
+        return self._get_cached(self.get_cache_key())
+
+    def _get_cached(self, key):
+        if key is None:
+            return None
+        return pdf_cache.get(self.get_cache_namespace(), key)
+
+    def _render(self):
+        return get_backend().render(self)
+
+    def render_html(self):
+        with self.stage("context"):
+            context = self.get_context()
         context.update(self._get_default_context())
-        template = loader.get_template(self.template_name)
-        content = template.render((context))
-        options = {
-            "page-size": "Letter",
-            "margin-top": "0.75in",
-            "margin-right": "0.75in",
-            "margin-bottom": "0.75in",
-            "margin-left": "0.75in",
-            "encoding": "UTF-8",
-            "quiet": "",
-        }
-        return pdfkit.from_string(content, False, options=options)
+        with self.stage("template"):
+            template = loader.get_template(self.template_name)
+            html = template.render((context))
+        if self.timer is not None:
+            self.timer.add_size("html", len(html.encode()))
+        return html
 
     def _get_default_context(self):
         context = {}
         if self.bootstrap_styles:
-            path = os.path.join(
-                settings.BASE_DIR,
-                "proma",
-                "static",
-                "vendor",
-                "css",
-                "bootstrap.min.css",
-            )
-            with open(path) as f:
-                context.update({"bootstrap_styles": f.read()})
+            with self.stage("css"):
+                context.update({"bootstrap_styles": self.get_bootstrap_styles()})
         return context
 
+    @classmethod
+    def get_bootstrap_styles(cls):
+        """
+        Return only the bootstrap rules used by the report template, they're
+        extracted once per process
+        """
+        path = os.path.join(
+            settings.BASE_DIR, "proma", "static", "vendor", "css", "bootstrap.min.css"
+        )
+        return get_minified_stylesheet(path, (cls.template_name,))
+
     def get_filename(self):
         raise NotImplementedError
 
     def get_context(self):
         raise NotImplementedError
 
+    def get_flowables(self, styles, width):
+        raise NotImplementedError
+
+    def get_cache_namespace(self):
+        return self.__class__.__name__.lower()
+
+    def get_cache_key(self):
+        """
+        Return a string that changes whenever the rendered document would
+        change, None disables the cache for the report
+        """
+        return None
+
+    def get_etag(self):
+        """
+        Return a cheap validator computed without rendering the document,
+        None disables the etag validation
+        """
+        return None
+
+    def get_last_modified(self):
+        return None
+
 
 class PDFView(View):
     """
     Create a PDF response using PDFReport
+
+    When the report defines an etag or a last modified date, the request
+    validators are checked before rendering and a 304 response is returned
+    if the client already has the document.
+
+    Views that render the document somewhere else return None from
+    get_content and answer with get_pending_response meanwhile.
+
+    The validation, content and response stages are measured as well.
     """
 
     report_class = None
@@ -102,11 +277,107 @@ class PDFView(View):
         assert isinstance(
             report, PDFReport
         ), "The report must be an instance of PDFReport"
-        response = HttpResponse(report.render(), content_type="application/pdf")
-        response[
-            "Content-Disposition"
-        ] = f"attachment; filename={report.get_filename()}"
+        timer = StageTimer("pdf.view", report=report.__class__.__name__)
+        with timer.stage("validate"):
+            etag = report.get_etag()
+            if etag is not None:
+                etag = quote_etag(etag)
+            last_modified = report.get_last_modified()
+            if last_modified is not None:
+                last_modified = int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+        if response is None:
+            with timer.stage("content"):
+                content = self.get_content(report)
+            if content is None:
+                response = self.get_pending_response(report)
+                timer.tags["status"] = response.status_code
+                timer.finish()
+                return response
+            with timer.stage("response"):
+                response = HttpResponse(content, content_type="application/pdf")
+                response[
+                    "Content-Disposition"
+                ] = f"attachment; filename={report.get_filename()}"
+                response["Content-Length"] = len(content)
+            timer.add_size("response", len(content))
+        if etag is not None:
+            response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # the browser can keep the file but has to validate it every time
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        timer.tags["status"] = response.status_code
+        timer.finish()
         return response
 
+    def get_content(self, report):
+        return report.render()
+
+    def get_pending_response(self, report):
+        raise NotImplementedError
+
     def get_report_kwargs(self):
         raise NotImplementedError
+
+
+class _ZipBuffer:
+    """
+    Write-only file object that only keeps the bytes not sent yet
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Build a zip file from an iterable of (filename, content) and yield it in
+    chunks as every file is added, so it can be sent with a
+    StreamingHttpResponse without keeping the whole file in memory
+    """
+    buffer = _ZipBuffer()
+    # PDF files are already compressed
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for filename, content in files:
+            archive.writestr(filename, content)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+class _EchoBuffer:
+    """
+    File object that returns what is written instead of keeping it
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    Yield the rows as CSV lines, so they can be sent with a
+    StreamingHttpResponse without building the whole file first
+    """
+    writer = csv.writer(_EchoBuffer())
+    for row in rows:
+        yield writer.writerow(row)
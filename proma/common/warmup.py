@@ -0,0 +1,70 @@
+import logging
+import os
+import time
+
+from django.template import TemplateSyntaxError, engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.utils.module_loading import autodiscover_modules
+
+from .metrics import get_metrics
+from .utils import PDFReport
+
+
+logger = logging.getLogger(__name__)
+
+_done = False
+
+
+def _get_report_classes(cls=PDFReport):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _get_report_classes(subclass)
+
+
+def _get_template_names(engine):
+    for directory in engine.dirs:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                yield os.path.relpath(os.path.join(root, filename), directory)
+
+
+def compile_templates():
+    """
+    Compile every template of the DIRS of the django engine into the cached
+    loader, return the number of compiled templates
+    """
+    engine = engines["django"].engine
+    if not any(isinstance(loader, CachedLoader) for loader in engine.template_loaders):
+        # without the cached loader templates are parsed on every render
+        return 0
+    compiled = 0
+    for template_name in _get_template_names(engine):
+        try:
+            engine.get_template(template_name)
+        except TemplateSyntaxError:
+            logger.warning(
+                "Template %s could not be compiled", template_name, exc_info=True
+            )
+            continue
+        compiled += 1
+    return compiled
+
+
+def warmup():
+    """
+    Fill the per process caches before the first request or task, it's
+    called when a web or celery worker process starts and only runs once
+    """
+    global _done
+    if _done:
+        return
+    _done = True
+    start = time.perf_counter()
+    autodiscover_modules("reports")
+    for report_class in _get_report_classes():
+        if report_class.bootstrap_styles and report_class.template_name:
+            report_class.get_bootstrap_styles()
+    templates = compile_templates()
+    elapsed = time.perf_counter() - start
+    get_metrics().timing("warmup", elapsed, {"pid": os.getpid()})
+    logger.info("Warmup finished in %.3fs, %d templates compiled", elapsed, templates)
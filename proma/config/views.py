@@ -4,6 +4,9 @@ from django.urls import reverse
 from django.utils.translation import ugettext as _
 from django.views.generic import UpdateView
 
+from proma.common import outbox
+from proma.invoices.tasks import refresh_invoice_pdfs
+
 from .forms import ConfigurationForm
 from .models import Configuration
 
@@ -17,6 +20,12 @@ class ConfigurationUpdateView(LoginRequiredMixin, UpdateView):
     def get_object(self):
         return Configuration.get_instance()
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        # the company information is printed in the invoices
+        outbox.enqueue(refresh_invoice_pdfs.si())
+        return response
+
     def get_success_url(self):
         messages.success(self.request, _("Configuration saved!"))
         return reverse("config:configuration-update")
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from .models import Invoice
+from .querysets import AGING_BUCKETS
+
+
+BUCKETS = [name for name, _first, _last in AGING_BUCKETS]
+
+LABELS = {
+    "current": _("Current"),
+    "days_1_30": _("1-30 days"),
+    "days_31_60": _("31-60 days"),
+    "days_61_90": _("61-90 days"),
+    "days_over_90": _("Over 90 days"),
+}
+
+
+def get_report(date=None):
+    """
+    Return the receivables aging of the open invoices by client and
+    currency, with the totals of every currency. The report is cached for
+    INVOICE_AGING_CACHE_TIMEOUT seconds
+    """
+    if date is None:
+        date = timezone.now().date()
+    key = f"invoices:aging:{date.isoformat()}"
+    report = cache.get(key)
+    if report is None:
+        rows = [
+            dict(client=row.pop("client"), client_name=row.pop("client__name"), **row)
+            for row in Invoice.objects.aging(date)
+        ]
+        report = {"date": date, "rows": rows, "totals": get_totals(rows)}
+        cache.set(key, report, settings.INVOICE_AGING_CACHE_TIMEOUT)
+    return report
+
+
+def get_totals(rows):
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(
+            row["currency"],
+            dict(
+                currency=row["currency"],
+                outstanding=Decimal(0),
+                **{bucket: Decimal(0) for bucket in BUCKETS},
+            ),
+        )
+        for name in ["outstanding", *BUCKETS]:
+            total[name] += row[name]
+    return [totals[currency] for currency in sorted(totals)]
@@ -1,9 +1,16 @@
+import re
+
 from django import forms
 from django.forms import inlineformset_factory
 from django.utils.translation import ugettext as _
 
+from proma.clients.models import Client
 from proma.common.forms import FormWithDateFields
+from proma.common.helpers import CommonFilterHelper
+from proma.enums import Currency
+from proma.projects.models import Project
 
+from . import tasks
 from .models import Invoice, Item
 
 
@@ -53,3 +60,85 @@ class PayInvoiceForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["payment_notes"].required = True
+
+
+class InvoiceBulkActionForm(forms.Form):
+
+    OPEN = "open"
+    PAY = "pay"
+    CANCEL = "cancel"
+
+    ACTION_CHOICES = ((OPEN, _("Open")), (PAY, _("Pay")), (CANCEL, _("Cancel")))
+
+    action = forms.ChoiceField(label=_("Action"), choices=ACTION_CHOICES)
+    payment_notes = forms.CharField(
+        label=_("Payment notes"),
+        required=False,
+        widget=forms.Textarea(attrs={"cols": 30, "rows": 3}),
+    )
+    invoices = forms.CharField(widget=forms.HiddenInput)
+    # this is used to accept values from javascript in the template
+
+    def clean_invoices(self):
+        ids = re.findall(r"\d+", self.cleaned_data.get("invoices"))
+        return Invoice.objects.filter(id__in=ids)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get("action")
+        # the notes are required as when a single invoice is paid
+        if action == self.PAY and not cleaned_data.get("payment_notes"):
+            self.add_error("payment_notes", _("This field is required."))
+        return cleaned_data
+
+    def process(self):
+        """
+        Apply the action to the selected invoices at once and enqueue their
+        notifications or renders in a single message, return the ids of the
+        changed invoices
+        """
+        action = self.cleaned_data["action"]
+        invoices = self.cleaned_data["invoices"]
+        if action == self.OPEN:
+            ids = invoices.open_all()
+            if ids:
+                tasks.send_open_invoice_notifications(ids)
+            return ids
+        if action == self.PAY:
+            ids = invoices.pay_all(notes=self.cleaned_data["payment_notes"])
+        else:
+            ids = invoices.cancel_all()
+        if ids:
+            tasks.render_invoice_pdfs(ids)
+        return ids
+
+
+class RevenueReportForm(forms.Form):
+
+    start = forms.DateField(label=_("From"), input_formats=["%Y-%m"], required=False)
+    end = forms.DateField(label=_("To"), input_formats=["%Y-%m"], required=False)
+    client = forms.ModelChoiceField(
+        label=_("Client"), queryset=Client.objects.all(), required=False
+    )
+    project = forms.ModelChoiceField(
+        label=_("Project"), queryset=Project.objects.all(), required=False
+    )
+    currency = forms.ChoiceField(
+        label=_("Currency"),
+        choices=[("", "---------")]
+        + [(currency.name, currency.value) for currency in Currency],
+        required=False,
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = CommonFilterHelper()
+        for name in ("start", "end"):
+            self.fields[name].widget.attrs["placeholder"] = "yyyy-mm"
+
+    def get_filters(self):
+        return {
+            name: self.cleaned_data[name]
+            for name in ("client", "project", "currency")
+            if self.cleaned_data[name]
+        }
@@ -0,0 +1,70 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from proma.common.backends import HTMLBackend, ReportLabBackend
+from proma.invoices.models import Invoice, Item
+from proma.invoices.reports import InvoicePDF
+
+
+class Command(BaseCommand):
+
+    help = "Compare latency and memory of the PDF backends for invoices of 1, 50 and 500 items"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--renders", type=int, default=5)
+        parser.add_argument("--items", type=int, nargs="+", default=[1, 50, 500])
+
+    def handle(self, *args, **options):
+        project = Invoice.objects.values_list("project", flat=True).first()
+        if project is None:
+            raise CommandError("At least one invoice is needed to get a project")
+        backends = (("html", HTMLBackend()), ("reportlab", ReportLabBackend()))
+        for items in options["items"]:
+            # the invoices are only needed while rendering
+            with transaction.atomic():
+                invoice = self.create_invoice(project, items)
+                report = InvoicePDF(invoice=invoice)
+                for name, backend in backends:
+                    latencies, python_peak = self.run(
+                        backend, report, options["renders"]
+                    )
+                    self.stdout.write(
+                        f"{items} items, {name}: "
+                        f"median {statistics.median(latencies) * 1000:.1f}ms, "
+                        f"max {max(latencies) * 1000:.1f}ms, "
+                        f"python peak {python_peak / 1024:.0f}KB"
+                    )
+                transaction.set_rollback(True)
+
+    def create_invoice(self, project_id, items):
+        invoice = Invoice.objects.create(
+            client_id=Invoice.objects.filter(project=project_id)
+            .values_list("client", flat=True)
+            .first(),
+            project_id=project_id,
+            status=Invoice.OPEN,
+        )
+        Item.objects.bulk_create(
+            Item(invoice=invoice, description=f"Item {index}", units=index + 1, rate=10)
+            for index in range(items)
+        )
+        return invoice
+
+    def run(self, backend, report, renders):
+        latencies = []
+        for _ in range(renders):
+            start = time.perf_counter()
+            backend.render(report)
+            latencies.append(time.perf_counter() - start)
+        # tracing slows down the render, so memory is measured apart
+        tracemalloc.start()
+        backend.render(report)
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # the RSS peak isn't reported, it's the peak since the process
+        # started so it would repeat the figure of the largest invoice
+        return latencies, python_peak
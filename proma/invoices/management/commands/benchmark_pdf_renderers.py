@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from proma.common.renderers import PDFKitRenderer, PooledRenderer
+from proma.invoices.models import Invoice
+from proma.invoices.reports import InvoicePDF
+
+
+class Command(BaseCommand):
+
+    help = "Compare the renders/sec of a wkhtmltopdf fork per document against the renderer pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--invoice", type=int, help="Invoice id, the latest open one by default"
+        )
+        parser.add_argument("--renders", type=int, default=50)
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.PDF_RENDERER_POOL_SIZE
+        )
+
+    def handle(self, *args, **options):
+        invoice = self.get_invoice(options["invoice"])
+        report = InvoicePDF(invoice=invoice)
+        html = report.render_html()
+        renderers = (("fork", PDFKitRenderer()), ("pool", PooledRenderer()))
+        for name, renderer in renderers:
+            # start the pool workers before measuring
+            renderer.render(html, report.options)
+            elapsed = self.run(renderer, html, report.options, **options)
+            self.stdout.write(
+                f"{name}: {options['renders']} renders in {elapsed:.2f}s, "
+                f"{options['renders'] / elapsed:.2f} renders/sec"
+            )
+
+    def get_invoice(self, invoice_id):
+        invoices = Invoice.objects.non_draft()
+        if invoice_id is not None:
+            invoices = invoices.filter(id=invoice_id)
+        invoice = invoices.order_by("-id").first()
+        if invoice is None:
+            raise CommandError("There is no invoice to render")
+        return invoice
+
+    def run(self, renderer, html, report_options, renders, concurrency, **options):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in executor.map(
+                lambda _: renderer.render(html, report_options), range(renders)
+            ):
+                pass
+        return time.perf_counter() - start
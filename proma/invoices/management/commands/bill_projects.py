@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from proma.invoices.models import Invoice
+from proma.projects.models import Project
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Create a draft invoice of the project rate for every active project, "
+        "or the given ones, the projects already invoiced this month are skipped"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("projects", type=int, nargs="*", help="Ids of the projects")
+        parser.add_argument(
+            "--description",
+            default="{project} {month}",
+            help="Item description, {project} and {month} are replaced",
+        )
+        parser.add_argument("--units", type=Decimal, default=Decimal(1))
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Invoice the projects already invoiced this month too",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        projects = Project.objects.select_related("client").order_by("id")
+        if options["projects"]:
+            projects = projects.filter(id__in=options["projects"])
+        else:
+            projects = projects.filter(status=Project.ACTIVE)
+        projects = list(projects)
+        invoiced = set()
+        if not options["force"]:
+            invoiced = set(
+                Invoice.objects.filter(
+                    project__in=projects,
+                    issue_date__year=today.year,
+                    issue_date__month=today.month,
+                ).values_list("project", flat=True)
+            )
+
+        entries, skipped = [], []
+        for project in projects:
+            if project.status != Project.ACTIVE:
+                skipped.append((project, "archived"))
+            elif not project.rate:
+                skipped.append((project, "no rate"))
+            elif project.id in invoiced:
+                skipped.append((project, "already invoiced this month"))
+            else:
+                description = options["description"].format(
+                    project=project.name, month=today.strftime("%B %Y")
+                )
+                entries.append((project, description, project.rate, options["units"]))
+        missing = set(options["projects"]) - {project.id for project in projects}
+
+        invoices = Invoice.create_from_projects(entries)
+        for invoice in invoices:
+            self.stdout.write(
+                f"Project {invoice.project.id} {invoice.project}: "
+                f"invoice {invoice.id} for {invoice.total} {invoice.currency}"
+            )
+        for project, reason in skipped:
+            self.stdout.write(f"Project {project.id} {project}: skipped, {reason}")
+        for project_id in sorted(missing):
+            self.stderr.write(f"Project {project_id}: not found")
+        self.stdout.write(
+            f"{len(invoices)} invoices created, "
+            f"{len(skipped) + len(missing)} projects skipped"
+        )
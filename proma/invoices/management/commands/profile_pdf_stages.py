@@ -0,0 +1,84 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from proma.invoices.models import Invoice
+from proma.invoices.reports import InvoicePDF
+
+
+PERCENTILES = (50, 90, 99)
+
+
+class UncachedInvoicePDF(InvoicePDF):
+    def is_stored(self, key=None):
+        return False
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    index = max(math.ceil(len(values) * percent / 100) - 1, 0)
+    return values[index]
+
+
+class Command(BaseCommand):
+
+    help = "Render the latest invoices and print the percentile latencies of every PDF stage"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=20)
+        parser.add_argument(
+            "--cached",
+            action="store_true",
+            help="Use the stored files and the PDF cache instead of rendering",
+        )
+
+    def handle(self, *args, **options):
+        invoices = list(
+            Invoice.objects.non_draft()
+            .select_related("client")
+            .order_by("-id")[: options["count"]]
+        )
+        if not invoices:
+            raise CommandError("There is no invoice to render")
+        if options["cached"]:
+            stages, sizes = self.run(InvoicePDF, invoices)
+        else:
+            with override_settings(PDF_CACHE_ENABLED=False):
+                stages, sizes = self.run(UncachedInvoicePDF, invoices)
+        self.stdout.write(
+            f"{len(invoices)} invoices, "
+            + ", ".join(f"p{percent}" for percent in PERCENTILES)
+            + ", max"
+        )
+        for stage, values in stages.items():
+            values.sort()
+            latencies = [percentile(values, percent) for percent in PERCENTILES]
+            self.stdout.write(
+                f"{stage}: "
+                + ", ".join(f"{value * 1000:.1f}ms" for value in latencies)
+                + f", {values[-1] * 1000:.1f}ms"
+            )
+        for name, values in sizes.items():
+            values.sort()
+            self.stdout.write(
+                f"{name} size: median {percentile(values, 50) / 1024:.1f}KB, "
+                f"max {values[-1] / 1024:.1f}KB"
+            )
+
+    def run(self, report_class, invoices):
+        stages, sizes = {}, {}
+        for invoice in invoices:
+            report = report_class(invoice=invoice)
+            start = time.perf_counter()
+            report.render()
+            elapsed = time.perf_counter() - start
+            for stage, seconds in report.timer.stages.items():
+                stages.setdefault(stage, []).append(seconds)
+            stages.setdefault("total", []).append(elapsed)
+            for name, size in report.timer.sizes.items():
+                sizes.setdefault(name, []).append(size)
+        return stages, sizes
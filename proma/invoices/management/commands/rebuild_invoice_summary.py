@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from proma.invoices import summary
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Compute the invoices summary again from all the invoices and report "
+        "the difference with the stored totals"
+    )
+
+    def handle(self, *args, **options):
+        drift = summary.rebuild()
+        for (currency, bucket), amount in sorted(drift.items()):
+            self.stdout.write(f"{currency} {bucket}: off by {amount:+}")
+        if drift:
+            self.stdout.write(f"Summary rebuilt, {len(drift)} totals had drifted")
+        else:
+            self.stdout.write("Summary rebuilt, no drift found")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from proma.invoices import revenue
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Remove the stored revenue of the completed months and compute it "
+        "again from the paid invoices"
+    )
+
+    def handle(self, *args, **options):
+        months = revenue.rebuild()
+        self.stdout.write(f"Revenue rollups rebuilt, {months} months stored")
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_invoice_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='pdf',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='invoices/invoice/pdf/%Y/%m/%d/', verbose_name='PDF'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='pdf_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_invoice_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='last_reminder_date',
+            field=models.DateField(editable=False, null=True, verbose_name='Last reminder date'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')  # NOQA
+    InvoiceCounter = apps.get_model('invoices', 'InvoiceCounter')  # NOQA
+    # the numbers are the year followed by the counter, e.g. 201800012
+    counters = {}
+    numbers = Invoice.objects.exclude(status='DRAFT').values_list('number', flat=True)
+    for number in numbers.iterator():
+        if len(number) > 4 and number.isdigit():
+            year, value = int(number[:4]), int(number[4:])
+            counters[year] = max(counters.get(year, 0), value)
+    InvoiceCounter.objects.bulk_create(
+        InvoiceCounter(year=year, value=value) for year, value in counters.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_invoice_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceCounter',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Year')),
+                ('value', models.PositiveIntegerField(default=0, verbose_name='Value')),
+            ],
+            options={
+                'verbose_name': 'Invoice counter',
+                'verbose_name_plural': 'Invoice counters',
+            },
+        ),
+        migrations.RunPython(populate_counters, reverse_code=migrations.RunPython.noop),
+    ]
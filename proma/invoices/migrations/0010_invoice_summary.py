@@ -0,0 +1,64 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:49
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.utils.timezone
+import model_utils.fields
+
+
+def populate_summary(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')  # NOQA
+    InvoiceSummary = apps.get_model('invoices', 'InvoiceSummary')  # NOQA
+    today = django.utils.timezone.now().date()
+    Invoice.objects.filter(status='OPEN', due_date__lt=today).update(is_overdue=True)
+    buckets = {'DRAFT': 'draft', 'PAID': 'paid'}
+    rows = {}
+    totals = (
+        Invoice.objects.exclude(status='CANCELLED')
+        .order_by()
+        .values('currency', 'status', 'is_overdue')
+        .annotate(amount=Sum('total'))
+    )
+    for total in totals:
+        if total['status'] == 'OPEN':
+            bucket = 'overdue' if total['is_overdue'] else 'open'
+        else:
+            bucket = buckets[total['status']]
+        amounts = rows.setdefault(total['currency'], {})
+        amounts[bucket] = amounts.get(bucket, 0) + total['amount']
+    InvoiceSummary.objects.bulk_create(
+        InvoiceSummary(currency=currency, **amounts) for currency, amounts in rows.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0009_invoice_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('currency', models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('PEN', 'PEN')], max_length=5, unique=True, verbose_name='Currency')),
+                ('draft', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Draft')),
+                ('open', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Open')),
+                ('overdue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Overdue')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Paid')),
+            ],
+            options={
+                'verbose_name': 'Invoice summary',
+                'verbose_name_plural': 'Invoice summaries',
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='is_overdue',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Is overdue?'),
+        ),
+        migrations.RunPython(populate_summary, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0010_invoice_summary'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='invoice',
+            options={'default_related_name': 'invoices', 'verbose_name': 'Invoice', 'verbose_name_plural': 'Invoices'},
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-issue_date'], name='invoice_issue_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('is_overdue', False), ('status', 'OPEN')), fields=['due_date'], name='invoice_pending_due_idx'),
+        ),
+    ]
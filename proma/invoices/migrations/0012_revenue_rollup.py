@@ -0,0 +1,58 @@
+# Generated by Django 3.2.19 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0002_auto_20180322_1807'),
+        ('projects', '0007_indexes'),
+        ('invoices', '0011_invoice_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='Month')),
+                ('currency', models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('PEN', 'PEN')], max_length=5, verbose_name='Currency')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Amount')),
+                ('invoice_count', models.PositiveIntegerField(verbose_name='Invoice count')),
+            ],
+            options={
+                'verbose_name': 'Revenue rollup',
+                'verbose_name_plural': 'Revenue rollups',
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueRollupMonth',
+            fields=[
+                ('month', models.DateField(primary_key=True, serialize=False, verbose_name='Month')),
+            ],
+            options={
+                'verbose_name': 'Revenue rollup month',
+                'verbose_name_plural': 'Revenue rollup months',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'PAID')), fields=['payment_date'], name='invoice_payment_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='revenuerollup',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clients.client'),
+        ),
+        migrations.AddField(
+            model_name='revenuerollup',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='projects.project'),
+        ),
+        migrations.AddConstraint(
+            model_name='revenuerollup',
+            constraint=models.UniqueConstraint(fields=('month', 'client', 'project', 'currency'), name='revenue_rollup_unique'),
+        ),
+    ]
@@ -1,20 +1,23 @@
 import secrets
 from decimal import Decimal
-from functools import reduce
 
 from dateutil.relativedelta import relativedelta
+from django.core.files.base import ContentFile
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import Q, Sum
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from model_utils.models import TimeStampedModel
 
+from proma.common.cache import pdf_cache
 from proma.enums import Currency
 
+from . import revenue, summary
 from .exceptions import InvoiceException
-from .querysets import InvoiceQuerySet
+from .querysets import InvoiceQuerySet, ItemQuerySet
 
 
 def default_due_date():
@@ -59,6 +62,12 @@ class Invoice(TimeStampedModel):
 
     opening_date = models.DateField(_("Opening date"), null=True, editable=False)
     payment_date = models.DateField(_("Payment date"), null=True, editable=False)
+    # set when the invoice is saved or by the daily mark_overdue_invoices task,
+    # it places the invoice in the overdue column of the summary
+    is_overdue = models.BooleanField(_("Is overdue?"), default=False, editable=False)
+    last_reminder_date = models.DateField(
+        _("Last reminder date"), null=True, editable=False
+    )
     cancellation_date = models.DateField(
         _("Cancellation date"), null=True, editable=False
     )
@@ -92,6 +101,16 @@ class Invoice(TimeStampedModel):
         null=True,
     )
 
+    # last rendered PDF file and the cache key of the state it was rendered with
+    pdf = models.FileField(
+        _("PDF"),
+        upload_to="invoices/invoice/pdf/%Y/%m/%d/",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    pdf_key = models.CharField(max_length=64, blank=True, null=True, editable=False)
+
     notes = models.TextField(_("Notes"), blank=True, null=True)
     payment_notes = models.TextField(_("Payment notes"), blank=True, null=True)
 
@@ -105,7 +124,25 @@ class Invoice(TimeStampedModel):
         verbose_name = _("Invoice")
         verbose_name_plural = _("Invoices")
         default_related_name = "invoices"
-        ordering = ("number",)
+        indexes = [
+            # overdue invoices lookup
+            models.Index(fields=["status", "due_date"], name="invoice_status_due_idx"),
+            # latest invoices of the dashboard and invoices of the month
+            models.Index(fields=["-issue_date"], name="invoice_issue_date_idx"),
+            # open invoices that are not overdue yet, only these are checked
+            # every night by the mark_overdue_invoices task
+            models.Index(
+                fields=["due_date"],
+                name="invoice_pending_due_idx",
+                condition=models.Q(status="OPEN", is_overdue=False),
+            ),
+            # revenue of the current month, the completed ones are rolled up
+            models.Index(
+                fields=["payment_date"],
+                name="invoice_payment_date_idx",
+                condition=models.Q(status="PAID"),
+            ),
+        ]
 
     def __str__(self):
         if self.status == self.DRAFT:
@@ -113,6 +150,58 @@ class Invoice(TimeStampedModel):
         else:
             return f"#{self.number}"
 
+    def save(self, *args, **kwargs):
+        due_date = self._meta.get_field("due_date").to_python(self.due_date)
+        self.is_overdue = self.status == self.OPEN and due_date < timezone.now().date()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "is_overdue"}
+        changes = {}
+        paid_before = None
+        with transaction.atomic():
+            if not self._state.adding:
+                saved = (
+                    Invoice.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list(
+                        "currency",
+                        "status",
+                        "is_overdue",
+                        "total",
+                        "client",
+                        "project",
+                        "payment_date",
+                    )
+                    .first()
+                )
+                if saved is not None:
+                    currency, status, is_overdue, total, *paid = saved
+                    summary.add_change(changes, currency, status, is_overdue, -total)
+                    if status == self.PAID:
+                        paid_before = (*paid, currency, total)
+            super().save(*args, **kwargs)
+            summary.add_change(
+                changes, self.currency, self.status, self.is_overdue, self.total
+            )
+            summary.apply_changes(changes)
+            # the revenue of a completed month changed, e.g. from the admin
+            paid_after = self._get_paid_state()
+            if paid_before != paid_after:
+                revenue.invalidate(
+                    state[2] for state in (paid_before, paid_after) if state is not None
+                )
+
+    def _get_paid_state(self):
+        if self.status != self.PAID:
+            return None
+        payment_date = self._meta.get_field("payment_date").to_python(self.payment_date)
+        return (
+            self.client_id,
+            self.project_id,
+            payment_date,
+            self.currency,
+            Decimal(self.total),
+        )
+
     def open(self):
         if self.status != self.DRAFT:
             raise InvoiceException("Invalid status")
@@ -121,6 +210,7 @@ class Invoice(TimeStampedModel):
         self.opening_date = timezone.now()
         self.status = self.OPEN
         self._compute_number()
+        self.invalidate_pdf_cache()
 
     def pay(self, notes=None):
         if self.status != self.OPEN:
@@ -129,17 +219,39 @@ class Invoice(TimeStampedModel):
         if notes is not None:
             self.payment_notes = notes
         self.status = self.PAID
+        self.invalidate_pdf_cache()
 
     def cancel(self):
         if self.status != self.OPEN:
             raise InvoiceException("Invalid status")
         self.cancellation_date = timezone.now()
         self.status = self.CANCELLED
+        self.invalidate_pdf_cache()
 
     @property
     def can_be_edited(self):
         return self.status == self.DRAFT
 
+    @property
+    def pdf_cache_namespace(self):
+        return f"invoice-{self.pk}"
+
+    def invalidate_pdf_cache(self):
+        if self.pk is not None:
+            pdf_cache.invalidate(self.pdf_cache_namespace)
+
+    def save_pdf(self, content, key):
+        """
+        Store the rendered PDF file without touching the modified date, so
+        the cache key it was rendered with stays valid
+        """
+        previous_name = self.pdf.name
+        self.pdf.save(f"{self.number}.pdf", ContentFile(content), save=False)
+        self.pdf_key = key
+        Invoice.objects.filter(pk=self.pk).update(pdf=self.pdf.name, pdf_key=key)
+        if previous_name:
+            self.pdf.storage.delete(previous_name)
+
     def _compute_number(self):
         if self.status == self.DRAFT:
             return
@@ -148,68 +260,218 @@ class Invoice(TimeStampedModel):
     @classmethod
     def compute_next_number(cls):
         """
-        Compute invoice number using the current year and a counter based
-        in the number of invoices created
+        Compute invoice number using the year the invoice is opened and the
+        counter of that year
         """
-        # FIXME: there is a bug when the invoice was created in a different year
-        # than it is opened
-        now = timezone.now()
-        counter = (
-            cls.objects.exclude(status=cls.DRAFT)
-            .filter(issue_date__year__gte=now.year, issue_date__year__lt=now.year + 1)
-            .count()
-            + 1
-        )
-        # TODO: Add more tests for this method
-        return f"{now.year}{str(counter).zfill(5)}"
+        year = timezone.now().year
+        return cls.format_number(year, InvoiceCounter.next_value(year))
+
+    @staticmethod
+    def format_number(year, counter):
+        return f"{year}{str(counter).zfill(5)}"
 
     def compute_amounts(self):
-        self.subtotal = reduce(
-            lambda acc, item: acc + item.total, self.items.all(), Decimal(0)
-        )
+        """
+        Compute the amounts from the sum of the items, used when the tax
+        changes, the items keep the saved amounts up to date on their own
+        """
+        previous_amounts = (self.subtotal, self.tax_total, self.total)
+        subtotal = self.items.aggregate(subtotal=Sum("total"))["subtotal"]
+        self.subtotal = subtotal or Decimal(0)
         if self.tax_percent is None:
             self.tax_total = Decimal(0)
         else:
             self.tax_total = self.subtotal * (self.tax_percent / Decimal(100))
         self.total = self.subtotal + self.tax_total
+        if (self.subtotal, self.tax_total, self.total) != previous_amounts:
+            self.invalidate_pdf_cache()
 
     @classmethod
     def summary(cls):
-        today = timezone.now()
-        totals = cls.objects.aggregate(
-            overdue=Coalesce(
-                Sum("total", filter=Q(due_date__lte=today, status=cls.OPEN)),
-                0,
-                output_field=models.DecimalField(),
-            ),
-            draft=Coalesce(
-                Sum("total", filter=Q(status=cls.DRAFT)),
-                0,
-                output_field=models.DecimalField(),
-            ),
-        )
-        totals["total_outstanding"] = totals["overdue"] + totals["draft"]
-        return totals
+        return InvoiceSummary.objects.order_by("currency")
 
     @classmethod
     def create_from_project_flat(cls, project, description, amount):
-        invoice = cls.objects.create(
-            client=project.client, project=project, currency=project.currency
-        )
-        invoice.items.create(rate=amount, units=1, description=description)
-        invoice.compute_amounts()
-        invoice.save()
-        return invoice
+        return cls.create_from_projects([(project, description, amount, 1)])[0]
 
     @classmethod
     def create_from_project_rate(cls, project, description, rate, units):
-        invoice = cls.objects.create(
-            client=project.client, project=project, currency=project.currency
-        )
-        invoice.items.create(rate=rate, units=units, description=description)
-        invoice.compute_amounts()
-        invoice.save()
-        return invoice
+        return cls.create_from_projects([(project, description, rate, units)])[0]
+
+    @classmethod
+    def create_from_projects(cls, entries):
+        """
+        Create a draft invoice with a single item for every (project,
+        description, rate, units) entry in a constant number of queries, the
+        amounts are computed before the rows are inserted
+        """
+        invoices, items = [], []
+        for project, description, rate, units in entries:
+            item = Item(description=description, rate=rate, units=units)
+            item._compute_total()
+            items.append(item)
+            invoices.append(
+                cls(
+                    client_id=project.client_id,
+                    project=project,
+                    currency=project.currency,
+                    subtotal=item.total,
+                    total=item.total,
+                )
+            )
+        with transaction.atomic():
+            cls.objects.bulk_create(invoices)
+            changes = {}
+            for invoice in invoices:
+                summary.add_change(
+                    changes, invoice.currency, invoice.status, False, invoice.total
+                )
+            summary.apply_changes(changes)
+            if invoices and invoices[0].pk is None:
+                # the database didn't return the ids of the new rows
+                ids = dict(
+                    cls.objects.filter(
+                        token__in=[invoice.token for invoice in invoices]
+                    ).values_list("token", "id")
+                )
+                for invoice in invoices:
+                    invoice.pk = ids[invoice.token]
+            for invoice, item in zip(invoices, items):
+                item.invoice = invoice
+            Item.objects.bulk_create(items, update_amounts=False)
+        return invoices
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_from_summary(sender, instance, **kwargs):
+    # also called for the invoices deleted in cascade with their project
+    changes = {}
+    summary.add_change(
+        changes,
+        instance.currency,
+        instance.status,
+        instance.is_overdue,
+        -instance.total,
+    )
+    summary.apply_changes(changes)
+    paid = instance._get_paid_state()
+    if paid is not None:
+        revenue.invalidate([paid[2]])
+
+
+class InvoiceSummary(TimeStampedModel):
+    """
+    Totals of the invoices by status of every currency, kept up to date by
+    the writes of the invoices so the dashboard doesn't aggregate them
+    """
+
+    currency = models.CharField(
+        _("Currency"),
+        max_length=5,
+        choices=[(currency.name, currency.value) for currency in Currency],
+        unique=True,
+    )
+    draft = models.DecimalField(_("Draft"), max_digits=14, decimal_places=2, default=0)
+    open = models.DecimalField(_("Open"), max_digits=14, decimal_places=2, default=0)
+    overdue = models.DecimalField(
+        _("Overdue"), max_digits=14, decimal_places=2, default=0
+    )
+    paid = models.DecimalField(_("Paid"), max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Invoice summary")
+        verbose_name_plural = _("Invoice summaries")
+
+    def __str__(self):
+        return self.currency
+
+    @property
+    def total_outstanding(self):
+        return self.overdue + self.draft
+
+
+class InvoiceCounter(models.Model):
+    """
+    Last invoice number of every year, the row is locked until the
+    transaction that took a number ends, so two invoices never get the same
+    number and a rolled back invoice gives its number back
+    """
+
+    year = models.PositiveIntegerField(_("Year"), primary_key=True)
+    value = models.PositiveIntegerField(_("Value"), default=0)
+
+    class Meta:
+        verbose_name = _("Invoice counter")
+        verbose_name_plural = _("Invoice counters")
+
+    def __str__(self):
+        return f"{self.year}: {self.value}"
+
+    @classmethod
+    def next_value(cls, year):
+        return cls.reserve(year, 1)
+
+    @classmethod
+    def reserve(cls, year, count):
+        """
+        Take a contiguous block of `count` numbers and return the first one
+        """
+        with transaction.atomic():
+            counter, created = cls.objects.select_for_update().get_or_create(year=year)
+            counter.value += count
+            counter.save(update_fields=["value"])
+        return counter.value - count + 1
+
+
+class RevenueRollupMonth(models.Model):
+    """
+    Completed month whose revenue is stored in the rollups, the months
+    without revenue have no rollups but they're marked too
+    """
+
+    month = models.DateField(_("Month"), primary_key=True)
+
+    class Meta:
+        verbose_name = _("Revenue rollup month")
+        verbose_name_plural = _("Revenue rollup months")
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}"
+
+
+class RevenueRollup(models.Model):
+    """
+    Revenue of the invoices paid in a completed month by client, project
+    and currency, see proma.invoices.revenue
+    """
+
+    month = models.DateField(_("Month"), db_index=True)
+    client = models.ForeignKey(
+        "clients.Client", on_delete=models.CASCADE, related_name="+"
+    )
+    project = models.ForeignKey(
+        "projects.Project", on_delete=models.CASCADE, related_name="+"
+    )
+    currency = models.CharField(
+        _("Currency"),
+        max_length=5,
+        choices=[(currency.name, currency.value) for currency in Currency],
+    )
+    amount = models.DecimalField(_("Amount"), max_digits=14, decimal_places=2)
+    invoice_count = models.PositiveIntegerField(_("Invoice count"))
+
+    class Meta:
+        verbose_name = _("Revenue rollup")
+        verbose_name_plural = _("Revenue rollups")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["month", "client", "project", "currency"],
+                name="revenue_rollup_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.currency}: {self.amount}"
 
 
 class Item(TimeStampedModel):
@@ -228,12 +490,44 @@ class Item(TimeStampedModel):
         verbose_name_plural = _("Item")
         default_related_name = "items"
 
+    objects = ItemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.description}: {self.total}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        item._saved = (item.__dict__.get("invoice_id"), item.__dict__.get("total"))
+        return item
+
     def save(self, *args, **kwargs):
         self._compute_total()
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        invoice_id, total = getattr(self, "_saved", (None, None))
+        if invoice_id is not None and invoice_id != self.invoice_id:
+            Invoice.objects.filter(id=invoice_id).add_to_subtotal(-total)
+            total = None
+        self._add_to_invoice(self.total - (total or 0))
+        self._saved = (self.invoice_id, self.total)
+        return result
+
+    def delete(self, *args, **kwargs):
+        invoice_id, total = getattr(self, "_saved", (None, self.total))
+        result = super().delete(*args, **kwargs)
+        self._add_to_invoice(-(total or 0))
+        return result
+
+    def _add_to_invoice(self, amount):
+        """
+        Apply the change of the item total to the amounts of its invoice,
+        the loaded invoice of the item is refreshed with the saved amounts
+        """
+        Invoice.objects.filter(id=self.invoice_id).add_to_subtotal(amount)
+        if Item.invoice.is_cached(self):
+            self.invoice.refresh_from_db(
+                fields=["subtotal", "tax_total", "total", "modified"]
+            )
 
     def _compute_total(self):
         self.total = self.rate * self.units
@@ -1,4 +1,42 @@
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import summary
+from .exceptions import InvoiceException
+
+
+# (name, first, last) days past the due date of the aging report buckets
+AGING_BUCKETS = (
+    ("current", None, 0),
+    ("days_1_30", 1, 30),
+    ("days_31_60", 31, 60),
+    ("days_61_90", 61, 90),
+    ("days_over_90", 91, None),
+)
+
+
+def _amounts(subtotal):
+    subtotal = models.ExpressionWrapper(subtotal, output_field=models.DecimalField())
+    # multiplied by a decimal, SQLite divides integer values as integers
+    tax_total = models.ExpressionWrapper(
+        subtotal
+        * Coalesce(F("tax_percent"), Value(Decimal(0)))
+        * Value(Decimal("0.01")),
+        output_field=models.DecimalField(),
+    )
+    return {
+        "subtotal": subtotal,
+        "tax_total": tax_total,
+        "total": subtotal + tax_total,
+        # the PDF cache key and the etag depend on the modified date
+        "modified": timezone.now(),
+    }
 
 
 class InvoiceQuerySet(models.QuerySet):
@@ -13,3 +51,217 @@ class InvoiceQuerySet(models.QuerySet):
 
     def non_draft(self):
         return self.exclude(status="DRAFT")
+
+    def overdue(self, date=None):
+        if date is None:
+            date = timezone.now().date()
+        return self.open().filter(due_date__lt=date)
+
+    def pending_reminder(self, interval, date=None):
+        """
+        Overdue invoices that weren't reminded in the last `interval` days
+        """
+        if date is None:
+            date = timezone.now().date()
+        return self.overdue(date).filter(
+            Q(last_reminder_date=None)
+            | Q(last_reminder_date__lte=date - timedelta(days=interval))
+        )
+
+    def aging(self, date=None):
+        """
+        Amounts of the open invoices by client and currency in every aging
+        bucket, computed in a single GROUP BY query
+        """
+        if date is None:
+            date = timezone.now().date()
+        buckets = {}
+        for name, first, last in AGING_BUCKETS:
+            condition = Q()
+            if first is not None:
+                condition &= Q(due_date__lte=date - timedelta(days=first))
+            if last is not None:
+                condition &= Q(due_date__gte=date - timedelta(days=last))
+            buckets[name] = Coalesce(Sum("total", filter=condition), Value(Decimal(0)))
+        return (
+            self.open()
+            .order_by()
+            .values("client", "client__name", "currency")
+            .annotate(outstanding=Sum("total"), **buckets)
+            .order_by("client__name", "currency")
+        )
+
+    def _lock(self, status):
+        """
+        Lock the invoices and check that all of them are in the given
+        status, return their ids
+        """
+        ids = list(self.select_for_update().order_by("id").values_list("id", "status"))
+        if any(invoice_status != status for _, invoice_status in ids):
+            raise InvoiceException("Invalid status")
+        return [invoice_id for invoice_id, _ in ids]
+
+    def _transition(self, ids, **values):
+        if ids:
+            self.model.objects.filter(id__in=ids).update_with_summary(
+                modified=timezone.now(), **values
+            )
+            for invoice_id in ids:
+                self.model(pk=invoice_id).invalidate_pdf_cache()
+        return ids
+
+    def open_all(self):
+        """
+        Open the draft invoices in a single UPDATE, they get a contiguous
+        block of numbers in the order of their ids, return their ids
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            ids = self._lock("DRAFT")
+            if self.model.objects.filter(id__in=ids, items__isnull=True).exists():
+                raise InvoiceException(
+                    "The invoice must has at least 1 item to be opened"
+                )
+            if not ids:
+                return ids
+            first = apps.get_model("invoices", "InvoiceCounter").reserve(
+                now.year, len(ids)
+            )
+            numbers = [
+                When(
+                    id=invoice_id, then=Value(self.model.format_number(now.year, value))
+                )
+                for value, invoice_id in enumerate(ids, start=first)
+            ]
+            return self._transition(
+                ids,
+                status="OPEN",
+                opening_date=now.date(),
+                number=Case(*numbers, output_field=models.CharField()),
+                is_overdue=Case(
+                    When(due_date__lt=now.date(), then=Value(True)),
+                    default=Value(False),
+                    output_field=models.BooleanField(),
+                ),
+            )
+
+    def pay_all(self, notes=None):
+        """
+        Pay the open invoices in a single UPDATE, return their ids
+        """
+        values = {"payment_date": timezone.now().date()}
+        if notes is not None:
+            values["payment_notes"] = notes
+        with transaction.atomic():
+            return self._transition(
+                self._lock("OPEN"), status="PAID", is_overdue=False, **values
+            )
+
+    def cancel_all(self):
+        """
+        Cancel the open invoices in a single UPDATE, return their ids
+        """
+        with transaction.atomic():
+            return self._transition(
+                self._lock("OPEN"),
+                status="CANCELLED",
+                cancellation_date=timezone.now().date(),
+                is_overdue=False,
+            )
+
+    def update_with_summary(self, **kwargs):
+        """
+        Update the invoices and apply the change of their amounts to the
+        invoices summary, the invoices are locked while it's computed
+        """
+        with transaction.atomic():
+            ids = list(self.select_for_update().values_list("id", flat=True))
+            invoices = self.model.objects.filter(id__in=ids)
+            before = summary.get_totals(invoices)
+            rows = invoices.update(**kwargs)
+            summary.apply_changes(
+                summary.get_changes(before, summary.get_totals(invoices))
+            )
+        return rows
+
+    def add_to_subtotal(self, amount):
+        """
+        Add the amount to the subtotal and update the taxes and the total in
+        a single UPDATE, without loading the items
+        """
+        return self.update_with_summary(**_amounts(F("subtotal") + Value(amount)))
+
+    def update_amounts(self):
+        """
+        Compute the amounts of the invoices again from the sum of their
+        items in a single UPDATE
+        """
+        items = (
+            self.model._meta.get_field("items")
+            .related_model.objects.filter(invoice=OuterRef("pk"))
+            .order_by()
+            .values("invoice")
+            .annotate(subtotal=Sum("total"))
+            .values("subtotal")
+        )
+        return self.update_with_summary(
+            **_amounts(
+                Coalesce(
+                    Subquery(items, output_field=models.DecimalField()),
+                    Value(Decimal(0)),
+                )
+            )
+        )
+
+
+class ItemQuerySet(models.QuerySet):
+    """
+    Keep the amounts of the invoices up to date on bulk writes of items,
+    bulk_create(update_amounts=False) skips it when the invoices were
+    created with their amounts
+    """
+
+    def _update_invoices(self, invoice_ids):
+        invoice_model = self.model._meta.get_field("invoice").related_model
+        invoice_model.objects.filter(id__in=invoice_ids).update_amounts()
+
+    def bulk_create(self, objs, *args, update_amounts=True, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj._compute_total()
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if update_amounts:
+            self._update_invoices({obj.invoice_id for obj in objs})
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if "rate" in fields or "units" in fields:
+            for obj in objs:
+                obj._compute_total()
+            fields.append("total")
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        self._update_invoices({obj.invoice_id for obj in objs})
+        return result
+
+    def update(self, **kwargs):
+        if "rate" in kwargs or "units" in kwargs:
+            # the columns of the expression hold the values before the update
+            kwargs["total"] = models.ExpressionWrapper(
+                kwargs.get("rate", F("rate")) * kwargs.get("units", F("units")),
+                output_field=models.DecimalField(),
+            )
+        invoice_ids = set(self.values_list("invoice_id", flat=True))
+        rows = super().update(**kwargs)
+        invoice = kwargs.get("invoice", kwargs.get("invoice_id"))
+        if invoice is not None:
+            invoice_ids.add(getattr(invoice, "pk", invoice))
+        self._update_invoices(invoice_ids)
+        return rows
+
+    def delete(self):
+        invoice_ids = set(self.values_list("invoice_id", flat=True))
+        result = super().delete()
+        self._update_invoices(invoice_ids)
+        return result
@@ -1,24 +1,344 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from django.conf import settings
+from django.db import connections
+from django.utils import formats
+from django.utils.html import escape
+from django.utils.translation import ugettext as _
+
+from proma.common.renderers import load_renderer
 from proma.common.utils import PDFReport
 from proma.config.models import Configuration
 
+from .models import Invoice
+
+
+logger = logging.getLogger(__name__)
+
 
 class InvoicePDF(PDFReport):
 
     template_name = "pdf/invoice.html"
     bootstrap_styles = True
 
-    def __init__(self, invoice, *args, **kwargs):
+    def __init__(self, invoice, *args, config=None, **kwargs):
         self.invoice = invoice
+        self._config = config
         super().__init__(*args, **kwargs)
 
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = Configuration.get_instance()
+        return self._config
+
     def get_filename(self):
         return f"{self.invoice.number}.pdf"
 
     def get_context(self):
-        config = Configuration.get_instance()
         return {
             "invoice": self.invoice,
             "currency": self.invoice.currency,
-            "company": config.get_info("company"),
-            "logo_path": config.get_company_logo_path(),
+            "company": self.config.get_info("company"),
+            "logo_path": self.config.get_company_logo_path(),
         }
+
+    def get_cache_namespace(self):
+        return self.invoice.pdf_cache_namespace
+
+    def is_stored(self, key=None):
+        """
+        Return True when the file stored in the invoice is up to date
+        """
+        if key is None:
+            key = self.get_cache_key()
+        pdf = self.invoice.pdf
+        return (
+            bool(pdf) and self.invoice.pdf_key == key and pdf.storage.exists(pdf.name)
+        )
+
+    def _get_cached(self, key):
+        # the file rendered in background for the invoice is used first
+        if key is not None and self.is_stored(key):
+            with self.invoice.pdf.open("rb") as f:
+                return f.read()
+        return super()._get_cached(key)
+
+    def get_cache_key(self):
+        """
+        Hash everything printed in the PDF: the invoice state, its items,
+        the client and the company information
+        """
+        invoice = self.invoice
+        state = {
+            "invoice": [
+                invoice.number,
+                invoice.status,
+                invoice.currency,
+                invoice.issue_date,
+                invoice.due_date,
+                invoice.subtotal,
+                invoice.tax_total,
+                invoice.total,
+                invoice.notes,
+                invoice.modified,
+            ],
+            "items": list(
+                invoice.items.order_by("id").values_list(
+                    "id", "description", "units", "rate", "total"
+                )
+            ),
+            "client": invoice.client.modified,
+            "company": self.config.get_info("company"),
+            "config": self.config.modified,
+            "backend": settings.PDF_BACKEND,
+        }
+        data = json.dumps(state, default=str, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get_flowables(self, styles, width):
+        """
+        Draw the same layout of the html template with reportlab
+        """
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_RIGHT
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.platypus import Image, Paragraph, Spacer, Table, TableStyle
+
+        invoice = self.invoice
+        client = invoice.client
+        company = self.config.get_info("company")
+        currency = invoice.currency
+        normal, heading = styles["Normal"], styles["Heading4"]
+        # the html template places the right column 300pt from the left
+        left_width, right_width = 300, width - 300
+
+        def lines(*values):
+            return "<br/>".join(escape(str(value)) for value in values if value)
+
+        def text(value, style=normal, align=None):
+            if align is not None:
+                style = ParagraphStyle(f"{style.name}-{align}", style, alignment=align)
+            return Paragraph(value, style)
+
+        def box(content, width):
+            table = Table([[content]], colWidths=[width - 20])
+            table.setStyle(
+                TableStyle(
+                    [
+                        ("BOX", (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                        ("TOPPADDING", (0, 0), (-1, -1), 8),
+                        ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
+                    ]
+                )
+            )
+            return table
+
+        logo_path = self.config.get_company_logo_path()
+        logo = (
+            Image(logo_path, width=250, height=100, kind="bound") if logo_path else ""
+        )
+        header = text(
+            f"<b>{_('Issue date')}:</b> {formats.date_format(invoice.issue_date)}<br/>"
+            f"<b>{_('Due date')}:</b> {formats.date_format(invoice.due_date)}<br/>"
+            f"<b>{_('Invoice')}:</b> #{escape(invoice.number)}"
+        )
+        company_block = text(
+            f"<b>{escape(company['legal_name'] or '')}</b><br/>"
+            + lines(
+                company["address"],
+                company["city"],
+                company["state"],
+                company["zipcode"],
+                company["country"],
+                company["phone"],
+                company["email"],
+            )
+        )
+        client_block = text(
+            f"<b>{escape(client.name)}</b> {escape(client.tax_identifier or '')}<br/>"
+            + lines(
+                client.address,
+                client.city,
+                client.state,
+                client.zipcode,
+                client.country,
+                client.phone,
+                client.email,
+            )
+        )
+        details = Table(
+            [
+                [logo, header],
+                [
+                    text(f"{_('Business Details')}:", heading),
+                    text(f"{_('Customer Details')}:", heading),
+                ],
+                [box(company_block, left_width), box(client_block, right_width)],
+            ],
+            colWidths=[left_width, right_width],
+        )
+        details.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+
+        rows = [
+            [
+                "#",
+                text(_("Description")),
+                text(_("Quantity"), align=TA_RIGHT),
+                text(f"{_('Unit price')} ({currency})", align=TA_RIGHT),
+                text(f"{_('Total')} ({currency})", align=TA_RIGHT),
+            ]
+        ]
+        for index, item in enumerate(invoice.items.all(), start=1):
+            rows.append(
+                [
+                    index,
+                    text(escape(item.description)),
+                    formats.localize(item.units),
+                    formats.localize(item.rate),
+                    formats.localize(item.total),
+                ]
+            )
+        items = Table(rows, colWidths=[25, None, 70, 100, 100], repeatRows=1)
+        items.setStyle(
+            TableStyle(
+                [
+                    ("GRID", (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                    ("ALIGN", (2, 1), (-1, -1), "RIGHT"),
+                    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ]
+            )
+        )
+
+        totals = Table(
+            [
+                [
+                    text(f"<b>{_('Subtotal')} ({currency})</b>"),
+                    formats.localize(invoice.subtotal),
+                ],
+                [
+                    text(f"<b>{_('Taxes')} ({currency})</b>"),
+                    formats.localize(invoice.tax_total),
+                ],
+                [
+                    text(f"<b>{_('TOTAL')} ({currency})</b>"),
+                    text(f"<b>{formats.localize(invoice.total)}</b>", align=TA_RIGHT),
+                ],
+            ],
+            colWidths=[120, None],
+        )
+        totals.setStyle(
+            TableStyle(
+                [
+                    ("GRID", (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                    ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+                ]
+            )
+        )
+        notes = ""
+        if invoice.notes:
+            notes = [
+                text(f"{_('Notes')}:", heading),
+                box(text(escape(invoice.notes)), left_width),
+            ]
+        footer = Table(
+            [[notes, [text(f"{_('Total')}:", heading), totals]]],
+            colWidths=[left_width, right_width],
+        )
+        footer.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+
+        return [
+            details,
+            Spacer(0, 12),
+            text(f"{_('Items')}:", heading),
+            items,
+            Spacer(0, 12),
+            footer,
+        ]
+
+    def get_etag(self):
+        # the document changes with everything in the cache key, e.g. the
+        # backend, not only with the modified dates
+        return self.get_cache_key()
+
+    def get_last_modified(self):
+        return max(
+            self.invoice.modified, self.invoice.client.modified, self.config.modified
+        )
+
+
+def _init_worker():
+    # the forked process must not drive the renderer processes of its parent
+    load_renderer.cache_clear()
+    for connection in connections.all():
+        if connection.vendor == "postgresql" and connection.connection is not None:
+            # closing the connection sends a terminate message to the server
+            # through the socket shared with the parent, it's written to
+            # /dev/null instead and the parent keeps its session
+            devnull = os.open(os.devnull, os.O_RDWR)
+            os.dup2(devnull, connection.connection.fileno())
+            os.close(devnull)
+        connection.close()
+
+
+def _render_invoice(invoice_id):
+    invoice = Invoice.objects.select_related("client").get(id=invoice_id)
+    report = InvoicePDF(invoice=invoice)
+    return report.get_filename(), report.render()
+
+
+def iter_invoice_pdfs(invoices, workers):
+    """
+    Yield (filename, content) for every invoice in the queryset.
+
+    Cached documents are returned right away and the rest are rendered in a
+    pool of `workers` processes, at most two pending documents per worker
+    are kept in memory. Invoices that fail to render are listed in a last
+    errors.txt file. With no workers everything is rendered in this process.
+    """
+    config = Configuration.get_instance()
+    invoices = invoices.select_related("client").iterator()
+    errors = []
+    if not workers:
+        for invoice in invoices:
+            report = InvoicePDF(invoice=invoice, config=config)
+            try:
+                yield report.get_filename(), report.render()
+            except Exception:
+                logger.exception("Error rendering invoice:%d", invoice.id)
+                errors.append(invoice.id)
+    else:
+        yield from _iter_rendered_in_pool(invoices, config, workers, errors)
+    if errors:
+        lines = [f"Invoice {invoice_id} could not be rendered" for invoice_id in errors]
+        yield "errors.txt", "\n".join(lines).encode()
+
+
+def _iter_rendered_in_pool(invoices, config, workers, errors):
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            invoice_id = pending.pop(future)
+            try:
+                yield future.result()
+            except Exception:
+                logger.exception("Error rendering invoice:%d", invoice_id)
+                errors.append(invoice_id)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for invoice in invoices:
+            report = InvoicePDF(invoice=invoice, config=config)
+            content = report.get_cached()
+            if content is not None:
+                yield report.get_filename(), content
+                continue
+            pending[executor.submit(_render_invoice, invoice.id)] = invoice.id
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        yield from collect(as_completed(list(pending)))
@@ -0,0 +1,195 @@
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+FIELDS = ("month", "client", "client__name", "project", "project__name", "currency")
+
+
+def get_month(date):
+    return date.replace(day=1)
+
+
+def get_months(start, end):
+    """
+    Return the first day of every month from start to end, both included
+    """
+    months = []
+    month = get_month(start)
+    while month <= end:
+        months.append(month)
+        month += relativedelta(months=1)
+    return months
+
+
+def get_totals(invoices):
+    """
+    Return the revenue of the paid invoices by month of the payment date,
+    client, project and currency, computed in a single GROUP BY query
+    """
+    return (
+        invoices.paid()
+        .order_by()
+        .annotate(month=TruncMonth("payment_date"))
+        .values(*FIELDS)
+        .annotate(amount=Sum("total"), invoice_count=Count("id"))
+    )
+
+
+def rollup(months):
+    """
+    Store the revenue of the completed months that weren't rolled up yet,
+    the months are computed together in one query. The months marked first
+    by a concurrent rollup are left to it and the rest are tried again
+    """
+    RevenueRollupMonth = apps.get_model("invoices", "RevenueRollupMonth")  # NOQA
+    current = get_month(timezone.now().date())
+    months = {month for month in months if month < current}
+    # every conflict leaves one month at least to the concurrent rollup
+    attempts = len(months)
+    while months:
+        months -= set(
+            RevenueRollupMonth.objects.filter(month__in=months).values_list(
+                "month", flat=True
+            )
+        )
+        if not months:
+            return
+        try:
+            _store_rollups(months)
+            return
+        except IntegrityError:
+            # the failed insert waited until the concurrent rollup ended, so
+            # the months it marked are committed and excluded from the retry
+            attempts -= 1
+            if not attempts:
+                raise
+
+
+def _store_rollups(months):
+    Invoice = apps.get_model("invoices", "Invoice")  # NOQA
+    RevenueRollup = apps.get_model("invoices", "RevenueRollup")  # NOQA
+    RevenueRollupMonth = apps.get_model("invoices", "RevenueRollupMonth")  # NOQA
+    with transaction.atomic():
+        # a concurrent rollup of the same months waits here and fails, an
+        # invalidate() waits until this transaction ends and removes it
+        RevenueRollupMonth.objects.bulk_create(
+            RevenueRollupMonth(month=month) for month in months
+        )
+        # read once the months are marked, so the payments committed before
+        # are included and the ones committed after invalidate it
+        totals = get_totals(
+            Invoice.objects.filter(
+                payment_date__gte=min(months),
+                payment_date__lt=max(months) + relativedelta(months=1),
+            )
+        )
+        RevenueRollup.objects.bulk_create(
+            RevenueRollup(
+                month=total["month"],
+                client_id=total["client"],
+                project_id=total["project"],
+                currency=total["currency"],
+                amount=total["amount"],
+                invoice_count=total["invoice_count"],
+            )
+            for total in totals
+            if total["month"] in months
+        )
+
+
+def invalidate(months):
+    """
+    Remove the rollups of the months, they're computed again when needed,
+    the dates of the current month are ignored
+    """
+    RevenueRollup = apps.get_model("invoices", "RevenueRollup")  # NOQA
+    RevenueRollupMonth = apps.get_model("invoices", "RevenueRollupMonth")  # NOQA
+    current = get_month(timezone.now().date())
+    months = {get_month(date) for date in months if date and date < current}
+    if months:
+        with transaction.atomic():
+            # marking the months first waits for a rollup running on them to
+            # end, otherwise its uncommitted rollups wouldn't be removed
+            RevenueRollupMonth.objects.bulk_create(
+                (RevenueRollupMonth(month=month) for month in months),
+                ignore_conflicts=True,
+            )
+            RevenueRollupMonth.objects.filter(month__in=months).delete()
+            RevenueRollup.objects.filter(month__in=months).delete()
+
+
+def get_series(start, end=None, **filters):
+    """
+    Return the revenue by month, client, project and currency from the
+    month of start to the month of end, the current month by default. The
+    completed months are read from their rollups, only the current month
+    is aggregated from the invoices. The filters are applied to the client,
+    project and currency. There's no revenue before the first payment, so
+    the months before it are never rolled up
+    """
+    Invoice = apps.get_model("invoices", "Invoice")  # NOQA
+    RevenueRollup = apps.get_model("invoices", "RevenueRollup")  # NOQA
+    first = Invoice.objects.paid().aggregate(first=Min("payment_date"))["first"]
+    if first is None:
+        return []
+    current = get_month(timezone.now().date())
+    end = min(get_month(end or current), current)
+    months = get_months(max(get_month(start), get_month(first)), end)
+    rollup(months)
+    rows = list(
+        RevenueRollup.objects.filter(month__in=months, **filters)
+        .order_by()
+        .values(*FIELDS, "amount", "invoice_count")
+    )
+    if end == current:
+        invoices = Invoice.objects.filter(payment_date__gte=current, **filters)
+        rows.extend(get_totals(invoices))
+    rows.sort(key=lambda row: (row["month"], row["client__name"], row["project__name"]))
+    return [
+        dict(
+            client=row.pop("client"),
+            client_name=row.pop("client__name"),
+            project=row.pop("project"),
+            project_name=row.pop("project__name"),
+            **row,
+        )
+        for row in rows
+    ]
+
+
+def get_month_totals(rows):
+    """
+    Return the revenue of every month and currency of the series rows
+    """
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(
+            (row["month"], row["currency"]),
+            {"month": row["month"], "currency": row["currency"], "amount": Decimal(0)},
+        )
+        total["amount"] += row["amount"]
+    return [totals[key] for key in sorted(totals)]
+
+
+def rebuild():
+    """
+    Remove all the rollups and compute them again from the first payment,
+    return the number of rolled up months
+    """
+    Invoice = apps.get_model("invoices", "Invoice")  # NOQA
+    RevenueRollup = apps.get_model("invoices", "RevenueRollup")  # NOQA
+    RevenueRollupMonth = apps.get_model("invoices", "RevenueRollupMonth")  # NOQA
+    with transaction.atomic():
+        RevenueRollupMonth.objects.all().delete()
+        RevenueRollup.objects.all().delete()
+        first = Invoice.objects.paid().aggregate(first=Min("payment_date"))["first"]
+        if first is None:
+            return 0
+        rollup(get_months(first, timezone.now().date()))
+        return RevenueRollupMonth.objects.count()
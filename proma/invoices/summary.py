@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.utils import timezone
+
+
+BUCKETS = ("draft", "open", "overdue", "paid")
+
+
+def get_bucket(status, is_overdue):
+    """
+    Return the summary column of an invoice, the cancelled invoices aren't
+    added to the summary
+    """
+    if status == "DRAFT":
+        return "draft"
+    if status == "OPEN":
+        return "overdue" if is_overdue else "open"
+    if status == "PAID":
+        return "paid"
+    return None
+
+
+def add_change(changes, currency, status, is_overdue, amount):
+    bucket = get_bucket(status, is_overdue)
+    if bucket is not None and amount:
+        key = (currency, bucket)
+        changes[key] = changes.get(key, Decimal(0)) + amount
+
+
+def get_totals(invoices):
+    """
+    Return the summary amounts of the invoices as {(currency, bucket): amount}
+    computed in a single GROUP BY query
+    """
+    totals = {}
+    rows = (
+        invoices.order_by()
+        .values("currency", "status", "is_overdue")
+        .annotate(amount=Sum("total"))
+    )
+    for row in rows:
+        add_change(
+            totals, row["currency"], row["status"], row["is_overdue"], row["amount"]
+        )
+    return totals
+
+
+def get_changes(before, after):
+    changes = dict(after)
+    for key, amount in before.items():
+        changes[key] = changes.get(key, Decimal(0)) - amount
+    return changes
+
+
+def apply_changes(changes):
+    """
+    Add the {(currency, bucket): amount} changes to the summary rows with a
+    single UPDATE per currency.
+
+    Every write of an invoice or item takes the row lock of its currency
+    summary until the transaction is committed, so concurrent writes in the
+    same currency are serialized. The rows are updated in currency order so
+    two transactions touching the same currencies can't deadlock
+    """
+    InvoiceSummary = apps.get_model("invoices", "InvoiceSummary")  # NOQA
+    amounts = {}
+    for (currency, bucket), amount in changes.items():
+        if amount:
+            amounts.setdefault(currency, {})[bucket] = amount
+    for currency, buckets in sorted(amounts.items()):
+        values = {
+            bucket: F(bucket) + Value(amount) for bucket, amount in buckets.items()
+        }
+        rows = InvoiceSummary.objects.filter(currency=currency)
+        if not rows.update(modified=timezone.now(), **values):
+            InvoiceSummary.objects.get_or_create(currency=currency)
+            rows.update(modified=timezone.now(), **values)
+
+
+def rebuild():
+    """
+    Compute the summary again from all the invoices and replace the stored
+    rows, return the drift of the stored rows as {(currency, bucket): amount}
+    """
+    Invoice = apps.get_model("invoices", "Invoice")  # NOQA
+    InvoiceSummary = apps.get_model("invoices", "InvoiceSummary")  # NOQA
+    with transaction.atomic():
+        stored = {}
+        for summary in InvoiceSummary.objects.select_for_update().order_by("currency"):
+            for bucket in BUCKETS:
+                stored[(summary.currency, bucket)] = getattr(summary, bucket)
+        totals = get_totals(Invoice.objects.all())
+        drift = {
+            key: amount for key, amount in get_changes(totals, stored).items() if amount
+        }
+        rows = {}
+        for (currency, bucket), amount in totals.items():
+            rows.setdefault(currency, {})[bucket] = amount
+        InvoiceSummary.objects.all().delete()
+        InvoiceSummary.objects.bulk_create(
+            InvoiceSummary(currency=currency, **amounts)
+            for currency, amounts in rows.items()
+        )
+    return drift
@@ -1,26 +1,124 @@
+from celery import chain, group
 from celery.utils.log import get_task_logger
+from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 
 from config.celery import app
+from proma.common import coalesce, outbox
+from proma.common.exceptions import PDFRenderError
+from proma.common.tasks import release_coalesced
 from proma.common.utils import Email
 from proma.config.models import Configuration
 from proma.invoices.reports import InvoicePDF
 
+from . import revenue
 from .models import Invoice
 
 
 logger = get_task_logger(__name__)
 
 
+@app.task(
+    name="invoices.render_invoice_pdf",
+    autoretry_for=(PDFRenderError, OSError),
+    max_retries=3,
+    default_retry_delay=10,
+)
+def render_invoice_pdf(invoice_id):
+    """
+    Render the invoice PDF and store it in the invoice, it's only rendered
+    when the invoice or the company configuration changed. It runs in the
+    pdf queue
+    """
+    invoice = Invoice.objects.select_related("client").get(id=invoice_id)
+    report = InvoicePDF(invoice=invoice)
+    key = report.get_cache_key()
+    if invoice.pdf_key != key or not invoice.pdf:
+        invoice.save_pdf(report.render(), key)
+        logger.info("PDF rendered for invoice:%d", invoice_id)
+    return invoice_id
+
+
+def enqueue_invoice_pdf(invoice_id):
+    """
+    Enqueue the invoice PDF render in the outbox unless one for the same
+    invoice is pending, return whether it was enqueued. The render is
+    released once it finishes so a later change of the invoice is rendered
+    again
+    """
+    if coalesce.is_pending(render_invoice_pdf.name, invoice_id):
+        return False
+    render = chain(
+        render_invoice_pdf.si(invoice_id),
+        release_coalesced.si(render_invoice_pdf.name, invoice_id),
+    )
+    render.on_error(release_coalesced.si(render_invoice_pdf.name, invoice_id))
+    outbox.enqueue(render, coalesce_key=(render_invoice_pdf.name, invoice_id))
+    return True
+
+
+@app.task(name="invoices.refresh_invoice_pdfs")
+def refresh_invoice_pdfs():
+    """
+    Render again the stored PDF files, used after the company configuration
+    changes
+    """
+    invoice_ids = Invoice.objects.exclude(pdf_key=None).values_list("id", flat=True)
+    for invoice_id in invoice_ids.iterator():
+        render_invoice_pdf.delay(invoice_id)
+
+
+def get_invoice_email(invoice, config, template_name, subject):
+    """
+    Return the send_mail arguments of a notification with the invoice PDF
+    """
+    path = reverse("invoices:invoice-public-detail", kwargs={"token": invoice.token})
+    report = InvoicePDF(invoice=invoice, config=config)
+    return {
+        "template_name": template_name,
+        "context": {
+            "invoice": invoice,
+            "url": f"{settings.DOMAIN}{path}",
+            "config": config,
+        },
+        "subject": subject,
+        "to": [invoice.client.email],
+        "attachments": ((report.get_filename(), report.render(), "application/pdf"),),
+    }
+
+
+def get_open_invoice_email(invoice, config):
+    return get_invoice_email(
+        invoice,
+        config,
+        template_name="email/invoice_opened.html",
+        subject=_("New invoice #%s" % invoice.number),
+    )
+
+
+def get_open_invoice_notification(invoice_id):
+    """
+    Return the render and send stages of the open invoice notification, the
+    email attaches the PDF stored by the render stage and every stage is
+    retried on its own
+    """
+    return chain(render_invoice_pdf.si(invoice_id), notify_open_invoice.si(invoice_id))
+
+
 @app.task(
     name="invoices.notify_open_invoice",
-    retry_limit=3,
+    max_retries=3,
     default_retry_delay=10,
     bind=True,
+    ignore_result=True,
 )
 def notify_open_invoice(self, invoice_id):
+    """
+    Send the open invoice email, it runs in the email queue
+    """
     logger.info("Notification for invoice:%d", invoice_id)
     config = Configuration.get_instance()
 
@@ -29,21 +127,168 @@ def notify_open_invoice(self, invoice_id):
         assert (
             invoice.status == Invoice.OPEN
         ), f"The invoice:{invoice.id} is not opened yet"
-        path = reverse(
-            "invoices:invoice-public-detail", kwargs={"token": invoice.token}
-        )
-        report = InvoicePDF(invoice=invoice)
-        return Email.send_mail(
-            template_name="email/invoice_opened.html",
-            context={
-                "invoice": invoice,
-                "url": f"{settings.DOMAIN}{path}",
-                "config": config,
-            },
-            subject=_("New invoice #%s" % invoice.number),
-            to=[invoice.client.email],
-            attachments=((report.get_filename(), report.render(), "application/pdf"),),
-        )
+        sent = Email.send_mail(**get_open_invoice_email(invoice, config))
     except Exception as ex:
         self.retry(exc=ex)
+    coalesce.release(self.name, invoice_id)
     logger.info("Open invoice:%d email notification sent", invoice.id)
+    return sent
+
+
+def send_open_invoice_notification(invoice_id):
+    """
+    Enqueue the open invoice notification in the outbox unless one for the
+    same invoice is pending or was sent in the last TASK_COALESCE_WINDOW
+    seconds, return whether it was enqueued. The invoice is marked as
+    pending when the outbox publishes the notification, so a rolled back
+    transaction doesn't drop the next one
+    """
+    if coalesce.is_pending(notify_open_invoice.name, invoice_id):
+        logger.info("Duplicated notification for invoice:%d dropped", invoice_id)
+        return False
+    notification = get_open_invoice_notification(invoice_id)
+    notification.on_error(release_coalesced.si(notify_open_invoice.name, invoice_id))
+    outbox.enqueue(notification, coalesce_key=(notify_open_invoice.name, invoice_id))
+    return True
+
+
+def send_open_invoice_notifications(invoice_ids):
+    """
+    Enqueue the notification of many opened invoices in a single outbox
+    message. The emails are sent first by one notify_open_invoices task, an
+    invoice that fails to render is retried alone, then the PDF files it
+    cached are stored in parallel
+    """
+    outbox.enqueue(
+        chain(
+            notify_open_invoices.si(invoice_ids),
+            group(render_invoice_pdf.si(invoice_id) for invoice_id in invoice_ids),
+        )
+    )
+
+
+def render_invoice_pdfs(invoice_ids):
+    """
+    Enqueue the render of many invoices in a single outbox message
+    """
+    outbox.enqueue(
+        group(render_invoice_pdf.si(invoice_id) for invoice_id in invoice_ids)
+    )
+
+
+@app.task(name="invoices.notify_open_invoices", ignore_result=True)
+def notify_open_invoices(invoice_ids):
+    """
+    Send the notification of many open invoices over one SMTP connection,
+    the invoices that fail are retried one by one with notify_open_invoice
+    """
+    config = Configuration.get_instance()
+    invoices = Invoice.objects.select_related("client").filter(
+        id__in=invoice_ids, status=Invoice.OPEN
+    )
+
+    def get_emails():
+        for invoice in invoices.iterator():
+            try:
+                yield get_open_invoice_email(invoice, config)
+            except Exception:
+                logger.exception(
+                    "Error preparing notification for invoice:%d", invoice.id
+                )
+                notify_open_invoice.delay(invoice.id)
+
+    sent, failed = Email.send_mass_mail(get_emails())
+    for kwargs in failed:
+        notify_open_invoice.delay(kwargs["context"]["invoice"].id)
+    logger.info("%d open invoice notifications sent", sent)
+    return sent
+
+
+@app.task(name="invoices.mark_overdue_invoices")
+def mark_overdue_invoices():
+    """
+    Move the open invoices whose due date passed to the overdue column of
+    the invoices summary
+    """
+    today = timezone.now().date()
+    count = (
+        Invoice.objects.open()
+        .filter(is_overdue=False, due_date__lt=today)
+        .update_with_summary(is_overdue=True)
+    )
+    logger.info("%d invoices marked as overdue", count)
+    return count
+
+
+@app.task(name="invoices.send_overdue_reminders")
+def send_overdue_reminders():
+    """
+    Split the overdue invoices that need a reminder in chunks, every chunk
+    is sent by its own send_invoice_reminders task
+    """
+    invoices = Invoice.objects.pending_reminder(
+        settings.INVOICE_REMINDER_INTERVAL
+    ).order_by("id")
+    size = settings.INVOICE_REMINDER_CHUNK_SIZE
+    last_id, chunks = 0, 0
+    while True:
+        # keyset pagination, every query starts from the last dispatched id
+        chunk = list(
+            invoices.filter(id__gt=last_id).values_list("id", flat=True)[:size]
+        )
+        if not chunk:
+            break
+        send_invoice_reminders.delay(chunk)
+        last_id = chunk[-1]
+        chunks += 1
+    logger.info("Overdue reminders dispatched in %d chunks", chunks)
+    return chunks
+
+
+@app.task(name="invoices.send_invoice_reminders", ignore_result=True)
+def send_invoice_reminders(invoice_ids):
+    """
+    Send the reminder of the overdue invoices over one SMTP connection, the
+    invoices that fail are sent again in the next run
+    """
+    config = Configuration.get_instance()
+    today = timezone.now().date()
+    invoices = (
+        Invoice.objects.pending_reminder(settings.INVOICE_REMINDER_INTERVAL, today)
+        .select_related("client")
+        .filter(id__in=invoice_ids)
+    )
+    sent_ids = []
+
+    def get_emails():
+        for invoice in invoices.iterator():
+            try:
+                email = get_invoice_email(
+                    invoice,
+                    config,
+                    template_name="email/invoice_reminder.html",
+                    subject=_("Reminder: invoice #%s is overdue") % invoice.number,
+                )
+            except Exception:
+                logger.exception("Error preparing reminder for invoice:%d", invoice.id)
+                continue
+            sent_ids.append(invoice.id)
+            yield email
+
+    sent, failed = Email.send_mass_mail(get_emails())
+    for kwargs in failed:
+        sent_ids.remove(kwargs["context"]["invoice"].id)
+    # update() keeps the modified date, so the PDF stays valid
+    Invoice.objects.filter(id__in=sent_ids).update(last_reminder_date=today)
+    logger.info("%d overdue reminders sent", sent)
+    return sent
+
+
+@app.task(name="invoices.rollup_revenue")
+def rollup_revenue():
+    """
+    Store the revenue of the month that just ended, so the first revenue
+    report of the month doesn't compute it
+    """
+    month = revenue.get_month(timezone.now().date()) - relativedelta(months=1)
+    revenue.rollup([month])
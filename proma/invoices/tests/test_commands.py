@@ -0,0 +1,73 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from mixer.backend.django import mixer
+
+from proma.projects.models import Project
+
+from ..models import Invoice
+
+
+class BillProjectsTestCase(TestCase):
+    def setUp(self):
+        self.active = mixer.blend(
+            "projects.Project", name="Active", status=Project.ACTIVE, rate=100
+        )
+        self.archived = mixer.blend(
+            "projects.Project", name="Archived", status=Project.ARCHIVED, rate=100
+        )
+        self.no_rate = mixer.blend(
+            "projects.Project", name="No rate", status=Project.ACTIVE, rate=0
+        )
+        self.invoiced = mixer.blend(
+            "projects.Project", name="Invoiced", status=Project.ACTIVE, rate=50
+        )
+        self.invoice = Invoice.create_from_project_rate(
+            self.invoiced, "Previous", Decimal(50), 1
+        )
+
+    def call_command(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("bill_projects", *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_bill_the_given_projects(self):
+        projects = [self.active, self.archived, self.no_rate, self.invoiced]
+        stdout, stderr = self.call_command(
+            "--units", "2", *[str(project.id) for project in projects], "0"
+        )
+        invoice = Invoice.objects.exclude(id=self.invoice.id).get()
+        self.assertEqual(invoice.project, self.active)
+        self.assertEqual(invoice.status, Invoice.DRAFT)
+        self.assertEqual(invoice.total, Decimal(200))
+        self.assertEqual(invoice.items.get().units, Decimal(2))
+        self.assertEqual(
+            stdout.splitlines(),
+            [
+                f"Project {self.active.id} Active: "
+                f"invoice {invoice.id} for 200.00 {invoice.currency}",
+                f"Project {self.archived.id} Archived: skipped, archived",
+                f"Project {self.no_rate.id} No rate: skipped, no rate",
+                f"Project {self.invoiced.id} Invoiced: "
+                "skipped, already invoiced this month",
+                "1 invoices created, 4 projects skipped",
+            ],
+        )
+        self.assertEqual(stderr, "Project 0: not found\n")
+
+    def test_bill_the_active_projects(self):
+        stdout, stderr = self.call_command()
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertTrue(Invoice.objects.filter(project=self.active).exists())
+        self.assertNotIn("Archived", stdout)
+        self.assertIn("1 invoices created, 2 projects skipped", stdout)
+        self.assertEqual(stderr, "")
+
+    def test_force_bills_the_projects_already_invoiced(self):
+        stdout, _ = self.call_command("--force", str(self.invoiced.id))
+        invoice = Invoice.objects.exclude(id=self.invoice.id).get()
+        self.assertEqual(invoice.project, self.invoiced)
+        self.assertEqual(invoice.total, Decimal(50))
+        self.assertIn("1 invoices created, 0 projects skipped", stdout)
@@ -2,8 +2,9 @@ from datetime import timedelta
 
 from django.test import TestCase
 from django.utils import timezone
+from mixer.backend.django import mixer
 
-from ..forms import InvoiceForm
+from ..forms import InvoiceBulkActionForm, InvoiceForm
 
 
 class InvoiceFormTestCase(TestCase):
@@ -30,3 +31,25 @@ class InvoiceFormTestCase(TestCase):
         form = self.form_class(data)
         form.is_valid()
         self.assertIn("due_date", form.errors)
+
+
+class InvoiceBulkActionFormTestCase(TestCase):
+    def setUp(self):
+        self.form_class = InvoiceBulkActionForm
+
+    def test_clean_invoices_without_selection(self):
+        form = self.form_class({"action": "pay", "invoices": ""})
+        form.is_valid()
+        self.assertIn("invoices", form.errors)
+
+    def test_pay_requires_payment_notes(self):
+        invoice = mixer.blend("invoices.Invoice")
+        form = self.form_class({"action": "pay", "invoices": str(invoice.id)})
+        form.is_valid()
+        self.assertIn("payment_notes", form.errors)
+
+    def test_cancel_without_payment_notes(self):
+        invoice = mixer.blend("invoices.Invoice")
+        form = self.form_class({"action": "cancel", "invoices": str(invoice.id)})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(list(form.cleaned_data["invoices"]), [invoice])
@@ -1,12 +1,26 @@
-from datetime import timedelta
+from datetime import date, timedelta
+from unittest import mock
 from decimal import Decimal
 
+from dateutil.relativedelta import relativedelta
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from mixer.backend.django import mixer
 
+from proma.enums import Currency
+
 from ..exceptions import InvoiceException
-from ..models import Invoice, Item
+from .. import revenue, summary
+from ..models import (
+    Invoice,
+    InvoiceCounter,
+    InvoiceSummary,
+    Item,
+    RevenueRollup,
+    RevenueRollupMonth,
+)
 
 
 class InvoiceTestCase(TestCase):
@@ -38,8 +52,8 @@ class InvoiceTestCase(TestCase):
         )
         invoice.items.create(rate=10, units=10)
         self.assertEqual(invoice.tax_total, 0)
-        self.assertEqual(invoice.subtotal, 0)
-        self.assertEqual(invoice.total, 0)
+        self.assertEqual(invoice.subtotal, 100)
+        self.assertEqual(invoice.total, 100)
         invoice.compute_amounts()
         self.assertEqual(invoice.tax_total, 0)
         self.assertEqual(invoice.subtotal, 100)
@@ -53,13 +67,58 @@ class InvoiceTestCase(TestCase):
             tax_percent=10,
         )
         invoice.items.create(rate=10, units=10)
-        self.assertEqual(invoice.tax_total, 0)
-        self.assertEqual(invoice.subtotal, 0)
-        self.assertEqual(invoice.total, 0)
-        invoice.compute_amounts()
         self.assertEqual(invoice.tax_total, 10)
         self.assertEqual(invoice.subtotal, 100)
         self.assertEqual(invoice.total, 110)
+        invoice.tax_percent = 20
+        invoice.compute_amounts()
+        self.assertEqual(invoice.tax_total, 20)
+        self.assertEqual(invoice.subtotal, 100)
+        self.assertEqual(invoice.total, 120)
+
+    def assertAmounts(self, invoice, subtotal, tax_total, total):
+        invoice.refresh_from_db()
+        self.assertEqual(
+            (invoice.subtotal, invoice.tax_total, invoice.total),
+            (Decimal(subtotal), Decimal(tax_total), Decimal(total)),
+        )
+
+    def test_amounts_follow_item_changes(self):
+        invoice = Invoice.objects.create(
+            client=self.client, project=self.project, tax_percent=10
+        )
+        modified = invoice.modified
+        item = Item.objects.create(invoice=invoice, rate=10, units=10)
+        Item.objects.create(invoice=invoice, rate=5, units=2)
+        self.assertAmounts(invoice, 110, 11, 121)
+        self.assertGreater(invoice.modified, modified)
+        item = Item.objects.get(id=item.id)
+        item.units = 1
+        item.save()
+        self.assertAmounts(invoice, 20, 2, 22)
+        item.delete()
+        self.assertAmounts(invoice, 10, 1, 11)
+
+    def test_amounts_follow_bulk_item_writes(self):
+        invoice = Invoice.objects.create(
+            client=self.client, project=self.project, tax_percent=10
+        )
+        other = Invoice.objects.create(client=self.client, project=self.project)
+        Item.objects.bulk_create(
+            [Item(invoice=invoice, rate=10, units=units) for units in range(1, 5)]
+            + [Item(invoice=other, rate=1, units=1)]
+        )
+        self.assertAmounts(invoice, 100, 10, 110)
+        self.assertAmounts(other, 1, 0, 1)
+        Item.objects.filter(invoice=invoice).update(rate=1)
+        self.assertAmounts(invoice, 10, 1, 11)
+        item = Item.objects.get(invoice=invoice, units=1)
+        item.units = 11
+        Item.objects.bulk_update([item], ["units"])
+        self.assertAmounts(invoice, 20, 2, 22)
+        Item.objects.filter(invoice=invoice, units__gt=2).delete()
+        self.assertAmounts(invoice, 2, "0.20", "2.20")
+        self.assertAmounts(other, 1, 0, 1)
 
     def test_compute_number_draft_invoice(self):
         invoice = Invoice(status=Invoice.DRAFT)
@@ -77,6 +136,29 @@ class InvoiceTestCase(TestCase):
         number = f"{now.year}00001"
         self.assertEqual(invoice.number, number)
 
+    def test_compute_next_number_uses_the_counter_of_the_year(self):
+        year = timezone.now().year
+        InvoiceCounter.objects.create(year=year, value=41)
+        InvoiceCounter.objects.create(year=year - 1, value=99)
+        self.assertEqual(Invoice.compute_next_number(), f"{year}00042")
+        self.assertEqual(Invoice.compute_next_number(), f"{year}00043")
+        self.assertEqual(InvoiceCounter.objects.get(year=year - 1).value, 99)
+
+    def test_open_invoice_issued_the_year_before(self):
+        year = timezone.now().year
+        issue_date = timezone.now() - timedelta(days=366)
+        for _ in range(2):
+            invoice = Invoice.objects.create(
+                client=self.client, project=self.project, issue_date=issue_date
+            )
+            invoice.items.create(rate=10, units=10)
+            invoice.open()
+            invoice.save()
+        self.assertEqual(
+            list(Invoice.objects.order_by("id").values_list("number", flat=True)),
+            [f"{year}00001", f"{year}00002"],
+        )
+
     def test_open(self):
         invoice = Invoice.objects.create(
             due_date="2018-01-01",
@@ -182,6 +264,88 @@ class InvoiceTestCase(TestCase):
         self.assertEqual(item.rate, 20)
         self.assertEqual(invoice.total, 200)
 
+    def test_create_from_projects(self):
+        projects = mixer.cycle(6).blend(
+            "projects.Project", client=self.client, currency="USD"
+        )
+
+        def create(projects):
+            with CaptureQueriesContext(connection) as queries:
+                invoices = Invoice.create_from_projects(
+                    (project, "test", 20, 10) for project in projects
+                )
+            return invoices, len(queries)
+
+        # the first run creates the summary row of the currency
+        create(projects[:1])
+        [invoice], single_queries = create(projects[1:2])
+        invoices, queries = create(projects[2:])
+        self.assertEqual(queries, single_queries)
+        self.assertEqual([invoice.project for invoice in invoices], projects[2:])
+        for invoice in invoices:
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.status, Invoice.DRAFT)
+            self.assertEqual(invoice.total, 200)
+            self.assertEqual(invoice.client, self.client)
+            self.assertEqual(
+                list(invoice.items.values_list("description", "total")), [("test", 200)]
+            )
+
+    def test_open_all(self):
+        year = timezone.now().year
+        InvoiceCounter.objects.create(year=year, value=7)
+        invoices = mixer.cycle(3).blend(
+            "invoices.Invoice", status=Invoice.DRAFT, currency="USD"
+        )
+        for invoice in invoices:
+            invoice.items.create(rate=10, units=1)
+        ids = Invoice.objects.filter(
+            id__in=[invoice.id for invoice in invoices]
+        ).open_all()
+        self.assertEqual(ids, sorted(invoice.id for invoice in invoices))
+        self.assertEqual(
+            list(
+                Invoice.objects.filter(id__in=ids)
+                .order_by("id")
+                .values_list("number", flat=True)
+            ),
+            [f"{year}00008", f"{year}00009", f"{year}00010"],
+        )
+        self.assertEqual(InvoiceCounter.objects.get(year=year).value, 10)
+        self.assertFalse(
+            Invoice.objects.filter(id__in=ids).exclude(status=Invoice.OPEN).exists()
+        )
+        self.assertSummary(open=30)
+
+    def test_open_all_requires_items(self):
+        invoices = mixer.cycle(2).blend("invoices.Invoice", status=Invoice.DRAFT)
+        invoices[0].items.create(rate=10, units=1)
+        with self.assertRaises(InvoiceException):
+            Invoice.objects.filter(
+                id__in=[invoice.id for invoice in invoices]
+            ).open_all()
+        self.assertEqual(Invoice.objects.filter(status=Invoice.DRAFT).count(), 2)
+
+    def test_pay_all_and_cancel_all(self):
+        invoices = mixer.cycle(3).blend(
+            "invoices.Invoice",
+            status=Invoice.OPEN,
+            currency="USD",
+            total=10,
+            due_date=timezone.now() - timedelta(days=2),
+        )
+        self.assertSummary(overdue=30)
+        paid = Invoice.objects.filter(id__in=[invoices[0].id, invoices[1].id])
+        self.assertEqual(len(paid.pay_all(notes="Bank")), 2)
+        with self.assertRaises(InvoiceException):
+            Invoice.objects.all().cancel_all()
+        Invoice.objects.filter(id=invoices[2].id).cancel_all()
+        self.assertSummary(paid=20)
+        self.assertEqual(set(paid.values_list("payment_notes", flat=True)), {"Bank"})
+        self.assertEqual(
+            Invoice.objects.get(id=invoices[2].id).status, Invoice.CANCELLED
+        )
+
     def test_summary(self):
         today = timezone.now()
         # draft invoice
@@ -200,10 +364,268 @@ class InvoiceTestCase(TestCase):
             total=100,
             status=Invoice.OPEN,
         )
-        summary = Invoice.summary()
-        self.assertEqual(summary["draft"], Decimal(300))
-        self.assertEqual(summary["overdue"], Decimal(200))
-        self.assertEqual(summary["total_outstanding"], Decimal(500))
+        mixer.blend("invoices.Invoice", total=50, status=Invoice.DRAFT, currency="EUR")
+        [eur, usd] = Invoice.summary()
+        self.assertEqual(usd.currency, "USD")
+        self.assertEqual(usd.draft, Decimal(300))
+        self.assertEqual(usd.overdue, Decimal(200))
+        self.assertEqual(usd.open, Decimal(100))
+        self.assertEqual(usd.total_outstanding, Decimal(500))
+        self.assertEqual(eur.draft, Decimal(50))
+
+    def assertSummary(self, **amounts):
+        summary = Invoice.summary().get(currency="USD")
+        for bucket in ("draft", "open", "overdue", "paid"):
+            self.assertEqual(getattr(summary, bucket), Decimal(amounts.get(bucket, 0)))
+
+    def test_summary_follows_the_invoice(self):
+        invoice = Invoice.objects.create(
+            client=self.client, project=self.project, currency="USD"
+        )
+        item = invoice.items.create(rate=10, units=10)
+        self.assertSummary(draft=100)
+        invoice.open()
+        invoice.save()
+        self.assertSummary(open=100)
+        invoice.pay()
+        invoice.save()
+        self.assertSummary(paid=100)
+        invoice.delete()
+        self.assertSummary()
+        self.assertFalse(Item.objects.filter(id=item.id).exists())
+
+    def test_summary_with_bulk_writes(self):
+        invoices = Invoice.create_from_projects(
+            [(mixer.blend("projects.Project", currency="USD"), "test", 10, 1)] * 3
+        )
+        self.assertSummary(draft=30)
+        Item.objects.filter(invoice__in=invoices).update(rate=20)
+        self.assertSummary(draft=60)
+        Invoice.objects.filter(id=invoices[0].id).delete()
+        self.assertSummary(draft=40)
+
+    def test_summary_rows_updated_in_currency_order(self):
+        for currency in ("EUR", "USD"):
+            InvoiceSummary.objects.get_or_create(currency=currency)
+        changes = {("USD", "draft"): Decimal(10), ("EUR", "draft"): Decimal(20)}
+        with CaptureQueriesContext(connection) as queries:
+            summary.apply_changes(changes)
+        updates = [
+            query["sql"] for query in queries if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 2)
+        self.assertIn("'EUR'", updates[0])
+        self.assertIn("'USD'", updates[1])
+
+    def test_summary_rebuild(self):
+        mixer.blend("invoices.Invoice", total=300, status=Invoice.DRAFT, currency="USD")
+        InvoiceSummary.objects.filter(currency="USD").update(draft=250, paid=10)
+        self.assertEqual(
+            summary.rebuild(),
+            {("USD", "draft"): Decimal(-50), ("USD", "paid"): Decimal(10)},
+        )
+        self.assertSummary(draft=300)
+        self.assertEqual(summary.rebuild(), {})
+
+    def test_pending_reminder(self):
+        today = timezone.now().date()
+        overdue = mixer.blend(
+            "invoices.Invoice", due_date=today - timedelta(days=2), status=Invoice.OPEN
+        )
+        reminded = mixer.blend(
+            "invoices.Invoice",
+            due_date=today - timedelta(days=20),
+            last_reminder_date=today - timedelta(days=10),
+            status=Invoice.OPEN,
+        )
+        # reminded recently
+        mixer.blend(
+            "invoices.Invoice",
+            due_date=today - timedelta(days=20),
+            last_reminder_date=today - timedelta(days=2),
+            status=Invoice.OPEN,
+        )
+        # not due yet
+        mixer.blend("invoices.Invoice", due_date=today, status=Invoice.OPEN)
+        # paid
+        mixer.blend(
+            "invoices.Invoice", due_date=today - timedelta(days=2), status=Invoice.PAID
+        )
+        self.assertEqual(
+            set(Invoice.objects.pending_reminder(interval=7, date=today)),
+            {overdue, reminded},
+        )
+
+    def test_aging(self):
+        today = timezone.now().date()
+        client = mixer.blend("clients.Client", name="ACME")
+        for days, total in [
+            (-5, 1),
+            (0, 2),
+            (1, 4),
+            (30, 8),
+            (31, 16),
+            (90, 32),
+            (91, 64),
+        ]:
+            mixer.blend(
+                "invoices.Invoice",
+                client=client,
+                currency=Currency.USD.name,
+                due_date=today - timedelta(days=days),
+                status=Invoice.OPEN,
+                total=Decimal(total),
+            )
+        mixer.blend(
+            "invoices.Invoice",
+            client=client,
+            currency=Currency.EUR.name,
+            due_date=today - timedelta(days=100),
+            status=Invoice.OPEN,
+            total=Decimal(10),
+        )
+        # paid
+        mixer.blend(
+            "invoices.Invoice",
+            client=client,
+            due_date=today - timedelta(days=10),
+            status=Invoice.PAID,
+            total=Decimal(100),
+        )
+        with self.assertNumQueries(1):
+            rows = list(Invoice.objects.aging(today))
+        self.assertEqual(
+            [row["currency"] for row in rows], [Currency.EUR.name, Currency.USD.name]
+        )
+        self.assertEqual(rows[0]["days_over_90"], Decimal(10))
+        self.assertEqual(rows[0]["current"], Decimal(0))
+        usd = rows[1]
+        self.assertEqual(usd["client"], client.id)
+        self.assertEqual(usd["client__name"], "ACME")
+        self.assertEqual(usd["current"], Decimal(3))
+        self.assertEqual(usd["days_1_30"], Decimal(12))
+        self.assertEqual(usd["days_31_60"], Decimal(16))
+        self.assertEqual(usd["days_61_90"], Decimal(32))
+        self.assertEqual(usd["days_over_90"], Decimal(64))
+        self.assertEqual(usd["outstanding"], Decimal(127))
+
+
+class RevenueTestCase(TestCase):
+    def setUp(self):
+        self.current = revenue.get_month(timezone.now().date())
+        self.previous = self.current - relativedelta(months=1)
+        self.client_ = mixer.blend("clients.Client", name="ACME")
+        self.project = mixer.blend("projects.Project", client=self.client_, name="Web")
+
+    def pay(self, date, total, currency=Currency.USD.name):
+        return mixer.blend(
+            "invoices.Invoice",
+            client=self.client_,
+            project=self.project,
+            status=Invoice.PAID,
+            payment_date=date,
+            currency=currency,
+            total=Decimal(total),
+        )
+
+    def get_amounts(self, rows):
+        return [(row["month"], row["amount"]) for row in rows]
+
+    def test_series(self):
+        start = self.current - relativedelta(months=3)
+        self.pay(self.previous, 10)
+        self.pay(self.previous + timedelta(days=5), 20)
+        self.pay(self.current, 5)
+        self.pay(start, 7, currency=Currency.EUR.name)
+        # not paid
+        mixer.blend("invoices.Invoice", status=Invoice.OPEN, total=100)
+        rows = revenue.get_series(start)
+        self.assertEqual(
+            self.get_amounts(rows),
+            [
+                (start, Decimal(7)),
+                (self.previous, Decimal(30)),
+                (self.current, Decimal(5)),
+            ],
+        )
+        self.assertEqual(rows[1]["client_name"], "ACME")
+        self.assertEqual(rows[1]["project_name"], "Web")
+        self.assertEqual(rows[1]["invoice_count"], 2)
+        # the months without revenue are rolled up too
+        self.assertEqual(RevenueRollupMonth.objects.count(), 3)
+        self.assertEqual(
+            revenue.get_month_totals(rows)[0],
+            {"month": start, "currency": Currency.EUR.name, "amount": Decimal(7)},
+        )
+        self.assertEqual(
+            self.get_amounts(revenue.get_series(start, currency=Currency.USD.name)),
+            [(self.previous, Decimal(30)), (self.current, Decimal(5))],
+        )
+
+    def test_only_the_current_month_is_computed(self):
+        start = self.current - relativedelta(years=3)
+        self.pay(self.previous, 10)
+        self.pay(self.current, 5)
+        revenue.get_series(start)
+        # changes that bypass the model aren't seen in the completed months
+        Invoice.objects.update(total=Decimal(1))
+        with self.assertNumQueries(4):
+            rows = revenue.get_series(start)
+        self.assertEqual(
+            self.get_amounts(rows),
+            [(self.previous, Decimal(10)), (self.current, Decimal(1))],
+        )
+        # from the first payment
+        self.assertEqual(revenue.rebuild(), 1)
+        self.assertEqual(
+            self.get_amounts(revenue.get_series(start)),
+            [(self.previous, Decimal(1)), (self.current, Decimal(1))],
+        )
+
+    def test_saved_invoice_invalidates_its_month(self):
+        invoice = self.pay(self.previous, 10)
+        revenue.get_series(self.previous)
+        invoice.status = Invoice.CANCELLED
+        invoice.save()
+        self.assertFalse(RevenueRollupMonth.objects.exists())
+        self.assertEqual(revenue.get_series(self.previous), [])
+        self.pay(self.previous, 10).delete()
+        self.assertFalse(RevenueRollupMonth.objects.exists())
+
+    def test_end(self):
+        self.pay(self.previous, 10)
+        self.pay(self.current, 5)
+        revenue.rollup([self.previous])
+        self.assertEqual(RevenueRollup.objects.get().amount, Decimal(10))
+        with self.assertNumQueries(3):
+            rows = revenue.get_series(self.previous, self.previous)
+        self.assertEqual(self.get_amounts(rows), [(self.previous, Decimal(10))])
+
+    def test_months_before_the_first_payment_are_not_rolled_up(self):
+        self.pay(self.previous, 10)
+        rows = revenue.get_series(date(1, 1, 1))
+        self.assertEqual(self.get_amounts(rows), [(self.previous, Decimal(10))])
+        self.assertEqual(RevenueRollupMonth.objects.get().month, self.previous)
+        Invoice.objects.all().delete()
+        self.assertEqual(revenue.get_series(date(1, 1, 1)), [])
+
+    def test_rollup_retries_the_months_of_a_concurrent_rollup(self):
+        start = self.previous - relativedelta(months=2)
+        self.pay(start, 7)
+        self.pay(self.previous, 10)
+        store_rollups = revenue._store_rollups
+
+        def concurrent_store_rollups(months):
+            # another rollup marked the previous month first
+            if not RevenueRollupMonth.objects.exists():
+                RevenueRollupMonth.objects.create(month=self.previous)
+                raise IntegrityError
+            store_rollups(months)
+
+        with mock.patch.object(revenue, "_store_rollups", concurrent_store_rollups):
+            revenue.rollup(revenue.get_months(start, self.previous))
+        self.assertEqual(RevenueRollupMonth.objects.count(), 3)
+        self.assertEqual(RevenueRollup.objects.get().month, start)
 
 
 class ItemTestCase(TestCase):
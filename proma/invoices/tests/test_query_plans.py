@@ -0,0 +1,57 @@
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from proma.common.tests.plans import QueryPlanMixin
+from proma.views import HomeView
+
+from .. import revenue, views
+from ..models import Invoice
+
+
+class InvoiceQueryPlanTestCase(QueryPlanMixin, TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        mixer.cycle(10).blend("invoices.Invoice", status=Invoice.DRAFT)
+        mixer.cycle(10).blend("invoices.Invoice", status=Invoice.OPEN)
+        mixer.cycle(10).blend("invoices.Invoice", status=Invoice.PAID)
+
+    def get_view(self, view_class, path="/"):
+        request = self.factory.get(path)
+        request.user = self.user
+        view = view_class()
+        view.setup(request)
+        return view
+
+    def test_home_latest_invoices(self):
+        view = self.get_view(HomeView)
+        self.assertUsesIndex(view.get_context_data()["latest_invoices"])
+
+    def test_invoice_list(self):
+        view = self.get_view(views.InvoiceListView)
+        self.assertUsesIndex(view.get_queryset())
+
+    def test_invoice_list_by_status(self):
+        view = self.get_view(views.InvoiceListView, "/?status=OPEN")
+        filterset = view.get_filterset(view.get_filterset_class())
+        self.assertUsesIndex(filterset.qs)
+
+    def test_mark_overdue_invoices(self):
+        today = timezone.now().date()
+        invoices = Invoice.objects.open().filter(is_overdue=False, due_date__lt=today)
+        self.assertUsesIndex(invoices)
+
+    def test_pending_reminder(self):
+        self.assertUsesIndex(Invoice.objects.pending_reminder(7))
+
+    def test_invoices_of_the_month(self):
+        today = timezone.now().date()
+        invoices = Invoice.objects.filter(issue_date__gte=today.replace(day=1))
+        self.assertUsesIndex(invoices)
+
+    def test_current_month_revenue(self):
+        month = revenue.get_month(timezone.now().date())
+        self.assertUsesIndex(
+            revenue.get_totals(Invoice.objects.filter(payment_date__gte=month))
+        )
@@ -0,0 +1,77 @@
+import importlib.util
+import shutil
+import tempfile
+import unittest
+
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+
+from proma.common.backends import ReportLabBackend
+from proma.common.cache import pdf_cache
+
+from ..models import Invoice
+from ..reports import InvoicePDF
+
+
+class InvoicePDFTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+        self.invoice.items.create(rate=10, units=10)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_cache_key_is_stable(self):
+        report = InvoicePDF(invoice=self.invoice)
+        self.assertEqual(report.get_cache_key(), report.get_cache_key())
+
+    def test_cache_key_changes_with_items(self):
+        key = InvoicePDF(invoice=self.invoice).get_cache_key()
+        self.invoice.items.create(rate=20, units=1)
+        self.assertNotEqual(InvoicePDF(invoice=self.invoice).get_cache_key(), key)
+
+    def test_cache_key_changes_with_status(self):
+        key = InvoicePDF(invoice=self.invoice).get_cache_key()
+        self.invoice.pay()
+        self.assertNotEqual(InvoicePDF(invoice=self.invoice).get_cache_key(), key)
+
+    def test_render_returns_cached_content(self):
+        report = InvoicePDF(invoice=self.invoice)
+        pdf_cache.set(report.get_cache_namespace(), report.get_cache_key(), b"pdf")
+        self.assertEqual(report.render(), b"pdf")
+
+    @override_settings(PDF_RENDERER="proma.invoices.tests.test_views.StaticRenderer")
+    def test_render_measures_stages(self):
+        report = InvoicePDF(invoice=self.invoice)
+        report.render()
+        self.assertEqual(
+            set(report.timer.stages),
+            {"cache", "context", "css", "template", "convert", "cache_store"},
+        )
+        self.assertEqual(report.timer.sizes["pdf"], 3)
+        self.assertGreater(report.timer.sizes["html"], 0)
+        self.assertFalse(report.timer.tags["cached"])
+
+    def test_state_change_invalidates_cache(self):
+        report = InvoicePDF(invoice=self.invoice)
+        key = report.get_cache_key()
+        pdf_cache.set(report.get_cache_namespace(), key, b"pdf")
+        self.invoice.cancel()
+        self.assertIsNone(pdf_cache.get(report.get_cache_namespace(), key))
+
+    def test_cache_key_changes_with_backend(self):
+        key = InvoicePDF(invoice=self.invoice).get_cache_key()
+        with override_settings(PDF_BACKEND="proma.common.backends.ReportLabBackend"):
+            self.assertNotEqual(InvoicePDF(invoice=self.invoice).get_cache_key(), key)
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("reportlab"), "reportlab is not installed"
+    )
+    def test_render_with_reportlab(self):
+        self.invoice.notes = "notes"
+        content = ReportLabBackend().render(InvoicePDF(invoice=self.invoice))
+        self.assertTrue(content.startswith(b"%PDF"))
@@ -0,0 +1,319 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.core import mail
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from config.celery import app
+from proma.common import coalesce
+from proma.common.exceptions import PDFRenderError
+from proma.common.models import OutboxMessage
+from proma.config.models import Configuration
+
+from ..models import Invoice, InvoiceSummary, RevenueRollup
+from ..reports import InvoicePDF
+from ..tasks import (
+    get_open_invoice_notification,
+    mark_overdue_invoices,
+    notify_open_invoice,
+    notify_open_invoices,
+    refresh_invoice_pdfs,
+    render_invoice_pdf,
+    send_open_invoice_notification,
+    send_open_invoice_notifications,
+    rollup_revenue,
+    send_overdue_reminders,
+)
+
+
+class CountingRenderer:
+
+    renders = 0
+
+    def render(self, content, options):
+        CountingRenderer.renders += 1
+        return f"pdf {CountingRenderer.renders}".encode()
+
+
+@override_settings(PDF_RENDERER="proma.invoices.tests.test_tasks.CountingRenderer")
+class RenderInvoicePDFTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, PDF_CACHE_ENABLED=False
+        )
+        self.settings_override.enable()
+        CountingRenderer.renders = 0
+        self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_store_pdf_in_the_invoice(self):
+        render_invoice_pdf(self.invoice.id)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.pdf.read(), b"pdf 1")
+        self.assertEqual(
+            self.invoice.pdf_key, InvoicePDF(invoice=self.invoice).get_cache_key()
+        )
+
+    def test_reuse_stored_pdf(self):
+        render_invoice_pdf(self.invoice.id)
+        render_invoice_pdf(self.invoice.id)
+        self.invoice.refresh_from_db()
+        self.assertEqual(CountingRenderer.renders, 1)
+        self.assertEqual(InvoicePDF(invoice=self.invoice).render(), b"pdf 1")
+
+    def test_render_again_after_changes(self):
+        render_invoice_pdf(self.invoice.id)
+        self.invoice.refresh_from_db()
+        previous_name = self.invoice.pdf.name
+        self.invoice.pay()
+        self.invoice.save()
+        render_invoice_pdf(self.invoice.id)
+        self.invoice.refresh_from_db()
+        self.assertEqual(CountingRenderer.renders, 2)
+        self.assertEqual(self.invoice.pdf.read(), b"pdf 2")
+        self.assertFalse(self.invoice.pdf.storage.exists(previous_name))
+
+    def test_refresh_invoice_pdfs(self):
+        render_invoice_pdf(self.invoice.id)
+        configuration = Configuration.get_instance()
+        configuration.company_legal_name = "new name"
+        configuration.save()
+        refresh_invoice_pdfs()
+        self.assertEqual(CountingRenderer.renders, 2)
+
+
+class FailingRenderer:
+    def render(self, content, options):
+        if "Broken invoice" in content:
+            raise PDFRenderError("Render failed")
+        return b"pdf"
+
+
+@override_settings(PDF_RENDERER="proma.invoices.tests.test_tasks.CountingRenderer")
+class NotifyOpenInvoiceTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, PDF_CACHE_ENABLED=False
+        )
+        self.settings_override.enable()
+        CountingRenderer.renders = 0
+        cache.clear()
+        self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_send_the_stored_pdf(self):
+        get_open_invoice_notification(self.invoice.id).delay()
+        # a resend only repeats the send stage
+        notify_open_invoice(self.invoice.id)
+        self.assertEqual(CountingRenderer.renders, 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].attachments[0][1], b"pdf 1")
+
+    def send(self, invoice_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return send_open_invoice_notification(invoice_id)
+
+    def test_duplicated_notifications_are_dropped(self):
+        self.assertTrue(self.send(self.invoice.id))
+        self.assertFalse(self.send(self.invoice.id))
+        self.assertEqual(len(mail.outbox), 1)
+        # other invoices are not affected
+        invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+        self.assertTrue(self.send(invoice.id))
+
+    @override_settings(TASK_COALESCE_WINDOW=0)
+    def test_send_again_after_the_window(self):
+        self.assertTrue(self.send(self.invoice.id))
+        self.assertTrue(self.send(self.invoice.id))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_notification_can_be_sent_again(self):
+        invoice = mixer.blend("invoices.Invoice", status=Invoice.DRAFT)
+        self.send(invoice.id)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(coalesce.acquire(notify_open_invoice.name, invoice.id))
+
+    def test_published_after_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            send_open_invoice_notification(self.invoice.id)
+            self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        callbacks[0]()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_duplicates_enqueued_together_are_dropped_on_publish(self):
+        # both requests checked the invoice before any was published
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(send_open_invoice_notification(self.invoice.id))
+            self.assertTrue(send_open_invoice_notification(self.invoice.id))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rolled_back_notification_can_be_sent_again(self):
+        with transaction.atomic():
+            self.assertTrue(send_open_invoice_notification(self.invoice.id))
+            transaction.set_rollback(True)
+        self.assertTrue(self.send(self.invoice.id))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_stages_are_routed_to_their_queues(self):
+        router = app.amqp.router
+        self.assertEqual(
+            router.route({}, "invoices.render_invoice_pdf")["queue"].name, "pdf"
+        )
+        self.assertEqual(
+            router.route({}, "invoices.notify_open_invoice")["queue"].name, "email"
+        )
+
+
+@override_settings(PDF_RENDERER="proma.invoices.tests.test_tasks.CountingRenderer")
+class NotifyOpenInvoicesTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_send_open_invoices(self):
+        invoices = mixer.cycle(2).blend("invoices.Invoice", status=Invoice.OPEN)
+        draft = mixer.blend("invoices.Invoice", status=Invoice.DRAFT)
+        sent = notify_open_invoices([invoice.id for invoice in invoices] + [draft.id])
+        self.assertEqual(sent, 2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(invoice.client.email for invoice in invoices),
+        )
+        self.assertEqual(len(mail.outbox[0].attachments), 1)
+
+    def test_grouped_notification(self):
+        invoices = mixer.cycle(3).blend("invoices.Invoice", status=Invoice.OPEN)
+        with self.captureOnCommitCallbacks(execute=True):
+            send_open_invoice_notifications([invoice.id for invoice in invoices])
+            self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 3)
+        for invoice in invoices:
+            invoice.refresh_from_db()
+            self.assertTrue(invoice.pdf)
+
+    @override_settings(PDF_RENDERER="proma.invoices.tests.test_tasks.FailingRenderer")
+    def test_failed_render_doesnt_block_the_other_notifications(self):
+        invoices = mixer.cycle(2).blend(
+            "invoices.Invoice", status=Invoice.OPEN, notes=""
+        )
+        broken = mixer.blend(
+            "invoices.Invoice", status=Invoice.OPEN, notes="Broken invoice"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            send_open_invoice_notifications(
+                [invoice.id for invoice in invoices] + [broken.id]
+            )
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(invoice.client.email for invoice in invoices),
+        )
+
+
+@override_settings(
+    PDF_RENDERER="proma.invoices.tests.test_tasks.CountingRenderer",
+    INVOICE_REMINDER_CHUNK_SIZE=2,
+)
+class SendOverdueRemindersTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.today = timezone.now().date()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_send_reminders_in_chunks(self):
+        invoices = mixer.cycle(3).blend(
+            "invoices.Invoice",
+            status=Invoice.OPEN,
+            due_date=self.today - timedelta(days=1),
+        )
+        mixer.blend("invoices.Invoice", status=Invoice.OPEN, due_date=self.today)
+        self.assertEqual(send_overdue_reminders(), 2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(invoice.client.email for invoice in invoices),
+        )
+        self.assertIn("overdue", mail.outbox[0].subject)
+        self.assertEqual(
+            Invoice.objects.filter(last_reminder_date=self.today).count(), 3
+        )
+
+    def test_skip_reminded_invoices(self):
+        mixer.blend(
+            "invoices.Invoice",
+            status=Invoice.OPEN,
+            due_date=self.today - timedelta(days=1),
+        )
+        send_overdue_reminders()
+        self.assertEqual(send_overdue_reminders(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class MarkOverdueInvoicesTestCase(TestCase):
+    def test_move_to_overdue(self):
+        today = timezone.now().date()
+        invoice = mixer.blend(
+            "invoices.Invoice",
+            status=Invoice.OPEN,
+            due_date=today,
+            total=100,
+            currency="USD",
+        )
+        mixer.blend(
+            "invoices.Invoice",
+            status=Invoice.OPEN,
+            due_date=today,
+            total=10,
+            currency="USD",
+        )
+        self.assertFalse(invoice.is_overdue)
+        # the due date passes
+        Invoice.objects.filter(id=invoice.id).update(due_date=today - timedelta(days=1))
+        self.assertEqual(mark_overdue_invoices(), 1)
+        self.assertEqual(mark_overdue_invoices(), 0)
+        summary = InvoiceSummary.objects.get(currency="USD")
+        self.assertEqual((summary.open, summary.overdue), (10, 100))
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.is_overdue)
+
+
+class RollupRevenueTestCase(TestCase):
+    def test_rollup_previous_month(self):
+        month = timezone.now().date().replace(day=1) - relativedelta(months=1)
+        mixer.blend(
+            "invoices.Invoice",
+            status=Invoice.PAID,
+            payment_date=month + timedelta(days=3),
+            total=100,
+        )
+        mixer.blend(
+            "invoices.Invoice", status=Invoice.PAID, payment_date=timezone.now()
+        )
+        rollup_revenue()
+        rollup = RevenueRollup.objects.get()
+        self.assertEqual((rollup.month, rollup.amount), (month, 100))
@@ -1,14 +1,32 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core import mail
+from django.core.cache import cache
 from django.http import Http404
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from mixer.backend.django import mixer
 
+from proma.common import coalesce
+from proma.common.cache import pdf_cache
+from proma.common.models import OutboxMessage
+from proma.common.renderers import get_renderer
 from proma.enums import Currency
 
 from .. import views
 from ..models import Invoice
+from ..reports import InvoicePDF
 
 
 class InvoiceCreateViewTestCase(TestCase):
@@ -218,10 +236,52 @@ class InvoiceDetailViewTestCase(TestCase):
         self.assertIn("invoice", response.context_data)
 
 
+class InvoiceBulkActionViewTestCase(TestCase):
+    def setUp(self):
+        self.view = views.InvoiceBulkActionView.as_view()
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.invoices = mixer.cycle(3).blend("invoices.Invoice", status=Invoice.OPEN)
+
+    def post(self, data):
+        request = self.factory.post("/", data)
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return self.view(request)
+
+    def test_match_expected_view(self):
+        url = resolve("/invoices/action/")
+        self.assertEqual(url.func.__name__, self.view.__name__)
+
+    def test_pay_successful(self):
+        ids = ",".join(str(invoice.id) for invoice in self.invoices)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post(
+                {"action": "pay", "invoices": ids, "payment_notes": "Wire transfer"}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["location"], reverse("invoices:invoice-list"))
+        self.assertEqual(Invoice.objects.filter(status=Invoice.PAID).count(), 3)
+        # the renders of all the invoices are published together
+        self.assertEqual(len(callbacks), 1)
+        [message] = OutboxMessage.objects.all()
+        self.assertEqual(len(message.signature["kwargs"]["tasks"]), 3)
+
+    def test_invalid_status(self):
+        self.invoices[0].status = Invoice.DRAFT
+        self.invoices[0].save()
+        ids = ",".join(str(invoice.id) for invoice in self.invoices)
+        self.post({"action": "cancel", "invoices": ids})
+        self.assertEqual(Invoice.objects.filter(status=Invoice.OPEN).count(), 2)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
 class InvoiceActionViewtTestCase(TestCase):
     def setUp(self):
         self.view = views.InvoiceActionView.as_view()
         self.factory = RequestFactory()
+        cache.clear()
         self.user = mixer.blend("users.User")
         self.invoice = mixer.blend("invoices.Invoice")
 
@@ -239,7 +299,8 @@ class InvoiceActionViewtTestCase(TestCase):
         request._messages = FallbackStorage(request)
         self.assertEqual(self.invoice.status, Invoice.DRAFT)
         self.assertEqual(len(mail.outbox), 0)
-        response = self.view(request, id=self.invoice.id, action="open")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.view(request, id=self.invoice.id, action="open")
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(response.status_code, 302)
         self.assertEqual(
@@ -341,12 +402,43 @@ class InvoicePublicDetailViewTestCase(TestCase):
             self.view(request, token=self.invoice.token)
 
 
+class InvoicePublicDownloadPDFViewTestCase(TestCase):
+    def setUp(self):
+        self.view = views.InvoicePublicDownloadPDFView.as_view()
+        self.factory = RequestFactory()
+        self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+        self.invoice.refresh_from_db()
+
+    def test_match_expected_view(self):
+        url = resolve("/invoices/abc/pdf/")
+        self.assertEqual(url.func.__name__, self.view.__name__)
+
+    def test_serve_stored_pdf(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        request = self.factory.get("/")
+        with override_settings(MEDIA_ROOT=media_root):
+            key = InvoicePDF(invoice=self.invoice).get_cache_key()
+            self.invoice.save_pdf(b"pdf", key)
+            response = self.view(request, token=self.invoice.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"pdf")
+
+    def test_raise_404_when_the_invoice_is_not_opened(self):
+        request = self.factory.get("/")
+        self.invoice.status = Invoice.PAID
+        self.invoice.save()
+        with self.assertRaises(Http404):
+            self.view(request, token=self.invoice.token)
+
+
 class InvoiceDownloadPDFViewTestCase(TestCase):
     def setUp(self):
         self.view = views.InvoiceDownloadPDFView.as_view()
         self.factory = RequestFactory()
         self.user = mixer.blend("users.User")
         self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+        cache.clear()
 
     def test_match_expected_view(self):
         url = resolve("/invoices/1/download-pdf/")
@@ -367,11 +459,389 @@ class InvoiceDownloadPDFViewTestCase(TestCase):
         with self.assertRaises(Http404):
             self.view(request, id=self.invoice.id)
 
+    def test_not_modified_when_etag_matches(self):
+        self.invoice.refresh_from_db()
+        etag = InvoicePDF(invoice=self.invoice).get_etag()
+        request = self.factory.get("/", HTTP_IF_NONE_MATCH=f'"{etag}"')
+        request.user = self.user
+        response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["etag"], f'"{etag}"')
+
+    def test_etag_changes_with_the_backend(self):
+        etag = InvoicePDF(invoice=self.invoice).get_etag()
+        with override_settings(PDF_BACKEND="proma.common.backends.ReportLabBackend"):
+            self.assertNotEqual(InvoicePDF(invoice=self.invoice).get_etag(), etag)
+
+    def test_not_modified_since_last_modified(self):
+        last_modified = InvoicePDF(invoice=self.invoice).get_last_modified()
+        request = self.factory.get(
+            "/", HTTP_IF_MODIFIED_SINCE=http_date(last_modified.timestamp())
+        )
+        request.user = self.user
+        response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 304)
+
+    def test_validation_headers(self):
+        self.invoice.refresh_from_db()
+        report = InvoicePDF(invoice=self.invoice)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            pdf_cache.set(report.get_cache_namespace(), report.get_cache_key(), b"pdf")
+            request = self.factory.get("/", HTTP_IF_NONE_MATCH='"outdated"')
+            request.user = self.user
+            response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"pdf")
+        self.assertEqual(response["content-length"], "3")
+        self.assertEqual(response["etag"], f'"{report.get_etag()}"')
+        self.assertIn("last-modified", response)
+        self.assertIn("must-revalidate", response["cache-control"])
+
+    @override_settings(PDF_ASYNC_DOWNLOADS=True)
+    def test_async_download_serves_cached_file(self):
+        self.invoice.refresh_from_db()
+        report = InvoicePDF(invoice=self.invoice)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            pdf_cache.set(report.get_cache_namespace(), report.get_cache_key(), b"pdf")
+            request = self.factory.get("/")
+            request.user = self.user
+            response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"pdf")
+
+    @override_settings(
+        PDF_ASYNC_DOWNLOADS=True,
+        PDF_RENDERER="proma.invoices.tests.test_views.StaticRenderer",
+    )
+    def test_async_download_renders_in_background(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            request = self.factory.get("/")
+            request.user = self.user
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.view(request, id=self.invoice.id)
+            self.invoice.refresh_from_db()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(
+                response["location"],
+                reverse(
+                    "invoices:invoice-download-pdf-status",
+                    kwargs={"id": self.invoice.id},
+                ),
+            )
+            self.assertIn("no-cache", response["cache-control"])
+            self.assertTrue(InvoicePDF(invoice=self.invoice).is_stored())
+        # the next change of the invoice can be rendered again
+        self.assertFalse(
+            coalesce.is_pending("invoices.render_invoice_pdf", self.invoice.id)
+        )
+
+    @override_settings(PDF_ASYNC_DOWNLOADS=True)
+    def test_async_download_doesnt_enqueue_a_pending_render(self):
+        coalesce.acquire("invoices.render_invoice_pdf", self.invoice.id)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            request = self.factory.get("/")
+            request.user = self.user
+            response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class InvoiceDownloadPDFStatusViewTestCase(TestCase):
+    def setUp(self):
+        self.view = views.InvoiceDownloadPDFStatusView.as_view()
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
+
+    def test_match_expected_view(self):
+        url = resolve("/invoices/1/download-pdf/status/")
+        self.assertEqual(url.func.__name__, self.view.__name__)
+
+    def test_not_ready(self):
+        request = self.factory.get("/")
+        request.user = self.user
+        response = self.view(request, id=self.invoice.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                "ready": False,
+                "url": reverse(
+                    "invoices:invoice-download-pdf", kwargs={"id": self.invoice.id}
+                ),
+            },
+        )
+
+    def test_ready(self):
+        self.invoice.refresh_from_db()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            self.invoice.save_pdf(
+                b"pdf", InvoicePDF(invoice=self.invoice).get_cache_key()
+            )
+            request = self.factory.get("/")
+            request.user = self.user
+            response = self.view(request, id=self.invoice.id)
+        self.assertTrue(json.loads(response.content)["ready"])
+
+    def test_raise_404_when_the_invoice_is_a_draft(self):
+        request = self.factory.get("/")
+        request.user = self.user
+        self.invoice.status = Invoice.DRAFT
+        self.invoice.save()
+        with self.assertRaises(Http404):
+            self.view(request, id=self.invoice.id)
+
+
+class InvoiceExportPDFViewTestCase(TestCase):
+    def setUp(self):
+        self.view = views.InvoiceExportPDFView.as_view()
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, PDF_EXPORT_WORKERS=0
+        )
+        self.settings_override.enable()
+        self.invoices = mixer.cycle(3).blend("invoices.Invoice", status=Invoice.OPEN)
+        mixer.blend("invoices.Invoice", status=Invoice.DRAFT)
+        for invoice in self.invoices:
+            invoice.refresh_from_db()
+            report = InvoicePDF(invoice=invoice)
+            pdf_cache.set(report.get_cache_namespace(), report.get_cache_key(), b"pdf")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def get_zip(self, response):
+        content = b"".join(response.streaming_content)
+        return zipfile.ZipFile(io.BytesIO(content))
+
+    def test_match_expected_view(self):
+        url = resolve("/invoices/export-pdf/")
+        self.assertEqual(url.func.__name__, self.view.__name__)
+
+    def test_load_sucessful(self):
+        request = self.factory.get("/")
+        request.user = self.user
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["content-type"], "application/zip")
+        names = sorted(f"{invoice.number}.pdf" for invoice in self.invoices)
+        self.assertEqual(sorted(self.get_zip(response).namelist()), names)
+
+    def test_apply_filters(self):
+        invoice = self.invoices[0]
+        request = self.factory.get("/", {"number": invoice.number})
+        request.user = self.user
+        response = self.view(request)
+        archive = self.get_zip(response)
+        self.assertEqual(archive.namelist(), [f"{invoice.number}.pdf"])
+        self.assertEqual(archive.read(f"{invoice.number}.pdf"), b"pdf")
+
+    def test_report_invoices_that_could_not_be_rendered(self):
+        invoice = self.invoices[0]
+        pdf_cache.invalidate(invoice.pdf_cache_namespace)
+        request = self.factory.get("/")
+        request.user = self.user
+        with override_settings(
+            PDF_RENDERER="proma.invoices.tests.test_views.FailingRenderer"
+        ):
+            response = self.view(request)
+            archive = self.get_zip(response)
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertIn(str(invoice.id).encode(), archive.read("errors.txt"))
+
+
+class ProcessRenderer:
+    def __init__(self):
+        self.pid = os.getpid()
+
+    def render(self, content, options):
+        # the process that loaded the renderer and the one rendering
+        return f"{self.pid}:{os.getpid()}".encode()
+
+
+@override_settings(
+    PDF_RENDERER="proma.invoices.tests.test_views.ProcessRenderer",
+    PDF_CACHE_ENABLED=False,
+)
+class InvoiceExportPDFInProcessesTestCase(TransactionTestCase):
+    # the forked processes of the default PDF_EXPORT_WORKERS only see the
+    # committed invoices
+
+    def setUp(self):
+        self.view = views.InvoiceExportPDFView.as_view()
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.invoices = mixer.cycle(3).blend("invoices.Invoice", status=Invoice.OPEN)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_render_in_processes(self):
+        # the renderer of this process isn't shared with the forked ones
+        get_renderer()
+        request = self.factory.get("/")
+        request.user = self.user
+        response = self.view(request)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        names = sorted(f"{invoice.number}.pdf" for invoice in self.invoices)
+        self.assertEqual(sorted(archive.namelist()), names)
+        for name in names:
+            loaded_in, rendered_in = archive.read(name).decode().split(":")
+            self.assertEqual(loaded_in, rendered_in)
+            self.assertNotEqual(rendered_in, str(os.getpid()))
+        # the connection of this process is still usable
+        self.assertEqual(Invoice.objects.count(), 3)
+
+
+class InvoiceAgingViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.client_ = mixer.blend("clients.Client", name="ACME")
+        today = timezone.now().date()
+        for days in (0, 45):
+            mixer.blend(
+                "invoices.Invoice",
+                client=self.client_,
+                currency=Currency.USD.name,
+                due_date=today - timedelta(days=days),
+                status=Invoice.OPEN,
+                total=Decimal(10),
+            )
+
+    def get(self, view_class):
+        request = self.factory.get("/")
+        request.user = self.user
+        return view_class.as_view()(request)
+
+    def test_match_expected_views(self):
+        for url, view_class in [
+            ("/invoices/aging/", views.InvoiceAgingView),
+            ("/invoices/aging/json/", views.InvoiceAgingJSONView),
+            ("/invoices/aging/csv/", views.InvoiceAgingCSVView),
+        ]:
+            self.assertEqual(resolve(url).func.__name__, view_class.as_view().__name__)
+
+    def test_load_sucessful(self):
+        response = self.get(views.InvoiceAgingView)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.context_data["report"]["rows"]
+        self.assertEqual(row["client_name"], "ACME")
+        self.assertEqual(row["outstanding"], Decimal(20))
+
+    def test_json(self):
+        response = self.get(views.InvoiceAgingJSONView)
+        data = json.loads(response.content)
+        self.assertEqual(data["rows"][0]["client"], self.client_.id)
+        self.assertEqual(Decimal(data["rows"][0]["days_31_60"]), Decimal(10))
+        self.assertEqual(Decimal(data["totals"][0]["current"]), Decimal(10))
+
+    def test_csv(self):
+        response = self.get(views.InvoiceAgingCSVView)
+        self.assertEqual(response["content-type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        client_name, currency, outstanding, *_ = lines[1].split(",")
+        self.assertEqual((client_name, currency), ("ACME", "USD"))
+        self.assertEqual(Decimal(outstanding), Decimal(20))
+        self.assertTrue(lines[2].startswith("Total,USD,"))
+
+    def test_report_is_cached(self):
+        self.get(views.InvoiceAgingView)
+        with self.assertNumQueries(0):
+            self.get(views.InvoiceAgingJSONView)
+
+
+class InvoiceRevenueViewTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.client_ = mixer.blend("clients.Client", name="ACME")
+        self.today = timezone.now().date()
+        for client in (self.client_, mixer.blend("clients.Client")):
+            mixer.blend(
+                "invoices.Invoice",
+                client=client,
+                currency=Currency.USD.name,
+                status=Invoice.PAID,
+                payment_date=self.today,
+                total=Decimal(10),
+            )
+
+    def get(self, view_class, data=None):
+        request = self.factory.get("/", data)
+        request.user = self.user
+        return view_class.as_view()(request)
+
+    def test_match_expected_views(self):
+        for url, view_class in [
+            ("/invoices/revenue/", views.InvoiceRevenueView),
+            ("/invoices/revenue/json/", views.InvoiceRevenueJSONView),
+        ]:
+            self.assertEqual(resolve(url).func.__name__, view_class.as_view().__name__)
+
+    def test_load_sucessful(self):
+        response = self.get(views.InvoiceRevenueView)
+        self.assertEqual(response.status_code, 200)
+        report = response.context_data["report"]
+        self.assertEqual(
+            report["start"], self.today.replace(day=1) - relativedelta(months=11)
+        )
+        self.assertEqual(len(report["rows"]), 2)
+        [total] = report["totals"]
+        self.assertEqual(total["amount"], Decimal(20))
+
+    def test_json(self):
+        month = self.today.strftime("%Y-%m")
+        response = self.get(
+            views.InvoiceRevenueJSONView, {"start": month, "client": self.client_.id}
+        )
+        data = json.loads(response.content)
+        [row] = data["rows"]
+        self.assertEqual(row["client_name"], "ACME")
+        self.assertEqual(row["month"], self.today.replace(day=1).isoformat())
+        self.assertEqual(Decimal(row["amount"]), Decimal(10))
+
+    def test_invalid_filters(self):
+        response = self.get(views.InvoiceRevenueJSONView, {"start": "last year"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("start", json.loads(response.content)["errors"])
+
+
+class FailingRenderer:
+    def render(self, content, options):
+        raise OSError("wkhtmltopdf is not available")
+
+
+class StaticRenderer:
+    def render(self, content, options):
+        return b"pdf"
+
 
 class InvoiceResendEmailViewTestCase(TestCase):
     def setUp(self):
         self.view = views.InvoiceResendEmailView.as_view()
         self.factory = RequestFactory()
+        # the notifications sent by other tests are coalesced in the cache
+        cache.clear()
         self.user = mixer.blend("users.User")
         self.invoice = mixer.blend("invoices.Invoice", status=Invoice.OPEN)
 
@@ -385,7 +855,8 @@ class InvoiceResendEmailViewTestCase(TestCase):
         request.session = {}
         request._messages = FallbackStorage(request)
         self.assertEqual(len(mail.outbox), 0)
-        response = self.view(request, id=self.invoice.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.view(request, id=self.invoice.id)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(response.status_code, 302)
         redirect_url = reverse(
@@ -8,6 +8,35 @@ app_name = "invoices"
 urlpatterns = [
     path("invoices/", views.InvoiceListView.as_view(), name="invoice-list"),
     path("invoices/create/", views.InvoiceCreateView.as_view(), name="invoice-create"),
+    path(
+        "invoices/action/",
+        views.InvoiceBulkActionView.as_view(),
+        name="invoice-bulk-action",
+    ),
+    path(
+        "invoices/export-pdf/",
+        views.InvoiceExportPDFView.as_view(),
+        name="invoice-export-pdf",
+    ),
+    path("invoices/aging/", views.InvoiceAgingView.as_view(), name="invoice-aging"),
+    path(
+        "invoices/aging/json/",
+        views.InvoiceAgingJSONView.as_view(),
+        name="invoice-aging-json",
+    ),
+    path(
+        "invoices/aging/csv/",
+        views.InvoiceAgingCSVView.as_view(),
+        name="invoice-aging-csv",
+    ),
+    path(
+        "invoices/revenue/", views.InvoiceRevenueView.as_view(), name="invoice-revenue"
+    ),
+    path(
+        "invoices/revenue/json/",
+        views.InvoiceRevenueJSONView.as_view(),
+        name="invoice-revenue-json",
+    ),
     path(
         "invoices/<int:id>/", views.InvoiceDetailView.as_view(), name="invoice-detail"
     ),
@@ -36,11 +65,21 @@ urlpatterns = [
         views.InvoicePublicDetailView.as_view(),
         name="invoice-public-detail",
     ),
+    path(
+        "invoices/<str:token>/pdf/",
+        views.InvoicePublicDownloadPDFView.as_view(),
+        name="invoice-public-download-pdf",
+    ),
     path(
         "invoices/<int:id>/download-pdf/",
         views.InvoiceDownloadPDFView.as_view(),
         name="invoice-download-pdf",
     ),
+    path(
+        "invoices/<int:id>/download-pdf/status/",
+        views.InvoiceDownloadPDFStatusView.as_view(),
+        name="invoice-download-pdf-status",
+    ),
     path(
         "invoices/<int:id>/resend-email/",
         views.InvoiceResendEmailView.as_view(),
@@ -1,26 +1,39 @@
+from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
-from django.shortcuts import get_object_or_404, redirect
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.cache import add_never_cache_headers
 from django.utils.translation import ugettext as _
 from django.views.generic import (
     CreateView,
     DetailView,
     RedirectView,
+    TemplateView,
     UpdateView,
     DeleteView,
+    View,
 )
 from django_filters.views import FilterView
 
-from proma.common.utils import PDFView
+from proma.common import outbox
+from proma.common.utils import PDFView, stream_csv, stream_zip
 
-from . import filters, tasks
+from . import aging, filters, revenue, tasks
 from .exceptions import InvoiceException
-from .forms import InvoiceForm, ItemsFormset, PayInvoiceForm
+from .forms import (
+    InvoiceBulkActionForm,
+    InvoiceForm,
+    ItemsFormset,
+    PayInvoiceForm,
+    RevenueReportForm,
+)
 from .models import Invoice
-from .reports import InvoicePDF
+from .reports import InvoicePDF, iter_invoice_pdfs
 
 
 class InvoiceCreateView(LoginRequiredMixin, CreateView):
@@ -112,12 +125,32 @@ class InvoiceListView(LoginRequiredMixin, FilterView):
     paginate_by = settings.PAGINATION_DEFAULT_PAGE_SIZE
     context_object_name = "invoices"
     filterset_class = filters.InvoiceFilter
+    ordering = ("number",)
 
     def get_queryset(self):
         qs = super().get_queryset()
         qs = qs.select_related("client")
         return qs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({"bulk_action_form": InvoiceBulkActionForm()})
+        return context
+
+
+class InvoiceBulkActionView(LoginRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        form = InvoiceBulkActionForm(request.POST)
+        if form.is_valid():
+            try:
+                ids = form.process()
+                messages.success(request, _("%d invoices updated") % len(ids))
+            except InvoiceException as ex:
+                messages.error(request, str(ex))
+        else:
+            messages.warning(request, _("The action failed, try again"))
+        return redirect("invoices:invoice-list")
+
 
 class InvoiceDetailView(LoginRequiredMixin, DetailView):
 
@@ -128,6 +161,11 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
 
 
 class InvoiceDownloadPDFView(LoginRequiredMixin, PDFView):
+    """
+    With PDF_ASYNC_DOWNLOADS the documents that are not cached are rendered
+    in celery, a 202 page polls the status view and downloads the file again
+    once it's stored
+    """
 
     report_class = InvoicePDF
 
@@ -140,6 +178,162 @@ class InvoiceDownloadPDFView(LoginRequiredMixin, PDFView):
     def get_report_kwargs(self):
         return {"invoice": self.invoice}
 
+    def get_content(self, report):
+        if not settings.PDF_ASYNC_DOWNLOADS:
+            return super().get_content(report)
+        content = report.get_cached()
+        if content is None:
+            tasks.enqueue_invoice_pdf(self.invoice.id)
+        return content
+
+    def get_pending_response(self, report):
+        status_url = reverse(
+            "invoices:invoice-download-pdf-status", kwargs={"id": self.invoice.id}
+        )
+        response = render(
+            self.request,
+            "invoices/invoice_pdf_pending.html",
+            {
+                "invoice": self.invoice,
+                "status_url": status_url,
+                "poll_interval": settings.PDF_ASYNC_POLL_INTERVAL,
+            },
+            status=202,
+        )
+        response["Location"] = status_url
+        response["Retry-After"] = settings.PDF_ASYNC_POLL_INTERVAL
+        add_never_cache_headers(response)
+        return response
+
+
+class InvoiceDownloadPDFStatusView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        invoice = get_object_or_404(
+            Invoice.objects.select_related("client"),
+            ~Q(status=Invoice.DRAFT),
+            id=kwargs.get("id"),
+        )
+        response = JsonResponse(
+            {
+                "ready": InvoicePDF(invoice=invoice).is_stored(),
+                "url": reverse(
+                    "invoices:invoice-download-pdf", kwargs={"id": invoice.id}
+                ),
+            }
+        )
+        add_never_cache_headers(response)
+        return response
+
+
+class InvoiceExportPDFView(LoginRequiredMixin, View):
+    """
+    Download the PDF files of the invoices matched by the list filters in a
+    zip file, the file is streamed while the invoices are rendered
+    """
+
+    def get(self, request, *args, **kwargs):
+        invoice_filter = filters.InvoiceFilter(
+            request.GET, queryset=Invoice.objects.non_draft().order_by("number")
+        )
+        pdfs = iter_invoice_pdfs(invoice_filter.qs, workers=settings.PDF_EXPORT_WORKERS)
+        response = StreamingHttpResponse(
+            stream_zip(pdfs), content_type="application/zip"
+        )
+        response["Content-Disposition"] = "attachment; filename=invoices.zip"
+        return response
+
+
+class InvoiceAgingView(LoginRequiredMixin, TemplateView):
+
+    template_name = "invoices/invoice_aging.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({"report": aging.get_report()})
+        return context
+
+
+class InvoiceAgingJSONView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(aging.get_report())
+
+
+class InvoiceAgingCSVView(LoginRequiredMixin, View):
+    """
+    Download the aging report as a CSV file, the lines are streamed
+    """
+
+    def get(self, request, *args, **kwargs):
+        report = aging.get_report()
+        response = StreamingHttpResponse(
+            stream_csv(self.get_rows(report)), content_type="text/csv"
+        )
+        filename = f"aging-{report['date'].isoformat()}.csv"
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    def get_rows(self, report):
+        names = ["outstanding", *aging.BUCKETS]
+        yield [
+            _("Client"),
+            _("Currency"),
+            _("Total"),
+            *[aging.LABELS[bucket] for bucket in aging.BUCKETS],
+        ]
+        for row in report["rows"]:
+            yield [row["client_name"], row["currency"], *[row[name] for name in names]]
+        for total in report["totals"]:
+            yield [_("Total"), total["currency"], *[total[name] for name in names]]
+
+
+class InvoiceRevenueMixin:
+    """
+    Revenue by month of the paid invoices, the last `months` months by
+    default and filtered by the RevenueReportForm
+    """
+
+    months = 12
+
+    def get_report(self):
+        form = RevenueReportForm(self.request.GET or None)
+        start = end = None
+        filters = {}
+        if form.is_valid():
+            start = form.cleaned_data["start"]
+            end = form.cleaned_data["end"]
+            filters = form.get_filters()
+        end = end or timezone.now().date()
+        start = start or revenue.get_month(end) - relativedelta(months=self.months - 1)
+        rows = revenue.get_series(start, end, **filters)
+        return (
+            form,
+            {
+                "start": start,
+                "end": end,
+                "rows": rows,
+                "totals": revenue.get_month_totals(rows),
+            },
+        )
+
+
+class InvoiceRevenueView(LoginRequiredMixin, InvoiceRevenueMixin, TemplateView):
+
+    template_name = "invoices/invoice_revenue.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form, report = self.get_report()
+        context.update({"form": form, "report": report})
+        return context
+
+
+class InvoiceRevenueJSONView(LoginRequiredMixin, InvoiceRevenueMixin, View):
+    def get(self, request, *args, **kwargs):
+        form, report = self.get_report()
+        if form.errors:
+            return JsonResponse({"errors": form.errors}, status=400)
+        return JsonResponse(report)
+
 
 class InvoiceActionView(LoginRequiredMixin, RedirectView):
     def dispatch(self, request, *args, **kwargs):
@@ -152,7 +346,8 @@ class InvoiceActionView(LoginRequiredMixin, RedirectView):
             try:
                 self.invoice.open()
                 self.invoice.save()
-                tasks.notify_open_invoice.delay(self.invoice.id)
+                # the email is sent once the PDF file is ready
+                tasks.send_open_invoice_notification(self.invoice.id)
                 messages.success(self.request, _("Invoice opened!"))
             except InvoiceException as ex:
                 messages.error(self.request, str(ex))
@@ -160,6 +355,7 @@ class InvoiceActionView(LoginRequiredMixin, RedirectView):
             try:
                 self.invoice.cancel()
                 self.invoice.save()
+                outbox.enqueue(tasks.render_invoice_pdf.si(self.invoice.id))
                 messages.success(self.request, _("Invoice canceled!"))
             except InvoiceException as ex:
                 messages.error(self.request, str(ex))
@@ -182,7 +378,9 @@ class InvoiceActionPayView(LoginRequiredMixin, UpdateView):
         invoice = form.save()
         invoice.pay(notes=form.cleaned_data["payment_notes"])
         messages.success(self.request, _("Invoice Paid!"))
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        outbox.enqueue(tasks.render_invoice_pdf.si(invoice.id))
+        return response
 
     def get_success_url(self, **kwargs):
         return reverse("invoices:invoice-detail", kwargs={"id": self.object.id})
@@ -200,6 +398,20 @@ class InvoicePublicDetailView(DetailView):
         )
 
 
+class InvoicePublicDownloadPDFView(PDFView):
+
+    report_class = InvoicePDF
+
+    def dispatch(self, request, *args, **kwargs):
+        self.invoice = get_object_or_404(
+            Invoice, token=kwargs.get("token"), status=Invoice.OPEN
+        )
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_report_kwargs(self):
+        return {"invoice": self.invoice}
+
+
 class InvoiceResendEmailView(LoginRequiredMixin, RedirectView):
     def dispatch(self, request, *args, **kwargs):
         self.invoice = get_object_or_404(
@@ -208,6 +420,8 @@ class InvoiceResendEmailView(LoginRequiredMixin, RedirectView):
         return super().dispatch(request, *args, **kwargs)
 
     def get_redirect_url(self, **kwargs):
-        tasks.notify_open_invoice.delay(self.invoice.id)
-        messages.success(self.request, _("Email sent!"))
+        if tasks.send_open_invoice_notification(self.invoice.id):
+            messages.success(self.request, _("Email sent!"))
+        else:
+            messages.info(self.request, _("The email was sent a moment ago"))
         return reverse("invoices:invoice-detail", kwargs={"id": self.invoice.id})
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.19 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_timesheet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['project', 'name'], name='expense_project_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['-created'], name='timesheet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created'], name='timesheet_active_idx'),
+        ),
+    ]
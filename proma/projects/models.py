@@ -86,6 +86,10 @@ class Expense(TimeStampedModel):
         verbose_name_plural = _("Expenses")
         default_related_name = "expenses"
         ordering = ("name",)
+        indexes = [
+            # expenses of a project, in the default ordering
+            models.Index(fields=["project", "name"], name="expense_project_name_idx")
+        ]
 
     def __str__(self):
         return self.name
@@ -107,6 +111,15 @@ class Timesheet(TimeStampedModel):
         verbose_name_plural = _("Timesheets")
         default_related_name = "timesheets"
         ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["-created"], name="timesheet_created_idx"),
+            # active timesheet of the navbar, checked on every page
+            models.Index(
+                fields=["-created"],
+                name="timesheet_active_idx",
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return self.label
@@ -0,0 +1,44 @@
+from django.test import RequestFactory, TestCase
+from mixer.backend.django import mixer
+
+from proma.common.tests.plans import QueryPlanMixin
+
+from .. import views
+from ..models import Expense, Timesheet
+
+
+class ProjectQueryPlanTestCase(QueryPlanMixin, TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = mixer.blend("users.User")
+        self.project = mixer.blend("projects.Project")
+        mixer.cycle(10).blend("projects.Expense", project=self.project)
+        mixer.cycle(10).blend("projects.Expense")
+        mixer.cycle(20).blend("projects.Timesheet", is_active=False)
+        mixer.blend("projects.Timesheet", is_active=True)
+
+    def get_view(self, view_class, path="/", **kwargs):
+        request = self.factory.get(path)
+        request.user = self.user
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view
+
+    def test_active_timesheet(self):
+        # the query of the current_timesheet_data context processor
+        timesheets = Timesheet.objects.filter(is_active=True).order_by("-created")
+        self.assertUsesIndex(timesheets[:1])
+
+    def test_timesheet_list(self):
+        view = self.get_view(views.TimesheetListView)
+        self.assertUsesIndex(view.get_queryset())
+
+    def test_project_expenses(self):
+        view = self.get_view(views.ProjectDetailView, id=self.project.id)
+        view.object = view.get_object()
+        self.assertUsesIndex(view.get_context_data()["expenses"])
+
+    def test_expense_list_by_project(self):
+        view = self.get_view(views.ExpenseListView, f"/?project={self.project.id}")
+        filterset = view.get_filterset(view.get_filterset_class())
+        self.assertUsesIndex(filterset.qs, Expense._meta.db_table)
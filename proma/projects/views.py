@@ -99,6 +99,16 @@ class ProjectDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "project"
     pk_url_kwarg = "id"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            {
+                "expenses": self.object.expenses.all(),
+                "invoices": self.object.invoices.non_draft().order_by("number"),
+            }
+        )
+        return context
+
 
 class ExpenseCreateView(LoginRequiredMixin, CreateView):
 
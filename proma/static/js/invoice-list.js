@@ -0,0 +1,42 @@
+$(document).ready(function () {
+  $("#checkbox-toggle-all").on("change", function () {
+    $(".invoice-checkbox").prop("checked", $(this).is(":checked")).trigger("change");
+  });
+
+  $(".invoice-checkbox").on("change", function () {
+    setupInvoiceData();
+  });
+
+  $("#btn-bulk-action").on("click", function () {
+    setupInvoiceData();
+    var $form = $("#form-bulk-action");
+    var data = $form.serializeArray().reduce(function (object, item) {
+      object[item.name] = item.value;
+      return object;
+    }, {});
+    var errors = [];
+    if (!data.action) {
+      errors.push("Select an action to continue");
+    }
+    if (!data.invoices) {
+      errors.push("Select at least 1 invoice");
+    }
+    if (data.action === "pay" && !data.payment_notes) {
+      errors.push("Add the payment notes to pay the invoices");
+    }
+    if (errors.length) {
+      alert(errors.join("\n"));
+      return;
+    }
+    $form.submit();
+  });
+
+  function setupInvoiceData () {
+    var ids = [];
+    $(".invoice-checkbox:checked").each(function (index, checkbox) {
+      ids.push($(checkbox).data("invoice-id"));
+    });
+    $("#invoices-quantity").text(ids.length);
+    $("#id_invoices").val(ids.join(","));
+  }
+});